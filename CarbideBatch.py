@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+'''
+CarbideBatch - converts whole directory trees of beta 285 drawings to
+beta 286, spreading the files over a process pool.
+
+    python CarbideBatch.py OLD_DRAWINGS NEW_DRAWINGS -j 8
+
+Each output is written to a temporary file beside its target and moved
+into place, so an interrupted run never leaves a half-written drawing.
+Files whose output is newer than the source are skipped; with --hash
+the source's SHA-1 recorded in the output tree's manifest must match as
+well.  Drawings that are already beta 286 are copied across unchanged.
+With --reproducible the new uuids are seeded from the source's SHA-1,
+so converting the same drawing again gives a byte-identical file.
+
+    python CarbideBatch.py DRAWINGS --estimate
+
+instead prints the estimated machining time of every drawing in a tree.
+'''
+
+import os
+import sys
+import time
+import json
+import shutil
+import hashlib
+import tempfile
+import argparse
+import concurrent.futures
+
+import CarbideClass as CC
+
+MANIFEST = '.c2dbatch.json'
+
+def file_hash(filename):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def find_drawings(src, pattern='.c2d'):
+    rslt = []
+    for root, dirs, files in os.walk(src):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(pattern): rslt.append(os.path.join(root, name))  #
+    return rslt
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+def atomic_save(cnc, filename):
+    folder = os.path.dirname(filename) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, tmpname = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fout:
+            cnc.write(fout)
+        os.chmod(tmpname, 0o666 & ~_umask())  # mkstemp makes it private
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+def atomic_copy(source, filename):
+    folder = os.path.dirname(filename) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, tmpname = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    os.close(fd)
+    try:
+        shutil.copy2(source, tmpname)
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+def convert_file(source, target, reproducible=False):
+    # worker: returns a report dict, never raises.  With reproducible the
+    # source hash seeds the new uuids and is returned as 'hash'.
+    start = time.perf_counter()
+    rslt = {'source': source, 'target': target, 'status': 'converted',
+            'beta': None, 'seconds': 0.0, 'error': None, 'hash': None}
+    try:
+        rslt['beta'] = beta = CC.sniff_beta(source)   # no need to load 286s
+        if beta == CC.EARLY_BETA:
+            cnc = CC.CNC()
+            if not cnc.load(source): raise IOError('unreadable drawing')  #
+            cnc.fixbeta()
+            if reproducible: rslt['hash'] = file_hash(source)  #
+            atomic_save(CC.convert_285to286(cnc, rslt['hash']), target)
+        elif beta == CC.CURR_BETA:
+            atomic_copy(source, target)
+            rslt['status'] = 'copied'
+        else:
+            raise ValueError('unrecognised format (beta %s)' % beta)
+    except Exception as err:
+        rslt['status'] = 'failed'
+        rslt['error'] = '%s: %s' % (type(err).__name__, err)
+    rslt['seconds'] = time.perf_counter() - start
+    return rslt
+
+def _load_manifest(dst):
+    try:
+        with open(os.path.join(dst, MANIFEST), 'r') as fin:
+            return json.load(fin)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(dst, manifest):
+    tmpname = os.path.join(dst, MANIFEST + '.tmp')
+    with open(tmpname, 'w') as fout:
+        json.dump(manifest, fout, indent=1, sort_keys=True)
+    os.replace(tmpname, os.path.join(dst, MANIFEST))
+
+def convert_tree(src, dst, workers=None, force=False, check_hash=False,
+                 progress=None, reproducible=False):
+    # converts every .c2d under src into the same place under dst and
+    # returns one report dict per file, in source order
+    src = os.path.realpath(src)
+    dst = os.path.realpath(dst)
+    try:
+        inside = os.path.commonpath([os.path.normcase(src), os.path.normcase(dst)]) == \
+                 os.path.normcase(src)
+    except ValueError:                  # different drives
+        inside = False
+    if inside: raise ValueError('Output tree must not be the source or inside it')  #
+
+    manifest = _load_manifest(dst)
+    jobs = []
+    reports = {}
+    hashes = {}
+    for source in find_drawings(src):
+        rel = os.path.relpath(source, src)
+        target = os.path.join(dst, rel)
+        skip = False
+        if not force and os.path.exists(target):
+            skip = os.path.getmtime(target) >= os.path.getmtime(source)
+            if skip and check_hash:
+                hashes[rel] = file_hash(source)
+                skip = manifest.get(rel) == hashes[rel]
+        if skip:
+            reports[source] = {'source': source, 'target': target,
+                               'status': 'skipped', 'beta': None,
+                               'seconds': 0.0, 'error': None, 'hash': None}
+            if progress is not None: progress(reports[source])  #
+        else:
+            jobs.append((source, target, rel))
+
+    if len(jobs) > 0:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = {}
+            for source, target, rel in jobs:
+                futures[pool.submit(convert_file, source, target,
+                                    reproducible)] = rel
+            for future in concurrent.futures.as_completed(futures):
+                report = future.result()
+                reports[report['source']] = report
+                rel = futures[future]
+                if report['status'] != 'failed':
+                    if report['hash'] is not None: hashes[rel] = report['hash']  #
+                    if rel not in hashes: hashes[rel] = file_hash(report['source'])  #
+                    manifest[rel] = hashes[rel]
+                if progress is not None: progress(report)  #
+        os.makedirs(dst, exist_ok=True)
+        _save_manifest(dst, manifest)
+
+    return [reports[source] for source in sorted(reports)]
+
+def estimate_file(source, rapid=CC.RAPID_RATE):
+    # worker: returns a report dict with the drawing's machining_time()
+    # totals and per-toolpath entries, never raises
+    start = time.perf_counter()
+    rslt = {'source': source, 'status': 'estimated', 'beta': None,
+            'length': 0.0, 'minutes': 0.0, 'toolpaths': [],
+            'seconds': 0.0, 'error': None}
+    try:
+        cnc = CC.CNC()
+        if not cnc.load(source): raise IOError('unreadable drawing')  #
+        rslt['beta'] = cnc.beta
+        rslt.update(cnc.machining_time(rapid))
+    except Exception as err:
+        rslt['status'] = 'failed'
+        rslt['error'] = '%s: %s' % (type(err).__name__, err)
+    rslt['seconds'] = time.perf_counter() - start
+    return rslt
+
+def estimate_tree(src, workers=None, rapid=CC.RAPID_RATE, progress=None):
+    # estimate_file for every .c2d under src, in source order
+    sources = find_drawings(os.path.abspath(src))
+    reports = {}
+    if len(sources) > 0:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(estimate_file, source, rapid)
+                       for source in sources]
+            for future in concurrent.futures.as_completed(futures):
+                report = future.result()
+                reports[report['source']] = report
+                if progress is not None: progress(report)  #
+    return [reports[source] for source in sources]
+
+def estimate_line(report):
+    if report['error'] is not None:
+        return 'failed    %s\n          %s' % (report['source'], report['error'])
+    return '%8.1f min %10.0f  %s' % (report['minutes'], report['length'],
+                                     report['source'])
+
+def report_line(report):
+    txt = '%-9s %7.3fs  %s' % (report['status'], report['seconds'],
+                               report['source'])
+    if report['error'] is not None: txt += '\n          %s' % report['error']  #
+    return txt
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert a tree of beta 285 Carbide Create drawings '
+                    'to beta 286.')
+    parser.add_argument('source', help='folder of drawings to convert')
+    parser.add_argument('target', nargs='?',
+                        help='folder to write converted drawings')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true',
+                        help='convert even when the output is up to date')
+    parser.add_argument('--hash', action='store_true',
+                        help='also compare source hashes before skipping')
+    parser.add_argument('--reproducible', action='store_true',
+                        help='derive new uuids from the source, not at random')
+    parser.add_argument('--estimate', action='store_true',
+                        help='print machining time estimates, convert nothing')
+    parser.add_argument('--rapid', type=float, default=CC.RAPID_RATE,
+                        help='rapid feed for --estimate (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.estimate:
+        reports = estimate_tree(args.source, args.jobs, args.rapid)
+        for report in reports:
+            print(estimate_line(report))
+        failed = sum(1 for report in reports if report['status'] == 'failed')
+        print('%d drawings, %.1f minutes in total, %d failed (%.2fs)' %
+              (len(reports), sum(report['minutes'] for report in reports),
+               failed, time.perf_counter() - start))
+        return 1 if failed > 0 else 0
+    if args.target is None: parser.error('a target folder is needed to convert')  #
+    
+    reports = convert_tree(args.source, args.target, args.jobs, args.force,
+                           args.hash, lambda rpt: print(report_line(rpt)),
+                           args.reproducible)
+    counts = {}
+    for report in reports:
+        counts[report['status']] = counts.get(report['status'], 0) + 1
+    summary = ', '.join('%d %s' % (counts[key], key) for key in sorted(counts))
+    print('%d drawings in %.2fs: %s' % (len(reports),
+                                        time.perf_counter() - start, summary))
+    return 1 if 'failed' in counts else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+'''
+CarbideBench - timings of the core CNC operations on synthetic drawings.
+
+    python CarbideBench.py --shapes 5000 --points 40 -o after.json
+    python CarbideBench.py --compare before.json after.json
+
+Drawings are grown from DinoStrip2.c2d: its curves are resampled to the
+requested number of points and its circles and toolpaths repeated, with
+rects, regular polygons and (beta 285) polygons mixed in, laid out on a
+grid.  The same seed always gives the same drawing.  Each operation is
+timed over several runs on fresh inputs and once more under tracemalloc
+for its peak memory; results are saved as JSON to compare versions.
+Some operations are also held to a bound against a simpler one timed in
+the same run (RATIO_BOUNDS), which --check turns into the exit status.
+'''
+
+import os
+import sys
+import gc
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import CarbideClass as CC
+import CarbideProfile
+
+SEED_DRAWING = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'DinoStrip2.c2d')
+PITCH = 60.0            # grid spacing of the synthetic shapes
+SPAN = 45.0             # largest size of a synthetic curve
+
+# --------------------------------------------------------------------
+# Synthetic drawings
+
+def _resample(line, count):
+    # count points evenly spaced along the closed polyline line
+    dists = [0.0]
+    for pnt in range(1, len(line)):
+        dists.append(dists[-1] + math.hypot(line[pnt][0] - line[pnt-1][0],
+                                            line[pnt][1] - line[pnt-1][1]))
+    total = dists[-1]
+    rslt = []
+    seg = 1
+    for pnt in range(count):
+        want = total * pnt / count
+        while seg < len(line) - 1 and dists[seg] < want: seg += 1  #
+        width = dists[seg] - dists[seg-1]
+        tt = 0.0 if width <= 0.0 else (want - dists[seg-1]) / width
+        rslt.append([line[seg-1][0] + tt * (line[seg][0] - line[seg-1][0]),
+                     line[seg-1][1] + tt * (line[seg][1] - line[seg-1][1])])
+    return rslt
+
+def _outlines(template):
+    # seed curve outlines, centred and scaled to fit within SPAN
+    rslt = []
+    for obj in template.getgroup(CC.CC_CURVES):
+        for line in CC.flatten_shape(CC.CC_CURVES, obj, 0.05):
+            if len(line) < 4: continue  #
+            xs = [pt[0] for pt in line]
+            ys = [pt[1] for pt in line]
+            cx, cy = (min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2
+            scale = SPAN / max(max(xs) - min(xs), max(ys) - min(ys), 1e-9)
+            line = [((xx - cx) * scale, (yy - cy) * scale) for xx, yy in line]
+            if line[0] != line[-1]: line.append(line[0])  #
+            rslt.append(line)
+    return rslt
+
+def _curve(line, count, ispoly, beta):
+    points = _resample(line, max(3, count))
+    size = len(points)
+    if ispoly:
+        cp1 = [list(pt) for pt in points]
+        cp2 = [list(pt) for pt in points]
+    else:                   # smooth Catmull-Rom style control points
+        cp1 = []
+        cp2 = []
+        for pnt in range(size):
+            prv, nxt = points[pnt-1], points[(pnt+1) % size]
+            dx, dy = (nxt[0] - prv[0]) / 6, (nxt[1] - prv[1]) / 6
+            cp1.append([points[pnt][0] - dx, points[pnt][1] - dy])
+            cp2.append([points[pnt][0] + dx, points[pnt][1] + dy])
+    obj = {'position': [0.0, 0.0]}
+    if CC.has_point_type(beta):
+        points.append(list(points[0]))
+        cp1.append(list(cp1[0]))
+        cp2.append(list(cp2[0]))
+        ptype = CC.PT_POLY if ispoly else CC.PT_CURVE
+        obj['point_type'] = [ptype] * size + [CC.PT_CLOSER]
+    else:
+        obj['closed'] = True
+    obj['points'] = points
+    obj['control_point_1'] = cp1
+    obj['control_point_2'] = cp2
+    return obj
+
+def make_drawing(shapes=1000, points=24, toolpaths=10, links=1,
+                 beta=CC.CURR_BETA, seed=0, template=SEED_DRAWING):
+    # A drawing of about shapes shapes and toolpaths toolpaths, each
+    # shape cut by links of them (fewer when there are fewer toolpaths).
+    rnd = random.Random(seed)
+    tmpl = CC.CNC(template)
+    lines = _outlines(tmpl)
+    radii = [obj['radius'] for obj in tmpl.getgroup(CC.CC_CIRCLES)] or [5.0]
+    paths = tmpl.getgroup(CC.CC_TOOLPATHS)
+
+    cols = max(1, math.ceil(math.sqrt(shapes)))
+    rows = max(1, math.ceil(shapes / cols))
+    cnc = CC.CNC(width=round(cols * PITCH), height=round(rows * PITCH),
+                 beta=beta)
+    intids = CC.id_is_int(beta)
+    nextid = 1
+    for pnt in range(shapes):
+        pick = rnd.random()
+        if pick < 0.5 or (pick >= 0.9 and not CC.has_polygons(beta)):
+            group = CC.CC_CURVES
+            obj = _curve(rnd.choice(lines), points, pick >= 0.9, beta)
+        elif pick < 0.7:
+            group = CC.CC_CIRCLES
+            obj = {'radius': rnd.choice(radii) * rnd.uniform(0.5, 2.0)}
+        elif pick < 0.8:
+            group = CC.CC_RECTS
+            obj = {'width': rnd.uniform(5.0, SPAN), 'height': rnd.uniform(5.0, SPAN),
+                   'rotation': rnd.choice((0.0, rnd.uniform(-180.0, 180.0)))}
+        elif pick < 0.9:
+            group = CC.CC_REGPOLYS
+            obj = {'num_sides': rnd.randint(3, 12), 'radius': rnd.uniform(3.0, SPAN / 2),
+                   'rotation': rnd.uniform(0.0, 90.0)}
+        else:
+            group = CC.CC_POLYGONS
+            obj = {'points': _resample(rnd.choice(lines), max(3, points)),
+                   'rotation': rnd.uniform(-180.0, 180.0)}
+        obj['id'] = nextid if intids else CC.newuuid()
+        nextid += 1
+        obj['position'] = [(pnt % cols + 0.5) * PITCH, (pnt // cols + 0.5) * PITCH]
+        cnc.content[group].append(obj)
+
+    made = []
+    for pnt in range(toolpaths if len(paths) > 0 else 0):
+        path = json.loads(json.dumps(paths[pnt % len(paths)]))
+        path['name'] = '%s %04d' % (path['name'], pnt + 1)
+        path['contours'] = []
+        if CC.has_uuid(beta):
+            path['uuid'] = CC.newuuid()
+        else:
+            path.pop('uuid', None)
+        made.append(path)
+    cnc.content[CC.CC_TOOLPATHS] = made
+
+    if len(made) > 0 and links > 0:
+        pathlinks = []
+        for group in cnc.cc_idgroups:
+            for obj in cnc.getgroup(group):
+                chosen = rnd.sample(made, min(links, len(made)))
+                if CC.has_contour(beta):
+                    for path in chosen:
+                        path['contours'].append(obj['id'])
+                else:
+                    pathlinks.append({'uuid': obj['id'],
+                                      'links': [path['uuid'] for path in chosen]})
+        if CC.CC_PATHLINKS in cnc.content: cnc.content[CC.CC_PATHLINKS] = pathlinks  #
+    cnc.nextid = nextid if intids else 1
+    cnc.reindex()                       # content was filled in directly
+    return cnc
+
+# --------------------------------------------------------------------
+# Timing
+
+# (operation, reference, largest ratio of their best times): the ratio
+# does not depend on the speed of the machine the suite runs on.
+RATIO_BOUNDS = (('curve_boxes', 'anchor_boxes', 5.0),
+                ('curve_boxes_np', 'anchor_boxes_np', 2.5),
+                ('toolpath_offsets', 'flatten_paths', 6.0))
+
+def anchor_boxes(curves):
+    # the extents loop CarbideClass started with: curve anchors only
+    rslt = []
+    for obj in curves:
+        ox, oy = obj['position']
+        xs = [ox + pt[0] for pt in obj['points']]
+        ys = [oy + pt[1] for pt in obj['points']]
+        rslt.append((min(xs), min(ys), max(xs), max(ys)))
+    return rslt
+
+def measure(func, setup=None, repeat=3, memory=True):
+    # best and mean seconds of func(setup()) over repeat runs, each on a
+    # fresh setup() outside the timing, then peak kB above the setup
+    times = []
+    for pnt in range(repeat):
+        arg = None if setup is None else setup()
+        gc.collect()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+        del arg
+    rslt = {'best': min(times), 'mean': sum(times) / len(times), 'runs': repeat}
+    if memory:
+        arg = None if setup is None else setup()
+        gc.collect()
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        func(arg)
+        rslt['peak_kb'] = (tracemalloc.get_traced_memory()[1] - base) / 1024
+        tracemalloc.stop()
+    return rslt
+
+def run_suite(shapes=1000, points=24, toolpaths=10, links=1, repeat=3,
+              edits=500, memory=True, seed=0, progress=None):
+    # times load, save, extents, mirror, convert_285to286, add_object,
+    # update_object, cold curve boxes and toolpath offsets, with the
+    # RATIO_BOUNDS references; returns the results dict that
+    # save_results writes
+    folder = tempfile.mkdtemp(prefix='c2dbench')
+    new = os.path.join(folder, 'bench286.c2d')
+    old = os.path.join(folder, 'bench285.c2d')
+    out = os.path.join(folder, 'saved.c2d')
+    make_drawing(shapes, points, toolpaths, links, CC.CURR_BETA, seed).save(new)
+    make_drawing(shapes, points, toolpaths, links, CC.EARLY_BETA, seed).save(old)
+
+    def loaded(): return CC.CNC(new)  #
+    def loaded285(): return CC.CNC(old, beta=CC.EARLY_BETA)  #
+    def curves(): return CC.CNC(new).getgroup(CC.CC_CURVES)  #
+    def curves_arrays(): return CC.CNC(new, arrays=True).getgroup(CC.CC_CURVES)  #
+
+    def path_shapes():
+        cnc = CC.CNC(new)
+        return [shape for path in cnc.getgroup(CC.CC_TOOLPATHS)
+                for shape in cnc.toolpath_shapes(path)]
+
+    def offsets(cnc):
+        for path in cnc.getgroup(CC.CC_TOOLPATHS):
+            cnc.toolpath_offsets(path)
+
+    def adds(cnc):
+        for pnt in range(edits):
+            cnc.add_object(CC.Circle([pnt, pnt], 2.0))
+
+    def updates(cnc):
+        circles = cnc.getgroup(CC.CC_CIRCLES)
+        for pnt in range(min(edits, len(circles))):
+            obj = CC.Circle(source=circles[pnt], radius=circles[pnt]['radius'] + 1)
+            obj.ccid = circles[pnt]['id']
+            cnc.update_object(obj)
+
+    ops = (('load', lambda arg: CC.CNC(new), None),
+           ('save', lambda cnc: cnc.save(out), loaded),
+           ('extents', lambda cnc: cnc.extents(), loaded),
+           ('mirror', lambda cnc: cnc.mirror(), loaded),
+           ('convert_285to286', CC.convert_285to286, loaded285),
+           ('add_object', adds, loaded),
+           ('update_object', updates, loaded),
+           ('anchor_boxes', anchor_boxes, curves),
+           ('curve_boxes', lambda objs: CC.bulk_extents(CC.CC_CURVES, objs), curves))
+    if CC.np is not None:
+        ops += (('anchor_boxes_np', anchor_boxes, curves_arrays),
+                ('curve_boxes_np', lambda objs: CC.bulk_extents(CC.CC_CURVES, objs),
+                 curves_arrays),
+                ('flatten_paths', lambda shapes: [CC.flatten_shape(group, obj)
+                                                  for group, obj in shapes], path_shapes),
+                ('toolpath_offsets', offsets, loaded))
+    results = {}
+    try:
+        for name, func, setup in ops:
+            results[name] = measure(func, setup, repeat, memory)
+            if progress is not None: progress(name, results[name])  #
+        sizes = {'bytes_286': os.path.getsize(new),
+                 'bytes_285': os.path.getsize(old)}
+    finally:
+        for name in (new, old, out):
+            if os.path.exists(name): os.unlink(name)  #
+        os.rmdir(folder)
+
+    return {'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': None if CC.np is None else CC.np.__version__,
+            'params': {'shapes': shapes, 'points': points,
+                       'toolpaths': toolpaths, 'links': links,
+                       'repeat': repeat, 'edits': edits, 'seed': seed},
+            'sizes': sizes,
+            'results': results}
+
+def save_results(results, filename):
+    with open(filename, 'w') as fout:
+        json.dump(results, fout, indent=2, sort_keys=True)
+
+def load_results(filename):
+    with open(filename, 'r') as fin:
+        return json.load(fin)
+
+def compare(before, after, threshold=1.10):
+    # lines comparing two results dicts; ratios over threshold are
+    # flagged as regressions
+    rslt = []
+    if before.get('params') != after.get('params'):
+        rslt.append('warning: runs used different parameters')
+    for name in after['results']:
+        new = after['results'][name]
+        old = before['results'].get(name)
+        if old is None:
+            rslt.append('%-18s %10.4fs  (new)' % (name, new['best']))
+            continue
+        ratio = new['best'] / old['best'] if old['best'] > 0 else float('inf')
+        flag = '  REGRESSION' if ratio > threshold else ''
+        rslt.append('%-18s %10.4fs -> %10.4fs  x%.2f%s' %
+                    (name, old['best'], new['best'], ratio, flag))
+    return rslt
+
+def check_ratios(results):
+    # lines for the RATIO_BOUNDS that results has both timings for;
+    # ratios over their bound are flagged
+    rslt = []
+    for name, ref, bound in RATIO_BOUNDS:
+        new = results['results'].get(name)
+        old = results['results'].get(ref)
+        if new is None or old is None: continue  #
+        ratio = new['best'] / old['best'] if old['best'] > 0 else float('inf')
+        flag = '  OVER' if ratio > bound else ''
+        rslt.append('%-18s x%.2f of %s (bound x%.2f)%s' % (name, ratio, ref, bound, flag))
+    return rslt
+
+def result_line(name, rslt):
+    txt = '%-18s best %9.4fs  mean %9.4fs' % (name, rslt['best'], rslt['mean'])
+    if 'peak_kb' in rslt: txt += '  peak %10.1f kB' % rslt['peak_kb']  #
+    return txt
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark CarbideClass on synthetic drawings.')
+    parser.add_argument('--shapes', type=int, default=1000)
+    parser.add_argument('--points', type=int, default=24,
+                        help='points per curve')
+    parser.add_argument('--toolpaths', type=int, default=10)
+    parser.add_argument('--links', type=int, default=1,
+                        help='toolpaths linked to each shape')
+    parser.add_argument('--edits', type=int, default=500,
+                        help='objects added/updated by the edit timings')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the tracemalloc runs')
+    parser.add_argument('-o', '--output', help='save the results as JSON')
+    parser.add_argument('--profile', metavar='TRACE',
+                        help='profile the run and save a Chrome trace')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two saved results and exit')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with 1 when a RATIO_BOUNDS ratio is over')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        lines = compare(load_results(args.compare[0]),
+                        load_results(args.compare[1]))
+        print('\n'.join(lines))
+        return 1 if any(line.endswith('REGRESSION') for line in lines) else 0
+
+    prof = CarbideProfile.enable_profiling(trace=True) if args.profile else None
+    try:
+        results = run_suite(args.shapes, args.points, args.toolpaths, args.links,
+                            args.repeat, args.edits, not args.no_memory, args.seed,
+                            lambda name, rslt: print(result_line(name, rslt)))
+    finally:
+        if prof is not None: CarbideProfile.disable_profiling(prof)  #
+    if prof is not None:
+        print(prof.report())
+        prof.save_trace(args.profile)
+    if args.output: save_results(results, args.output)  #
+    lines = check_ratios(results)
+    if lines: print('\n'.join(lines))  #
+    return 1 if args.check and any(line.endswith('OVER') for line in lines) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
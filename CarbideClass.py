@@ -9,8 +9,21 @@ May 10, 2016 - Added ability to convert beta 285 to beta 286
 
 import math
 import json
+import io
+import re
 import copy
+import os
 import uuid
+import struct
+import hashlib
+import itertools
+import threading
+import collections.abc
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 CURR_BETA = '286'
 EARLY_BETA = '285'
@@ -35,6 +48,8 @@ OFF_INSIDE = -1
 OFF_OUTSIDE = 1
 OFF_POCKET = 2
 
+RAPID_RATE = 5000.0     # assumed rapid feed, drawing units per minute
+
 def offset_label(val):
     if val == OFF_NONE:
         rslt = 'No Offset'
@@ -98,6 +113,118 @@ def has_uuid(beta=CURR_BETA):
 def has_point_type(beta=CURR_BETA):
     return beta >= '286'
 
+# Format detection.  Each known beta is registered with the evidence a
+# file of that beta shows; the evidence of a drawing is gathered in one
+# pass that stops reading each group once it has told all it can, and is
+# then checked against every registered beta (newest wins).  Evidence:
+#   polygons    a POLYGON_OBJECTS group is present
+#   links       a toolpath_links group is present (only required of betas
+#               that have it)
+#   contours    some toolpath lists contour ids (only ever True)
+#   closed      the first curve has a 'closed' flag
+#   point_type  the first curve has 'point_type'
+#   intids      the first shape id is an int
+# Missing evidence, say from a drawing without curves, rules nothing out.
+
+BETA_FORMATS = {}
+SHAPE_GROUPS = (CC_CIRCLES, CC_CURVES, CC_POLYGONS, CC_RECTS, CC_REGPOLYS,
+                CC_TEXTS)
+
+def register_beta(beta, **evidence):
+    # evidence defaults to what the has_* tests say of beta
+    global KNOWN_BETA
+    fmt = {'polygons': has_polygons(beta), 'contours': has_contour(beta),
+           'closed': has_closed_flag(beta), 'point_type': has_point_type(beta),
+           'intids': id_is_int(beta)}
+    if has_uuid(beta): fmt['links'] = True  #
+    fmt.update(evidence)
+    BETA_FORMATS[beta] = fmt
+    KNOWN_BETA = tuple(sorted(BETA_FORMATS))
+
+for _beta in KNOWN_BETA:
+    register_beta(_beta)
+
+def _wants(evidence, group):
+    # would more members of group add to the evidence?
+    if group == CC_TOOLPATHS: return 'contours' not in evidence  #
+    if group == CC_CURVES and 'closed' not in evidence: return True  #
+    return group in SHAPE_GROUPS and 'intids' not in evidence
+
+def _observe(evidence, group, obj):
+    if group == CC_TOOLPATHS:
+        if len(obj.get('contours', ())) > 0: evidence['contours'] = True  #
+        return
+    if group == CC_CURVES and 'closed' not in evidence:
+        evidence['closed'] = 'closed' in obj
+        evidence['point_type'] = 'point_type' in obj
+    if 'intids' not in evidence and 'id' in obj:
+        evidence['intids'] = type(obj['id']) is int
+
+def beta_evidence(content):
+    evidence = {'polygons': CC_POLYGONS in content,
+                'links': CC_PATHLINKS in content}
+    for path in content.get(CC_TOOLPATHS) or ():
+        if not _wants(evidence, CC_TOOLPATHS): break  #
+        _observe(evidence, CC_TOOLPATHS, path)
+    for group in SHAPE_GROUPS:
+        for obj in content.get(group) or ():
+            if not _wants(evidence, group): break  #
+            _observe(evidence, group, obj)
+    return evidence
+
+def allowed_betas(evidence):
+    # the registered betas the evidence allows, oldest first
+    return [beta for beta in KNOWN_BETA
+            if all(evidence.get(key, want) == want
+                   for key, want in BETA_FORMATS[beta].items())]
+
+def match_beta(evidence):
+    # the newest registered beta the evidence allows, or 'BAD'
+    allowed = allowed_betas(evidence)
+    return allowed[-1] if len(allowed) > 0 else 'BAD'
+
+def detect_beta(content):
+    return match_beta(beta_evidence(content))
+
+def sniff_beta(filename, limit=None):
+    # the beta of a .c2d file, decoding only the objects that give
+    # evidence and skipping the rest; with limit, only that many bytes
+    # are read and what is past them counts as unknown.  None when the
+    # bytes read leave more than one beta open.
+    evidence = {}
+    seen = set()
+    with open(filename, 'r') as fin:
+        if limit is not None: fin = io.StringIO(fin.read(limit))  #
+        rdr = c2dreader(fin)
+        try:
+            rdr.expect('{')
+            while rdr.peek() != '}':
+                group = rdr.value()
+                seen.add(group)
+                rdr.expect(':')
+                if rdr.peek() == '[' and _wants(evidence, group):
+                    rdr.pos += 1
+                    if rdr.peek() == ']':
+                        rdr.pos += 1
+                    else:
+                        while True:
+                            _observe(evidence, group, rdr.value())
+                            if not _wants(evidence, group):
+                                rdr.skip(rest=True)
+                                break
+                            if rdr.expect(',]') == ']': break  #
+                else:
+                    rdr.skip()
+                if rdr.expect(',}') == '}': break  #
+            complete = True
+        except ValueError:
+            if limit is None: return 'BAD'  #
+            complete = False
+    for key, group in (('polygons', CC_POLYGONS), ('links', CC_PATHLINKS)):
+        if group in seen or complete: evidence[key] = group in seen  #
+    if not complete and len(allowed_betas(evidence)) > 1: return None  #
+    return match_beta(evidence)
+
 # --------------------------------------------------------
 
 def nextlabel(txt):
@@ -125,9 +252,87 @@ def nextlabel(txt):
         rslt = txt + '001'
     return rslt
 
+# Unique names without probing: a label splits into a prefix and the
+# number nextlabel would step (its trailing digits, or the '_001' or
+# '001' it would add), and a map of the highest number in use for each
+# lower-cased prefix gives the next free label in one step.
+
+_TRAILING = re.compile(r'[0-9]*$')
+
+def label_parts(txt):
+    # (prefix, number or None, digits) of a label
+    digits = _TRAILING.search(txt).group()
+    if len(digits) > 0: return txt[:len(txt) - len(digits)], int(digits), len(digits)  #
+    if len(txt) < 1: return 'Auto_', None, 3  #
+    if txt[-1].isalpha(): return txt + '_', None, 3  #
+    return txt, None, 3
+
+def count_label(high, txt):
+    prefix, num, width = label_parts(txt)
+    if num is not None and num > high.get(prefix.lower(), -1): high[prefix.lower()] = num  #
+
+def free_label(test, names, high):
+    # test, unless its lower case is in names; then the label after the
+    # highest number high holds for its prefix
+    if test.lower() not in names: return test  #
+    prefix, num, width = label_parts(test)
+    num = max(0 if num is None else num, high.get(prefix.lower(), 0)) + 1
+    return prefix + str(num).zfill(width)
+
 def newuuid():
     return '{%s}' % str(uuid.uuid4())
 
+def newuuids(count):
+    # count newuuid()s from one read of the random source
+    raw = os.urandom(16 * count)
+    return ['{%s}' % uuid.UUID(bytes=raw[pnt:pnt + 16], version=4)
+            for pnt in range(0, 16 * count, 16)]
+
+class uuidsource:
+    # Where new uuids come from.  Unseeded, they are random (uuid4).
+    # Seeded, each is the uuid5 of the seed and a key: the caller's own
+    # where it has a stable one (convert_285to286 passes the old id or
+    # toolpath name), else a running count, so the same work from the
+    # same seed always gives the same ids.  A file hash makes a good seed.
+    # The uuid5s are worked out from a SHA-1 already fed the namespace,
+    # which makes them cheaper than uuid4s.
+    
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.count = 0
+        self._space = None
+        if seed is not None:
+            space = uuid.uuid5(uuid.NAMESPACE_OID, str(seed))
+            self._space = hashlib.sha1(space.bytes)
+    
+    def __call__(self, key=None):
+        if self._space is None: return newuuid()  #
+        if key is None:
+            key = '#%d' % self.count
+            self.count += 1
+        sha = self._space.copy()
+        sha.update(str(key).encode('utf-8'))
+        raw = bytearray(sha.digest()[:16])
+        raw[6] = raw[6] & 0x0f | 0x50   # version 5
+        raw[8] = raw[8] & 0x3f | 0x80   # RFC 4122 variant
+        txt = raw.hex()
+        return '{%s-%s-%s-%s-%s}' % (txt[:8], txt[8:12], txt[12:16],
+                                     txt[16:20], txt[20:])
+    
+    def block(self, count):
+        if self._space is None: return newuuids(count)  #
+        return [self() for pnt in range(count)]
+
+def as_uuidsource(uuids):
+    # a uuidsource for uuids: one already, None (random), or a seed
+    if isinstance(uuids, uuidsource): return uuids  #
+    return uuidsource(uuids)
+
+def objkey(obj):
+    # the key getobject matches on: 'id' for shapes, else 'uuid'
+    if 'id' in obj: return obj['id']  #
+    return obj.get('uuid')
+
 def uulabel(ref):
     txt = str(ref)
     if len(txt) > 8: txt = txt[:3] + '..' + txt[-3:]
@@ -148,24 +353,502 @@ def tight(thing):
         rslt = {}
         for key in thing.keys():
             rslt[key] = tight(thing[key])
+    elif is_array(thing):
+        rslt = np.round(thing, 5)
+    elif isinstance(thing, CC_Object):
+        rslt = copy.copy(thing)
+        for key in thing:
+            rslt[key] = tight(thing[key])
     else:
         rslt = thing
     return rslt
 
-_cos_rot = _sin_rot = 0.0
+def copy_json(thing):
+    # an independent copy of decoded .c2d data, without deepcopy's memo
+    typ = type(thing)
+    if typ is list: return [copy_json(val) for val in thing]  #
+    if typ is dict: return {key: copy_json(val) for key, val in thing.items()}  #
+    if is_array(thing): return thing.copy()  #
+    if isinstance(thing, CC_Object):
+        rslt = copy.copy(thing)
+        for key in thing:
+            rslt[key] = copy_json(thing[key])
+        return rslt
+    return thing
+
+# Content hashes, for telling revisions of a drawing apart.  An object is
+# hashed as canonical JSON: sorted keys, floats rounded to the places
+# tight() keeps (so 1e-9 noise, -0.0 and 1.0 against 1 do not count),
+# arrays as lists.  The same content gives the same hash whether it is
+# held as dicts, CC_Objects or packed curves.
+
+HASH_PLACES = 5
+
+def _canon(thing):
+    typ = type(thing)
+    if typ is float:
+        val = round(thing, HASH_PLACES)
+        return int(val) if val.is_integer() else val
+    if typ in (list, tuple): return [_canon(val) for val in thing]  #
+    if typ is dict or isinstance(thing, CC_Object):
+        return {str(key): _canon(thing[key]) for key in thing}
+    if is_array(thing): return _canon(thing.tolist())  #
+    if np is not None and isinstance(thing, np.generic): return _canon(thing.item())  #
+    return thing
+
+def object_hash(obj):
+    txt = json.dumps(_canon(obj), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(txt.encode('utf-8')).hexdigest()
+
+def document_hash(content):
+    # over every group and the hashes of its members, in file order
+    sha = hashlib.sha1()
+    for group in sorted(content):
+        sha.update(('\n%s:' % group).encode('utf-8'))
+        objects = content[group]
+        if type(objects) is list:
+            for obj in objects:
+                sha.update(object_hash(obj).encode('ascii'))
+        else:
+            sha.update(object_hash(objects).encode('ascii'))
+    return sha.hexdigest()
+
+def _keyed(objects):
+    # identity -> member for diffs: id or uuid, else a lower-cased
+    # toolpath name; CC_VALUES is keyed already
+    if type(objects) is not list: return objects or {}  #
+    rslt = {}
+    for obj in objects:
+        key = objkey(obj)
+        if key is None: key = str(obj.get('name', '')).lower()  #
+        if key not in rslt: rslt[key] = obj  #
+    return rslt
+
+def _file_stamp(filename):
+    try:
+        info = os.stat(filename)
+    except OSError:
+        return None
+    return (info.st_size, info.st_mtime_ns)
+
+# Curve coordinates may be held as contiguous N x 2 float64 arrays rather
+# than lists of [x, y] pairs.  They only become lists again when the
+# drawing is written out, through json_default.
+
+CURVE_ARRAYS = ('points', 'control_point_1', 'control_point_2')
+
+def is_array(thing):
+    return np is not None and isinstance(thing, np.ndarray)
+
+def pack_points(points):
+    if np is None: raise ImportError('array-backed curves need numpy')  #
+    if is_array(points) and points.dtype == np.float64: return points  #
+    return np.array(points, dtype=np.float64).reshape(-1, 2)
+
+def array_list(arr):
+    # arr.tolist(), with whole numbers as ints the way Carbide Create
+    # writes them, so packing a curve does not change the saved file
+    rslt = arr.tolist()
+    if arr.ndim == 2 and arr.dtype.kind == 'f':
+        whole = np.isfinite(arr) & (arr == np.trunc(arr))
+        for row, col in np.argwhere(whole).tolist():
+            rslt[row][col] = int(rslt[row][col])
+    return rslt
+
+def whole_number(val):
+    # a float with no fraction as an int, the way Carbide Create writes it
+    return int(val) if type(val) is float and val.is_integer() else val
+
+def unpack_points(points):
+    return array_list(points) if is_array(points) else points
+
+def copy_points(points):
+    return points.copy() if is_array(points) else copy.deepcopy(points)
+
+def pack_curve(obj):
+    for key in CURVE_ARRAYS:
+        if key in obj: obj[key] = pack_points(obj[key])  #
+    return obj
+
+def unpack_curve(obj):
+    for key in CURVE_ARRAYS:
+        if key in obj: obj[key] = unpack_points(obj[key])  #
+    return obj
+
+def json_default(thing):
+    if isinstance(thing, CC_Object): return thing.json_dict()  #
+    if is_array(thing): return array_list(thing)  #
+    if np is not None and isinstance(thing, np.generic): return thing.item()  #
+    raise TypeError('%s is not JSON serializable' % type(thing).__name__)
+
+# Writer for the layout Carbide Create saves: json.dumps with sorted keys
+# and indent, except that empty lists are opened and closed on separate
+# lines.  Each group member is formatted and written on its own, so the
+# whole document is never held as one string.
+
+def fix_empty_lists(txt):
+    body = txt.split('\n')
+    for pnt in range(len(body)):
+        lin = body[pnt]
+        if lin[-3:] == '[],':
+            ind = len(lin) - len(lin.lstrip(' '))
+            body[pnt] = lin[:-2] + '\n' + (' ' * ind) + '],'
+        elif lin[-2:] == '[]':
+            ind = len(lin) - len(lin.lstrip(' '))
+            body[pnt] = lin[:-1] + '\n' + (' ' * ind) + ']'
+    return str.join('\n', body)
+
+def write_c2d(fout, content, indent=4):
+    if indent is None:
+        fout.write(fix_empty_lists(json.dumps(content, sort_keys=True,
+                                              default=json_default)) + '\n')
+        return
+    pad = ' ' * indent if type(indent) is int else indent
+    
+    def dumps(thing, level):
+        txt = json.dumps(thing, sort_keys=True, indent=indent,
+                         default=json_default)
+        return txt.replace('\n', '\n' + pad * level)
+    
+    keys = sorted(content.keys())
+    if len(keys) < 1:
+        fout.write('{}\n')
+        return
+    fout.write('{')
+    for kpnt in range(len(keys)):
+        key = keys[kpnt]
+        value = content[key]
+        tail = ',' if kpnt < len(keys) - 1 else ''
+        head = '\n' + pad + json.dumps(key) + ': '
+        if type(value) is list and len(value) > 0:
+            fout.write(head + '[')
+            last = len(value) - 1
+            for pnt in range(len(value)):
+                txt = pad * 2 + dumps(value[pnt], 2) + (',' if pnt < last else '')
+                fout.write('\n' + fix_empty_lists(txt))
+            fout.write('\n' + pad + ']' + tail)
+        else:
+            fout.write('\n' + fix_empty_lists(head[1:] + dumps(value, 1) + tail))
+    fout.write('\n}\n')
+
+# Streaming reader: walks a .c2d file one top-level group at a time and
+# decodes one object at a time, so only the current object and a read
+# buffer are held in memory.  Groups that are not wanted are skipped a
+# member at a time, decoding and dropping each: the C decoder gets
+# through them faster than a Python scan for brackets could.
+
+_WS = re.compile(r'[ \t\n\r]*')
+
+class c2dreader:
+    def __init__(self, fin, chunk=1 << 16):
+        self.fin = fin
+        self.chunk = chunk
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+    
+    def more(self, size=0):
+        # drop what has been consumed and read at least another chunk
+        data = self.fin.read(max(size, self.chunk))
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        if len(data) < 1: self.eof = True  #
+        return len(data) > 0
+    
+    def peek(self):
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf): return self.buf[self.pos]  #
+            if not self.more(): return ''  #
+    
+    def expect(self, chars):
+        ch = self.peek()
+        if ch == '' or ch not in chars:
+            raise ValueError('Expected %s in .c2d stream, found %r' %
+                             (' or '.join(chars), ch))
+        self.pos += 1
+        return ch
+    
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:   # a number may go on
+                    self.pos = end
+                    return obj
+            except ValueError:
+                if self.eof: raise  #
+            self.more(len(self.buf) - self.pos)     # doubles the buffer
+    
+    def skip(self, rest=False):
+        # skips a value, or with rest, the rest of the list whose last
+        # member was just read
+        if not rest:
+            if self.peek() != '[':
+                self.value()
+                return
+            self.pos += 1
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            self.value()
+        while self.expect(',]') == ',':
+            self.value()
+    
+    def events(self, groups=None):
+        # (group, None) as each list group opens, then (group, object)
+        # for its members; (group, value) for other groups
+        self.expect('{')
+        if self.peek() == '}': return  #
+        while True:
+            group = self.value()
+            self.expect(':')
+            if groups is not None and group not in groups:
+                self.skip()
+            elif self.peek() == '[':
+                self.pos += 1
+                yield group, None
+                if self.peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield group, self.value()
+                        if self.expect(',]') == ']': break  #
+            else:
+                yield group, self.value()
+            if self.expect(',}') == '}': break  #
+
+def iter_c2d(fin, groups=None, chunk=1 << 16):
+    # (group, object) for each member of the list groups of an open .c2d
+    # file, and (group, value) for DOCUMENT_VALUES
+    for group, obj in c2dreader(fin, chunk).events(groups):
+        if obj is not None: yield group, obj  #
+
+# Binary sidecar cache, <drawing>.cache, for fast reloading.  A fixed
+# preamble gives the offsets of a JSON header, a block of float64 (x, y)
+# rows, a block of int flags and a block of raw text.  The header holds
+# the drawing with each curve coordinate list replaced by {"$rows":
+# [first, count]} and each long document value (BACKGROUND_IMAGE) by
+# {"$text": [at, length]} in the text block, plus the beta, next id and
+# the size, mtime and SHA-1 of the drawing it was made from.  The cache
+# is current when size and mtime match; when only the mtime differs the
+# file is hashed and compared.  The flags mark coordinates that were
+# ints in the file, so lists come back exactly as parsed; in arrays mode
+# the curves get views of a copy-on-write memory map of the rows
+# instead.  Needs numpy; without it there is no cache.
+
+CACHE_SUFFIX = '.cache'
+CACHE_MAGIC = b'C2DCACH2'
+CACHE_TEXT = 4096                       # longer value strings go in the text block
+_PREAMBLE = struct.Struct('<8sQQQQQQ')  # magic, header at/len, rows at/count, flags at, text at
+
+def _source_sha1(filename):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def _source_key(filename):
+    info = os.stat(filename)
+    return {'size': info.st_size, 'mtime_ns': info.st_mtime_ns,
+            'sha1': _source_sha1(filename)}
+
+def _source_current(filename, key):
+    # whether filename is still the file key was taken from
+    info = os.stat(filename)
+    if info.st_size != key['size']: return False  #
+    if info.st_mtime_ns == key['mtime_ns']: return True  #
+    return _source_sha1(filename) == key['sha1']
+
+def write_cache(cnc, filename=None):
+    # writes the sidecar for cnc, as loaded from filename (default: its
+    # own file); returns False if it cannot
+    filename = filename or cnc.filename
+    if np is None or not filename: return False  #
+    try:
+        key = _source_key(filename)
+    except OSError:
+        return False
+    
+    arrs = []
+    flags = []
+    rows = 0
+    content = dict(cnc.content)
+    curves = []
+    for obj in cnc.getgroup(CC_CURVES):
+        obj = dict(obj)
+        for name in CURVE_ARRAYS:
+            if name not in obj: continue  #
+            points = obj[name]
+            arr = np.asarray(pack_points(points), dtype='<f8').reshape(-1, 2)
+            if is_array(points):
+                ints = np.zeros(arr.shape, dtype=np.uint8)
+            else:
+                ints = np.array([[type(val) is int for val in pnt] for pnt in points],
+                                dtype=np.uint8).reshape(-1, 2)
+            obj[name] = {'$rows': [rows, len(arr)]}
+            arrs.append(arr)
+            flags.append(ints)
+            rows += len(arr)
+        curves.append(obj)
+    if CC_CURVES in content: content[CC_CURVES] = curves  #
+    
+    texts = []
+    textlen = 0
+    values = content.get(CC_VALUES)
+    if type(values) is dict:
+        values = dict(values)
+        for name, val in values.items():
+            if type(val) is str and len(val) > CACHE_TEXT:
+                text = val.encode('utf-8')
+                values[name] = {'$text': [textlen, len(text)]}
+                texts.append(text)
+                textlen += len(text)
+        content[CC_VALUES] = values
+    
+    header = json.dumps({'source': key, 'beta': cnc.beta, 'nextid': cnc.nextid,
+                         'content': content}, default=json_default).encode('utf-8')
+    headat = _PREAMBLE.size
+    rowsat = (headat + len(header) + 7) // 8 * 8
+    flagsat = rowsat + rows * 16
+    textat = flagsat + rows * 2
+    tmpname = filename + CACHE_SUFFIX + '.tmp'
+    try:
+        with open(tmpname, 'wb') as fout:
+            fout.write(_PREAMBLE.pack(CACHE_MAGIC, headat, len(header),
+                                      rowsat, rows, flagsat, textat))
+            fout.write(header)
+            fout.write(b'\0' * (rowsat - headat - len(header)))
+            for arr in arrs:
+                fout.write(arr.tobytes())
+            for ints in flags:
+                fout.write(ints.tobytes())
+            for text in texts:
+                fout.write(text)
+        os.replace(tmpname, filename + CACHE_SUFFIX)
+    except OSError:
+        if os.path.exists(tmpname): os.unlink(tmpname)  #
+        return False
+    return True
+
+def read_cache(filename, arrays=False, mmap=True):
+    # (content, beta, nextid) from filename's sidecar, or None when there
+    # is none or it is stale
+    cachename = filename + CACHE_SUFFIX
+    if np is None or not os.path.exists(cachename): return None  #
+    try:
+        with open(cachename, 'rb') as fin:
+            magic, headat, headlen, rowsat, rows, flagsat, textat = \
+                _PREAMBLE.unpack(fin.read(_PREAMBLE.size))
+            if magic != CACHE_MAGIC: return None  #
+            fin.seek(headat)
+            header = json.loads(fin.read(headlen).decode('utf-8'))
+            if not _source_current(filename, header['source']): return None  #
+            values = header['content'].get(CC_VALUES)
+            if type(values) is dict:
+                for name, val in values.items():
+                    if type(val) is dict and '$text' in val:
+                        at, length = val['$text']
+                        fin.seek(textat + at)
+                        values[name] = fin.read(length).decode('utf-8')
+            if arrays and mmap and rows > 0:
+                coords = np.memmap(cachename, dtype='<f8', mode='c',
+                                   offset=rowsat, shape=(rows, 2))
+            else:
+                fin.seek(rowsat)
+                coords = np.fromfile(fin, dtype='<f8', count=rows * 2).reshape(-1, 2)
+            if not arrays:
+                fin.seek(flagsat)
+                ints = np.fromfile(fin, dtype=np.uint8, count=rows * 2).reshape(-1, 2)
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+    
+    content = header['content']
+    if not arrays:                      # every row as a list at once
+        coords = coords.tolist()
+        for row, col in np.argwhere(ints).tolist():
+            coords[row][col] = int(coords[row][col])
+    for obj in content.get(CC_CURVES, []):
+        for name in CURVE_ARRAYS:
+            ref = obj.get(name)
+            if type(ref) is not dict: continue  #
+            first, count = ref['$rows']
+            obj[name] = coords[first:first + count]
+    return content, header['beta'], header['nextid']
+
+# set_rotation/rotate keep their angle per thread; library code passes
+# angles and matrices around explicitly instead.
+
+_rotation = threading.local()
 
 def set_rotation(rot):
-    global _cos_rot, _sin_rot
     rot = math.radians(rot)
-    _cos_rot = math.cos(rot)
-    _sin_rot = math.sin(rot)
+    _rotation.cos = math.cos(rot)
+    _rotation.sin = math.sin(rot)
 
 def rotate(xx, yy):
-    global _cos_rot, _sin_rot
-    tx = _cos_rot*xx - _sin_rot*yy
-    ty = _sin_rot*xx + _cos_rot*yy
+    cs = getattr(_rotation, 'cos', 0.0)
+    sn = getattr(_rotation, 'sin', 0.0)
+    tx = cs*xx - sn*yy
+    ty = sn*xx + cs*yy
     return tx,ty
 
+# 2D affine matrices are tuples (a, b, c, d, tx, ty) mapping (x, y) to
+# (a*x + b*y + tx, c*x + d*y + ty).
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+def matrix_multiply(first, then):
+    # the matrix that applies first and then then
+    a1, b1, c1, d1, x1, y1 = first
+    a2, b2, c2, d2, x2, y2 = then
+    return (a2*a1 + b2*c1, a2*b1 + b2*d1, c2*a1 + d2*c1, c2*b1 + d2*d1,
+            a2*x1 + b2*y1 + x2, c2*x1 + d2*y1 + y2)
+
+def matrix_translate(dx, dy):
+    return (1.0, 0.0, 0.0, 1.0, dx, dy)
+
+def matrix_scale(sx, sy=None, cx=0.0, cy=0.0):
+    if sy is None: sy = sx  #
+    return (sx, 0.0, 0.0, sy, cx - sx*cx, cy - sy*cy)
+
+def matrix_rotate(rot, cx=0.0, cy=0.0):
+    rot = math.radians(rot)
+    cs, sn = math.cos(rot), math.sin(rot)
+    return (cs, -sn, sn, cs, cx - cs*cx + sn*cy, cy - sn*cx - cs*cy)
+
+def matrix_mirror(xx=None, yy=None):
+    # reflect across the vertical line at xx and/or horizontal line at yy
+    rslt = IDENTITY
+    if xx is not None: rslt = matrix_multiply(rslt, (-1.0, 0.0, 0.0, 1.0, 2*xx, 0.0))  #
+    if yy is not None: rslt = matrix_multiply(rslt, (1.0, 0.0, 0.0, -1.0, 0.0, 2*yy))  #
+    return rslt
+
+def transform_points(matrix, points):
+    # returns the points moved by matrix, as an array for an array input
+    # and as a list of [x, y] pairs (whole numbers as ints) otherwise
+    aa, bb, cc, dd, tx, ty = matrix
+    if is_array(points):
+        rslt = np.empty_like(points, dtype=np.float64)
+        rslt[:,0] = aa*points[:,0] + bb*points[:,1] + tx
+        rslt[:,1] = cc*points[:,0] + dd*points[:,1] + ty
+        return rslt
+    return [[whole_number(aa*xx + bb*yy + tx), whole_number(cc*xx + dd*yy + ty)]
+            for xx, yy in points]
+
+def _transform_all(matrix, arrays):
+    # transform_points over many point sets in one pass
+    if np is None or len(arrays) < 1:
+        return [transform_points(matrix, pts) for pts in arrays]
+    packed = [pack_points(pts) for pts in arrays]
+    sizes = np.cumsum([len(pts) for pts in packed])[:-1]
+    moved = np.split(transform_points(matrix, np.concatenate(packed)), sizes)
+    return [moved[pnt] if is_array(arrays[pnt]) else array_list(moved[pnt])
+            for pnt in range(len(arrays))]
+
 # --------------------------------------------------------
 
 class extents:
@@ -184,12 +867,764 @@ class extents:
     def extents(self):
         return (self.lft, self.btm, self.rit, self.top)
     
+# Curves are chains of cubic Bezier segments: control_point_2 of a point
+# leads out of it and control_point_1 of the next point leads into that.
+
+def curve_segments(obj):
+    # (start, control, control, end) for each segment of a curve dict
+    points = unpack_points(obj['points'])
+    cp1 = unpack_points(obj.get('control_point_1', points))
+    cp2 = unpack_points(obj.get('control_point_2', points))
+    cnt = len(points)
+    if len(cp1) < cnt: cp1 = list(cp1) + points[len(cp1):]  #
+    if len(cp2) < cnt: cp2 = list(cp2) + points[len(cp2):]  #
+    
+    rslt = []
+    for pnt in range(1, cnt):
+        rslt.append((points[pnt-1], cp2[pnt-1], cp1[pnt], points[pnt]))
+    if obj.get('closed', False) and cnt > 1 and points[0] != points[-1]:
+        rslt.append((points[-1], cp2[-1], cp1[0], points[0]))
+    return rslt
+
+def bezier_point(p0, p1, p2, p3, tt):
+    mt = 1.0 - tt
+    return mt*mt*mt*p0 + 3*mt*mt*tt*p1 + 3*mt*tt*tt*p2 + tt*tt*tt*p3
+
+def bezier_roots(p0, p1, p2, p3):
+    # parameters in (0, 1) where one coordinate of a segment turns around
+    aa = -p0 + 3*p1 - 3*p2 + p3
+    bb = 2 * (p0 - 2*p1 + p2)
+    cc = p1 - p0
+    if abs(aa) < 1e-12:
+        roots = [] if abs(bb) < 1e-12 else [-cc / bb]
+    else:
+        disc = bb*bb - 4*aa*cc
+        if disc < 0.0: return []  #
+        disc = math.sqrt(disc)
+        roots = [(-bb + disc) / (2*aa), (-bb - disc) / (2*aa)]
+    return [tt for tt in roots if 0.0 < tt < 1.0]
+
+def _bezier_peaks(p0, p1, p2, p3):
+    # bezier_roots for arrays of segments, both axes at once; returns the
+    # coordinate values at the two roots of each axis (an endpoint where a
+    # root does not exist)
+    aa = -p0 + 3*p1 - 3*p2 + p3
+    bb = 2 * (p0 - 2*p1 + p2)
+    cc = p1 - p0
+    quad = np.abs(aa) >= 1e-12
+    disc = bb*bb - 4*aa*cc
+    with np.errstate(divide='ignore', invalid='ignore'):
+        root = np.sqrt(np.where(quad, disc, 0.0))
+        t1 = np.where(quad, (-bb + root) / (2*aa), -cc / bb)
+        t2 = np.where(quad, (-bb - root) / (2*aa), t1)
+    usable = (~quad & (np.abs(bb) >= 1e-12)) | (quad & (disc >= 0.0))
+    t1 = np.where(usable & (t1 > 0.0) & (t1 < 1.0), t1, 0.0)
+    t2 = np.where(usable & (t2 > 0.0) & (t2 < 1.0), t2, 0.0)
+    return (bezier_point(p0, p1, p2, p3, t1),
+            bezier_point(p0, p1, p2, p3, t2))
+
+def _stacked(lists, total):
+    # point lists and/or arrays as one (total, 2) array.  Lists are read
+    # in a single np.fromiter pass over all their numbers, which costs a
+    # fraction of converting them one np.array at a time.
+    if total < 1: return np.zeros((0, 2))  #
+    arrays = [is_array(pts) for pts in lists]
+    if not any(arrays):
+        flat = itertools.chain.from_iterable(itertools.chain.from_iterable(lists))
+        return np.fromiter(flat, np.float64, 2 * total).reshape(-1, 2)
+    if all(arrays): return np.concatenate(lists).astype(np.float64, copy=False)  #
+    return np.concatenate([pack_points(pts) for pts in lists if len(pts) > 0])
+
+def _curve_arrays(objects):
+    # the points and control points of many curves stacked into arrays,
+    # with the start/end rows and owning curve of every segment
+    cnt = len(objects)
+    arrs = [obj['points'] for obj in objects]
+    sizes = np.fromiter(map(len, arrs), int, cnt)
+    total = int(sizes.sum())
+    stacks = []
+    for key in ('control_point_1', 'control_point_2'):
+        cpss = [obj.get(key, arr) for obj, arr in zip(objects, arrs)]
+        for pnt in np.flatnonzero(np.fromiter(map(len, cpss), int, cnt) != sizes):
+            cps, arr = unpack_points(cpss[pnt]), unpack_points(arrs[pnt])
+            cpss[pnt] = cps[:len(arr)] + arr[len(cps):]     # anchors stand in
+        stacks.append(cpss)
+    if total < 1:
+        empty = np.zeros((0, 2))
+        none = np.zeros(0, dtype=int)
+        return empty, empty, empty, sizes, none, none, none
+    pts = _stacked(arrs, total)
+    cp1 = _stacked(stacks[0], total)
+    cp2 = _stacked(stacks[1], total)
+    
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    owner = np.repeat(np.arange(cnt), sizes)
+    segs = np.ones(len(pts), dtype=bool)
+    segs[ends[sizes > 0] - 1] = False
+    s0 = np.flatnonzero(segs)
+    s1 = s0 + 1
+    segowner = owner[s0]
+    closed = np.fromiter((obj.get('closed', False) for obj in objects), bool, cnt)
+    wrap = np.flatnonzero(closed & (sizes > 1))
+    wrap = wrap[(pts[starts[wrap]] != pts[ends[wrap] - 1]).any(1)]
+    if len(wrap) > 0:
+        s0 = np.concatenate((s0, ends[wrap] - 1))
+        s1 = np.concatenate((s1, starts[wrap]))
+        segowner = np.concatenate((segowner, wrap))
+    return pts, cp1, cp2, sizes, s0, s1, segowner
+
+def _curve_boxes(objects, pos):
+    # exact boxes for curve dicts: anchors plus the extrema of segments
+    # with a control point outside their curve's anchor box (a segment
+    # stays inside the hull of its control points, so the rest add
+    # nothing)
+    cnt = len(objects)
+    pts, cp1, cp2, sizes, s0, s1, segowner = _curve_arrays(objects)
+    boxes = np.full((cnt, 4), np.nan)
+    if len(pts) < 1: return boxes  #
+    
+    full = sizes > 0
+    starts = (np.cumsum(sizes) - sizes)[full]
+    low = np.minimum.reduceat(pts, starts)
+    high = np.maximum.reduceat(pts, starts)
+    boxes[full, :2] = low
+    boxes[full, 2:] = high
+    if len(s0) > 0:
+        low = np.repeat(low, sizes[full], axis=0)   # per point row
+        high = np.repeat(high, sizes[full], axis=0)
+        out1, out2 = [(cps[:,0] < low[:,0]) | (cps[:,0] > high[:,0]) |
+                      (cps[:,1] < low[:,1]) | (cps[:,1] > high[:,1])
+                      for cps in (cp1, cp2)]
+        keep = out2[s0] | out1[s1]
+        s0, s1, segowner = s0[keep], s1[keep], segowner[keep]
+    if len(s0) > 0:
+        e1, e2 = _bezier_peaks(pts[s0], cp2[s0], cp1[s1], pts[s1])
+        np.minimum.at(boxes[:, :2], segowner, np.minimum(e1, e2))
+        np.maximum.at(boxes[:, 2:], segowner, np.maximum(e1, e2))
+    return boxes + np.hstack((pos, pos))
+
+# Per-object bounding boxes, (lft, btm, rit, top) or None when the object
+# has no points.  bulk_extents does a whole group at once with numpy;
+# object_extents is the one-at-a-time version it falls back on.  Curve
+# boxes are exact, taking in the bulge of each Bezier segment.
+
+def _text_width(obj):
+    width = obj['width']
+    if width < 0.0: width = len(obj['text']) * obj['height'] * .7  #
+    return width
+
+def object_extents(group, obj):
+    ext = extents()
+    ox, oy = obj['position'] if 'position' in obj else (0.0, 0.0)
+    
+    if group == CC_CURVES:
+        points = obj['points']
+        if len(points) < 1: return None  #
+        for xx, yy in points:
+            ext.test(ox + xx, oy + yy)
+        for seg in curve_segments(obj):
+            for axis in (0, 1):
+                for tt in bezier_roots(*[pt[axis] for pt in seg]):
+                    xx = bezier_point(*[pt[0] for pt in seg], tt)
+                    yy = bezier_point(*[pt[1] for pt in seg], tt)
+                    ext.test(ox + xx, oy + yy)
+    
+    elif group == CC_POLYGONS:
+        rot = math.radians(obj['rotation'])
+        cs, sn = math.cos(rot), math.sin(rot)
+        points = obj['points']
+        if len(points) < 1: return None  #
+        for xx, yy in points:
+            ext.test(ox + cs*xx - sn*yy, oy + sn*xx + cs*yy)
+    
+    elif group in (CC_RECTS, CC_TEXTS):
+        if group == CC_RECTS:
+            wd2 = obj['width'] / 2
+            hd2 = obj['height'] / 2
+            corners = ((-wd2, -hd2), (wd2, -hd2), (-wd2, hd2), (wd2, hd2))
+        else:
+            width = _text_width(obj)
+            height = obj['height']
+            corners = ((0, 0), (width, 0), (0, height), (width, height))
+        rot = math.radians(obj['rotation'])
+        cs, sn = math.cos(rot), math.sin(rot)
+        for xx, yy in corners:
+            ext.test(ox + cs*xx - sn*yy, oy + sn*xx + cs*yy)
+    
+    elif group in (CC_CIRCLES, CC_REGPOLYS):
+        rad = obj['radius']
+        ext.test(ox-rad, oy-rad)
+        ext.test(ox+rad, oy+rad)
+    
+    else:
+        return None
+    return ext.extents()
+
+def bulk_extents(group, objects):
+    if np is None or len(objects) < 1:
+        return [object_extents(group, obj) for obj in objects]
+    
+    cnt = len(objects)
+    pos = np.zeros((cnt, 2))
+    for pnt in range(cnt):
+        if 'position' in objects[pnt]: pos[pnt] = objects[pnt]['position']  #
+    
+    if group == CC_CURVES:
+        boxes = _curve_boxes(objects, pos)
+    
+    elif group == CC_POLYGONS:
+        arrs = [pack_points(obj['points']) for obj in objects]
+        sizes = np.array([len(arr) for arr in arrs])
+        if sizes.sum() < 1: return [None] * cnt  #
+        pts = np.concatenate(arrs)
+        rot = np.radians([obj['rotation'] for obj in objects])
+        cs = np.repeat(np.cos(rot), sizes)
+        sn = np.repeat(np.sin(rot), sizes)
+        pts = np.column_stack((cs*pts[:,0] - sn*pts[:,1],
+                               sn*pts[:,0] + cs*pts[:,1]))
+        pts = pts + np.repeat(pos, sizes, axis=0)
+        full = sizes > 0
+        starts = (np.cumsum(sizes) - sizes)[full]
+        boxes = np.full((cnt, 4), np.nan)
+        boxes[full, :2] = np.minimum.reduceat(pts, starts)
+        boxes[full, 2:] = np.maximum.reduceat(pts, starts)
+    
+    elif group == CC_RECTS:
+        rot = np.radians([obj['rotation'] for obj in objects])
+        wd2 = np.array([obj['width'] for obj in objects], dtype=float) / 2
+        hd2 = np.array([obj['height'] for obj in objects], dtype=float) / 2
+        cs, sn = np.abs(np.cos(rot)), np.abs(np.sin(rot))
+        half = np.column_stack((cs*wd2 + sn*hd2, sn*wd2 + cs*hd2))
+        boxes = np.hstack((pos - half, pos + half))
+    
+    elif group == CC_TEXTS:
+        rot = np.radians([obj['rotation'] for obj in objects])
+        width = np.array([_text_width(obj) for obj in objects], dtype=float)
+        height = np.array([obj['height'] for obj in objects], dtype=float)
+        cs, sn = np.cos(rot), np.sin(rot)
+        zero = np.zeros(cnt)
+        xs = np.column_stack((zero, cs*width, -sn*height, cs*width - sn*height))
+        ys = np.column_stack((zero, sn*width, cs*height, sn*width + cs*height))
+        boxes = np.column_stack((pos[:,0] + xs.min(1), pos[:,1] + ys.min(1),
+                                 pos[:,0] + xs.max(1), pos[:,1] + ys.max(1)))
+    
+    elif group in (CC_CIRCLES, CC_REGPOLYS):
+        rad = np.array([obj['radius'] for obj in objects], dtype=float)
+        rad = np.column_stack((rad, rad))
+        boxes = np.hstack((pos - rad, pos + rad))
+    
+    else:
+        return [None] * cnt
+    
+    rslt = [tuple(box) for box in boxes.tolist()]
+    for pnt in np.flatnonzero(np.isnan(boxes[:,0])):
+        rslt[pnt] = None
+    return rslt
+
+# Perimeter, enclosed area and closedness of shapes, as three lists
+# (None for texts, whose outlines depend on the font).  Curve segments
+# are measured with 5 point Gauss-Legendre quadrature: close for the
+# length, exact for the area.  Open curves enclose no area.
+
+_GAUSS = ((0.0469100770306680, 0.1184634425280945),
+          (0.2307653449471585, 0.2393143352496832),
+          (0.5, 0.2844444444444444),
+          (0.7692346550528415, 0.2393143352496832),
+          (0.9530899229693319, 0.1184634425280945))
+
+def _segment_measure(p0, p1, p2, p3):
+    # (length, twice the signed area swept from the origin)
+    length = 0.0
+    area = 0.0
+    for tt, wt in _GAUSS:
+        ss = 1.0 - tt
+        xx = bezier_point(p0[0], p1[0], p2[0], p3[0], tt)
+        yy = bezier_point(p0[1], p1[1], p2[1], p3[1], tt)
+        dx = 3 * (ss*ss*(p1[0]-p0[0]) + 2*ss*tt*(p2[0]-p1[0]) + tt*tt*(p3[0]-p2[0]))
+        dy = 3 * (ss*ss*(p1[1]-p0[1]) + 2*ss*tt*(p2[1]-p1[1]) + tt*tt*(p3[1]-p2[1]))
+        length += wt * math.hypot(dx, dy)
+        area += wt * (xx*dy - yy*dx)
+    return length, area
+
+def _is_closed(group, obj):
+    if group != CC_CURVES: return True  #
+    points = obj['points']
+    if len(points) < 2: return False  #
+    if obj.get('closed', False): return True  #
+    return tuple(points[0]) == tuple(points[-1])
+
+def shape_measure(group, obj):
+    if group == CC_CIRCLES:
+        rad = obj['radius']
+        return 2 * math.pi * rad, math.pi * rad * rad, True
+    if group == CC_RECTS:
+        width, height = abs(obj['width']), abs(obj['height'])
+        return 2 * (width + height), width * height, True
+    if group == CC_REGPOLYS:
+        rad, sides = obj['radius'], obj['num_sides']
+        return (2 * sides * rad * math.sin(math.pi / sides),
+                sides * rad * rad * math.sin(2 * math.pi / sides) / 2, True)
+    if group == CC_POLYGONS:
+        points = unpack_points(obj['points'])
+        length = 0.0
+        area = 0.0
+        for pnt in range(len(points)):
+            x0, y0 = points[pnt-1]
+            x1, y1 = points[pnt]
+            length += math.hypot(x1 - x0, y1 - y0)
+            area += x0*y1 - x1*y0
+        return length, abs(area) / 2, True
+    if group == CC_CURVES:
+        closed = _is_closed(group, obj)
+        length = 0.0
+        area = 0.0
+        for seg in curve_segments(obj):
+            seglen, segarea = _segment_measure(*seg)
+            length += seglen
+            area += segarea
+        return length, (abs(area) / 2 if closed else 0.0), closed
+    return None, None, False
+
+def shape_measures(group, objects):
+    if np is None or group != CC_CURVES or len(objects) < 1:
+        rslt = [shape_measure(group, obj) for obj in objects]
+        return ([item[0] for item in rslt], [item[1] for item in rslt],
+                [item[2] for item in rslt])
+    
+    cnt = len(objects)
+    pts, cp1, cp2, sizes, s0, s1, segowner = _curve_arrays(objects)
+    closed = [_is_closed(group, obj) for obj in objects]
+    if len(s0) < 1: return [0.0] * cnt, [0.0] * cnt, closed  #
+    
+    p0, p1, p2, p3 = pts[s0], cp2[s0], cp1[s1], pts[s1]
+    tt = np.array([node for node, wt in _GAUSS])[:, None, None]
+    wts = np.array([wt for node, wt in _GAUSS])
+    ss = 1.0 - tt
+    at = ss**3*p0 + 3*ss*ss*tt*p1 + 3*ss*tt*tt*p2 + tt**3*p3
+    dt = 3 * (ss*ss*(p1-p0) + 2*ss*tt*(p2-p1) + tt*tt*(p3-p2))
+    seglen = wts @ np.hypot(dt[..., 0], dt[..., 1])
+    segarea = wts @ (at[..., 0]*dt[..., 1] - at[..., 1]*dt[..., 0])
+    lengths = np.bincount(segowner, weights=seglen, minlength=cnt)
+    areas = np.abs(np.bincount(segowner, weights=segarea, minlength=cnt)) / 2
+    areas[~np.array(closed)] = 0.0
+    return lengths.tolist(), areas.tolist(), closed
+
+# Shapes as world coordinate polylines, each a list of (x, y) tuples that
+# repeats its first point when closed.  Arcs and Bezier segments are
+# split finely enough to stay within tolerance of the true outline;
+# texts give no polylines.
+
+def _arc_steps(rad, tolerance, sweep=2 * math.pi):
+    if rad <= tolerance: return 4  #
+    step = 2 * math.acos(1 - tolerance / rad)
+    return max(4, math.ceil(abs(sweep) / step))
+
+def _bezier_steps(p0, p1, p2, p3, tolerance):
+    # chord error of n even steps is at most 3/4 * |second difference| / n^2
+    bend = max(math.hypot(p0[0] - 2*p1[0] + p2[0], p0[1] - 2*p1[1] + p2[1]),
+               math.hypot(p1[0] - 2*p2[0] + p3[0], p1[1] - 2*p2[1] + p3[1]))
+    if bend <= 0.0: return 1  #
+    return max(1, math.ceil(math.sqrt(0.75 * bend / tolerance)))
+
+def flatten_shape(group, obj, tolerance=0.01):
+    ox, oy = obj['position'] if 'position' in obj else (0.0, 0.0)
+    
+    if group == CC_CURVES:
+        segs = curve_segments(obj)
+        points = unpack_points(obj['points'])
+        if len(points) < 1: return []  #
+        line = [(ox + points[0][0], oy + points[0][1])]
+        for seg in segs:
+            steps = _bezier_steps(*seg, tolerance)
+            for pnt in range(1, steps + 1):
+                tt = pnt / steps
+                line.append((ox + bezier_point(*[pt[0] for pt in seg], tt),
+                             oy + bezier_point(*[pt[1] for pt in seg], tt)))
+        return [line]
+    
+    if group == CC_CIRCLES:
+        rad = obj['radius']
+        steps = _arc_steps(rad, tolerance)
+        corners = [(rad * math.cos(2 * math.pi * pnt / steps),
+                    rad * math.sin(2 * math.pi * pnt / steps))
+                   for pnt in range(steps)]
+        rot = 0.0
+    elif group == CC_RECTS:
+        wd2 = obj['width'] / 2
+        hd2 = obj['height'] / 2
+        corners = ((-wd2, -hd2), (wd2, -hd2), (wd2, hd2), (-wd2, hd2))
+        rot = obj['rotation']
+    elif group == CC_REGPOLYS:
+        rad, sides = obj['radius'], obj['num_sides']
+        corners = [(rad * math.cos(2 * math.pi * pnt / sides),
+                    rad * math.sin(2 * math.pi * pnt / sides))
+                   for pnt in range(sides)]
+        rot = obj['rotation']
+    elif group == CC_POLYGONS:
+        corners = unpack_points(obj['points'])
+        rot = obj['rotation']
+    else:
+        return []
+    if len(corners) < 1: return []  #
+    
+    rot = math.radians(rot)
+    cs, sn = math.cos(rot), math.sin(rot)
+    line = [(ox + cs*xx - sn*yy, oy + sn*xx + cs*yy) for xx, yy in corners]
+    line.append(line[0])
+    return [line]
+
+def flatten_shapes(group, objects, tolerance=0.01):
+    # flatten_shape for many shapes of a group; curves go all at once,
+    # segment samples evaluated together in the same order of operations
+    if np is None or group != CC_CURVES or len(objects) < 1:
+        return [flatten_shape(group, obj, tolerance) for obj in objects]
+    cnt = len(objects)
+    pts, cp1, cp2, sizes, s0, s1, segowner = _curve_arrays(objects)
+    pos = np.array([obj['position'] if 'position' in obj else (0.0, 0.0)
+                    for obj in objects], dtype=np.float64).reshape(-1, 2)
+    order = np.argsort(s0, kind='stable')   # closing segments after the rest
+    s0, s1, segowner = s0[order], s1[order], segowner[order]
+    p0, p1, p2, p3 = pts[s0], cp2[s0], cp1[s1], pts[s1]
+    bend = np.maximum(np.hypot(p0[:, 0] - 2*p1[:, 0] + p2[:, 0], p0[:, 1] - 2*p1[:, 1] + p2[:, 1]),
+                      np.hypot(p1[:, 0] - 2*p2[:, 0] + p3[:, 0], p1[:, 1] - 2*p2[:, 1] + p3[:, 1]))
+    steps = np.maximum(1, np.ceil(np.sqrt(0.75 * bend / tolerance))).astype(int)
+    owner = np.repeat(np.arange(len(s0)), steps)
+    tt = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps) + 1) / steps[owner]
+    samples = pos[segowner[owner]] + bezier_point(p0[owner], p1[owner], p2[owner], p3[owner],
+                                                  tt[:, None])
+    
+    # each curve is its first point and then the samples of its segments
+    has = sizes > 0
+    counts = has + np.bincount(segowner, weights=steps, minlength=cnt).astype(int)
+    firsts = (np.cumsum(counts) - counts)[has]
+    line = np.empty((counts.sum(), 2))
+    head = np.zeros(len(line), dtype=bool)
+    head[firsts] = True
+    line[head] = pos[has] + pts[(np.cumsum(sizes) - sizes)[has]]
+    line[~head] = samples
+    rows = list(zip(line[:, 0].tolist(), line[:, 1].tolist()))
+    rslt = []
+    at = 0
+    for size in counts.tolist():
+        rslt.append([rows[at:at + size]] if size > 0 else [])
+        at += size
+    return rslt
+
+
+# Curve simplification.  Nodes between straight segments (control points
+# on their anchors) are thinned with Douglas-Peucker; runs of curved
+# segments through smooth, non-PT_POLY nodes are merged into single
+# cubics that keep the tangents at their ends.  Both go level by level
+# over the nodes of every curve at once: each pass splits every open
+# Douglas-Peucker range, or tries to merge every other mergeable node,
+# in a handful of array operations.  End nodes, PT_CLOSER nodes and nodes
+# where a curve turns from straight to curved are always kept, with their
+# point types.  A merge is fitted to SIMPLIFY_SAMPLES points on each
+# original segment it replaces and only made when it passes within
+# tolerance of all of them.  The samples are fitted at the parameters a
+# de Casteljau split at the merged node would have given them, so a
+# cleanly split cubic merges back exactly.
+
+SIMPLIFY_SAMPLES = 8
+
+def _ranges(starts, counts):
+    # starts[k] .. starts[k] + counts[k] - 1 for every k, concatenated
+    offs = np.cumsum(counts) - counts
+    return np.repeat(starts - offs, counts) + np.arange(counts.sum())
+
+def _douglas_peucker(pts, lo, hi, keep, tolerance):
+    # sets keep for the nodes strictly between each lo and hi that are
+    # needed to stay within tolerance of the straight path through pts
+    more = hi - lo > 1
+    lo, hi = lo[more], hi[more]
+    while len(lo) > 0:
+        inner = hi - lo - 1
+        idx = _ranges(lo + 1, inner)
+        owner = np.repeat(np.arange(len(lo)), inner)
+        aa = pts[lo][owner]
+        ab = pts[hi][owner] - aa
+        den = (ab * ab).sum(axis=1)
+        tt = ((pts[idx] - aa) * ab).sum(axis=1) / np.where(den > 0.0, den, 1.0)
+        near = aa + ab * np.clip(tt, 0.0, 1.0)[:, None]
+        dist = np.hypot(*(pts[idx] - near).T)
+        far = np.maximum.reduceat(dist, np.cumsum(inner) - inner)
+        hit = np.flatnonzero(dist == far[owner])
+        mid = idx[hit[np.unique(owner[hit], return_index=True)[1]]]
+        split = far > tolerance
+        mid = mid[split]
+        keep[mid] = True
+        lo = np.concatenate((lo[split], mid))
+        hi = np.concatenate((mid, hi[split]))
+        more = hi - lo > 1
+        lo, hi = lo[more], hi[more]
+
+def _merge_curved(pts, cp1, cp2, segs, mergeable, keep, tolerance):
+    # clears keep for mergeable nodes, adjusting the control points of the
+    # merged segments; segs are the start nodes of the curved segments
+    steps = np.arange(1, SIMPLIFY_SAMPLES + 1) / SIMPLIFY_SAMPLES
+    row = np.full(len(pts), -1)
+    row[segs] = np.arange(len(segs))
+    samples = bezier_point(pts[segs][:, None], cp2[segs][:, None],
+                           cp1[segs + 1][:, None], pts[segs + 1][:, None],
+                           steps[None, :, None])
+    tried = ~mergeable
+    while True:
+        kept = np.flatnonzero(keep)
+        pos = np.flatnonzero(~tried[kept])
+        if len(pos) < 1: break  #
+        block = np.ones(len(pos), dtype=bool)   # every other one of a block
+        block[1:] = pos[1:] != pos[:-1] + 1
+        first = np.maximum.accumulate(np.where(block, np.arange(len(pos)), 0))
+        pos = pos[(np.arange(len(pos)) - first) % 2 == 0]
+        uu, jj, vv = kept[pos - 1], kept[pos], kept[pos + 1]
+        
+        counts = (vv - uu) * SIMPLIFY_SAMPLES
+        smp = samples[row[_ranges(uu, vv - uu)]].reshape(-1, 2)
+        owner = np.repeat(np.arange(len(jj)), counts)
+        starts = np.cumsum(counts) - counts
+        prev = np.empty_like(smp)
+        prev[1:] = smp[:-1]
+        prev[starts] = pts[uu]
+        cum = np.cumsum(np.hypot(*(smp - prev).T))
+        base = np.concatenate(([0.0], cum))[starts]
+        total = cum[starts + counts - 1] - base
+        
+        # parameters: the handles at jj split the merged cubic
+        # where de Casteljau would have, the segments on each side share
+        # their part by length and each sample sits at its own parameter
+        nsegs = len(smp) // SIMPLIFY_SAMPLES
+        seglo = np.concatenate(([0.0], cum))[::SIMPLIFY_SAMPLES][:nsegs]
+        seglen = cum[SIMPLIFY_SAMPLES - 1::SIMPLIFY_SAMPLES] - seglo
+        along = (np.repeat(seglo, SIMPLIFY_SAMPLES) +
+                 np.tile(steps, nsegs) * np.repeat(seglen, SIMPLIFY_SAMPLES))
+        nleft = (jj - uu) * SIMPLIFY_SAMPLES
+        mid = cum[starts + nleft - 1]
+        lin = np.hypot(*(pts[jj] - cp1[jj]).T)
+        lout = np.hypot(*(cp2[jj] - pts[jj]).T)
+        ratio = (lin / np.where(lin + lout > 0.0, lin + lout, 1.0))[owner]
+        lolen, hilen = mid - base, base + total - mid
+        left = np.arange(len(smp)) - starts[owner] < nleft[owner]
+        tt = np.where(left, ratio * (along - base[owner]) / np.where(lolen > 0.0, lolen, 1.0)[owner],
+                      ratio + (1.0 - ratio) * (along - mid[owner]) / np.where(hilen > 0.0, hilen, 1.0)[owner])
+        
+        p0, p3 = pts[uu], pts[vv]
+        t1, t2 = cp2[uu] - p0, cp1[vv] - p3
+        n1, n2 = np.hypot(*t1.T), np.hypot(*t2.T)
+        t1 = t1 / np.where(n1 > 0.0, n1, 1.0)[:, None]
+        t2 = t2 / np.where(n2 > 0.0, n2, 1.0)[:, None]
+        mt = 1.0 - tt
+        b0, b1, b2, b3 = mt * mt * mt, 3.0 * mt * mt * tt, 3.0 * mt * tt * tt, tt * tt * tt
+        a1 = t1[owner] * b1[:, None]
+        a2 = t2[owner] * b2[:, None]
+        rest = smp - p0[owner] * (b0 + b1)[:, None] - p3[owner] * (b2 + b3)[:, None]
+        def summed(vals):
+            return np.bincount(owner, weights=vals.sum(axis=1), minlength=len(jj))
+        c11, c12, c22 = summed(a1 * a1), summed(a1 * a2), summed(a2 * a2)
+        x1, x2 = summed(a1 * rest), summed(a2 * rest)
+        # a zero-length end handle stays so and the other is fitted alone
+        det = c11 * c22 - c12 * c12
+        both = (det > 1e-12 * c11 * c22) & (n1 > 0.0) & (n2 > 0.0)
+        det = np.where(both, det, 1.0)
+        al1 = np.where(both, (x1 * c22 - x2 * c12) / det, x1 / np.where(c11 > 0.0, c11, 1.0))
+        al2 = np.where(both, (c11 * x2 - c12 * x1) / det, x2 / np.where(c22 > 0.0, c22, 1.0))
+        ok = (both | (n1 <= 0.0) | (n2 <= 0.0)) & (total > 0.0)
+        ok &= ((al1 > 0.0) | (n1 <= 0.0)) & ((al2 > 0.0) | (n2 <= 0.0))
+        h1 = p0 + t1 * al1[:, None]
+        h2 = p3 + t2 * al2[:, None]
+        fit = bezier_point(p0[owner], h1[owner], h2[owner], p3[owner], tt[:, None])
+        ok &= np.maximum.reduceat(np.hypot(*(fit - smp).T), starts) <= tolerance
+        
+        keep[jj[ok]] = False
+        tried[jj] = True
+        cp2[uu[ok]] = h1[ok]
+        cp1[vv[ok]] = h2[ok]
+
+def simplify_curves(objects, tolerance=0.01):
+    # fewer nodes for many curve dicts or Curves, within tolerance of the
+    # originals: a (points, control_point_1, control_point_2, point_type)
+    # tuple of arrays for each curve
+    if np is None: raise ImportError('curve simplification needs numpy')  #
+    cnt = len(objects)
+    pts, cp1, cp2, sizes = _curve_arrays(objects)[:4]
+    ptypes = []
+    for obj, size in zip(objects, sizes):
+        ptype = list(obj.get('point_type', []))[:size]
+        ptypes.append(ptype + [PT_CURVE] * (size - len(ptype)))
+    ptype = np.array([ptp for ptype in ptypes for ptp in ptype], dtype=int)
+    
+    nodes = len(pts)
+    ends = np.cumsum(sizes)
+    first = np.zeros(nodes, dtype=bool)
+    first[(ends - sizes)[sizes > 0]] = True
+    last = np.zeros(nodes, dtype=bool)
+    last[ends[sizes > 0] - 1] = True
+    nxt = np.minimum(np.arange(nodes) + 1, max(nodes - 1, 0))
+    straight = (~last & (cp2 == pts).all(axis=1) &
+                (cp1[nxt] == pts[nxt]).all(axis=1))
+    fixed = first | last | (ptype == PT_CLOSER)
+    fixed[1:] |= straight[1:] != straight[:-1]
+    
+    keep = fixed.copy()
+    marks = np.flatnonzero(fixed)
+    lo, hi = marks[:-1], marks[1:]
+    inside = ~last[lo]
+    lo, hi = lo[inside], hi[inside]
+    line = straight[lo]
+    _douglas_peucker(pts, lo[line], hi[line], keep, tolerance)
+    
+    lo, hi = lo[~line], hi[~line]
+    inner = _ranges(lo + 1, hi - lo - 1)
+    keep[inner] = True
+    vin = pts[inner] - cp1[inner]
+    vout = cp2[inner] - pts[inner]
+    cross = vin[:, 0] * vout[:, 1] - vin[:, 1] * vout[:, 0]
+    dot = (vin * vout).sum(axis=1)
+    smooth = (dot > 0.0) & (np.abs(cross) <= 1e-6 * dot)
+    mergeable = np.zeros(nodes, dtype=bool)
+    mergeable[inner] = smooth & (ptype[inner] != PT_POLY)
+    _merge_curved(pts, cp1, cp2, _ranges(lo, hi - lo), mergeable, keep, tolerance)
+    
+    owner = np.repeat(np.arange(cnt), sizes)
+    cuts = np.cumsum(np.bincount(owner[keep], minlength=cnt))[:-1]
+    parts = [np.split(arr[keep], cuts) for arr in (pts, cp1, cp2, ptype)]
+    return list(zip(*parts))
+
+# Uniform grid over object boxes for region and nearest queries.  Each
+# box is filed under every cell it overlaps; boxes covering more than
+# GRID_SPAN cells in a direction go on a list that every query checks.
+
+GRID_SPAN = 8
+
+def box_distance(box, xx, yy):
+    dx = max(box[0] - xx, 0.0, xx - box[2])
+    dy = max(box[1] - yy, 0.0, yy - box[3])
+    return math.hypot(dx, dy)
+
+class gridindex:
+    def __init__(self, cell):
+        self.cell = float(cell)
+        self.cells = {}
+        self.boxes = {}
+        self.big = set()
+        self.bounds = None          # occupied cell range
+    
+    @staticmethod
+    def sized_for(boxes):
+        # a cell size giving about one box per cell
+        boxes = [box for box in boxes if box is not None]
+        if len(boxes) < 1: return gridindex(1.0)  #
+        ext = extents()
+        sizes = []
+        for box in boxes:
+            ext.test(box[0], box[1])
+            ext.test(box[2], box[3])
+            sizes.append(max(box[2] - box[0], box[3] - box[1]))
+        sizes.sort()
+        lft, btm, rit, top = ext.extents()
+        spread = math.sqrt(max(rit - lft, 1e-9) * max(top - btm, 1e-9) / len(boxes))
+        return gridindex(max(sizes[len(sizes) // 2], spread, 1e-6))
+    
+    def _span(self, box):
+        cell = self.cell
+        return (math.floor(box[0] / cell), math.floor(box[1] / cell),
+                math.floor(box[2] / cell), math.floor(box[3] / cell))
+    
+    def insert(self, key, box):
+        if key in self.boxes: self.remove(key)  #
+        if box is None: return  #
+        self.boxes[key] = box
+        ix0, iy0, ix1, iy1 = self._span(box)
+        if ix1 - ix0 >= GRID_SPAN or iy1 - iy0 >= GRID_SPAN:
+            self.big.add(key)
+            return
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                self.cells.setdefault((ix, iy), set()).add(key)
+        if self.bounds is None:
+            self.bounds = [ix0, iy0, ix1, iy1]
+        else:
+            bnd = self.bounds
+            bnd[:] = (min(bnd[0], ix0), min(bnd[1], iy0),
+                      max(bnd[2], ix1), max(bnd[3], iy1))
+    
+    def remove(self, key):
+        box = self.boxes.pop(key, None)
+        if box is None: return  #
+        if key in self.big:
+            self.big.discard(key)
+            return
+        ix0, iy0, ix1, iy1 = self._span(box)
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                keys = self.cells.get((ix, iy))
+                if keys is not None:
+                    keys.discard(key)
+                    if len(keys) < 1: del self.cells[(ix, iy)]  #
+    
+    def query(self, lft, btm, rit, top):
+        found = set()
+        ix0, iy0, ix1, iy1 = self._span((lft, btm, rit, top))
+        if self.bounds is not None:
+            bnd = self.bounds
+            ix0, iy0 = max(ix0, bnd[0]), max(iy0, bnd[1])
+            ix1, iy1 = min(ix1, bnd[2]), min(iy1, bnd[3])
+            if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > len(self.cells):
+                for keys in self.cells.values():
+                    found.update(keys)
+            else:
+                for ix in range(ix0, ix1 + 1):
+                    for iy in range(iy0, iy1 + 1):
+                        found.update(self.cells.get((ix, iy), ()))
+        found.update(self.big)
+        rslt = []
+        for key in found:
+            box = self.boxes[key]
+            if (box[0] <= rit and box[2] >= lft and
+                    box[1] <= top and box[3] >= btm): rslt.append(key)  #
+        return rslt
+    
+    def _ring(self, cx, cy, rad):
+        bnd = self.bounds
+        for ix in range(max(cx - rad, bnd[0]), min(cx + rad, bnd[2]) + 1):
+            for iy in (cy - rad, cy + rad) if rad > 0 else (cy,):
+                if bnd[1] <= iy <= bnd[3]: yield (ix, iy)  #
+        for iy in range(max(cy - rad + 1, bnd[1]), min(cy + rad - 1, bnd[3]) + 1):
+            for ix in (cx - rad, cx + rad) if rad > 0 else ():
+                if bnd[0] <= ix <= bnd[2]: yield (ix, iy)  #
+    
+    def nearest(self, xx, yy, count=1):
+        # [(distance, key)] for the count boxes closest to (xx, yy)
+        best = {}
+        for key in self.big:
+            best[key] = box_distance(self.boxes[key], xx, yy)
+        if self.bounds is not None:
+            cx = math.floor(xx / self.cell)
+            cy = math.floor(yy / self.cell)
+            bnd = self.bounds
+            rad = max(bnd[0] - cx, cx - bnd[2], bnd[1] - cy, cy - bnd[3], 0)
+            last = max(cx - bnd[0], bnd[2] - cx, cy - bnd[1], bnd[3] - cy)
+            while rad <= last:
+                for cell in self._ring(cx, cy, rad):
+                    for key in self.cells.get(cell, ()):
+                        if key not in best:
+                            best[key] = box_distance(self.boxes[key], xx, yy)
+                # everything nearer than rad cells has now been seen
+                if len(best) >= count:
+                    dists = sorted(best.values())
+                    if dists[count - 1] <= rad * self.cell: break  #
+                rad += 1
+        rslt = sorted((dist, key) for key, dist in best.items())
+        return rslt[:count]
+
 # -----------------------------------------------------------
 
 class CNC:
     def __init__(self, filename=None, use_mm=True, width=340, height=280,
                  thickness=12.7, gridspacing=3, machine='XL',
-                 beta=CURR_BETA):
+                 beta=CURR_BETA, arrays=False, stream=False, compact=False,
+                 cache=False, uuids=None):
+        # uuids: a uuidsource or a seed for one; see uuidsource
         if filename is not None: filename = str(filename)  #
         if beta == 0: beta = EARLY_BETA  #
         machlbl = machine_label(machine)
@@ -198,16 +1633,29 @@ class CNC:
         self.content = {}
         self.indent = 4
         self.beta = beta
+        self.arrays = arrays
+        self.compact = compact
+        self.nextid = 1
+        self.uuids = as_uuidsource(uuids)
+        self._index = {}
+        self._names = None
+        self._links = None
+        self._boxes = {}
+        self._exttotal = None
+        self._grid = None
+        self._gridqueue = {}
+        self._offsets = {}
+        self._cow = False
+        self._owned = {}
+        self._saved = {}
 
         newfile = True
         if filename is not None:
-            newfile = not self.load(filename)
-        
-        allgr, idgr, namgr, uugr = beta_groups(self.beta)
-        self.cc_allgroups = allgr
-        self.cc_idgroups = idgr
-        self.cc_namegroups = namgr
-        self.cc_uuidgroups = uugr
+            newfile = not self.load(filename, stream, cache)
+        if newfile:
+            self._setgroups()
+        else:
+            self.fixbeta()              # the file decides, groups and all
         
         if newfile:
             self.beta = beta
@@ -238,26 +1686,162 @@ class CNC:
             for group in self.cc_allgroups:
                 if group != CC_VALUES:
                     self.content[group] = []
-        self.fixbeta()
+            self.fixbeta()
         
     def __str__(self):
         return ('CarbideCreate save file: %s (beta %s)' %
                 (self.filename, self.beta))
     
     def __repr__(self):
-        body = json.dumps(self.content, sort_keys=True, indent=self.indent).split('\n')
-        for pnt in range(len(body)):
-            lin = body[pnt]
-            if lin[-3:] == '[],':
-                ind = len(lin) - len(lin.lstrip(' '))
-                body[pnt] = lin[:-2] + '\n' + (' ' * ind) + '],'
-            elif lin[-2:] == '[]':
-                ind = len(lin) - len(lin.lstrip(' '))
-                body[pnt] = lin[:-1] + '\n' + (' ' * ind) + ']'
-        return str.join('\n', body) + '\n'
+        fout = io.StringIO()
+        self.write(fout)
+        return fout.getvalue()
+    
+    def write(self, fout):
+        write_c2d(fout, self.content, self.indent)
     
     def tighten(self):
         self.content = tight(self.content)
+        self._cow = False               # nothing is shared any more
+        self._owned = {}
+    
+    def pack_curves(self):
+        # switch CURVE_OBJECTS to array-backed coordinates
+        for obj in self._ownobjects(CC_CURVES, list(self.getgroup(CC_CURVES))):
+            pack_curve(obj)
+        self.arrays = True
+    
+    def unpack_curves(self):
+        for obj in self._ownobjects(CC_CURVES, list(self.getgroup(CC_CURVES))):
+            unpack_curve(obj)
+        self.arrays = False
+    
+    # Copy-on-write.  clone() gives a drawing that shares this one's group
+    # lists and object dicts, and marks both as _cow.  Before changing a
+    # shared list or dict, either drawing first swaps in its own copy
+    # (_owngroup, own_objects) and records it in _owned, so a clone costs
+    # memory only for what is changed.  own_objects copies deeply, and
+    # getobject, getanyobject and gettoolpath hand out owned objects, so
+    # what they return can be edited in place; objects reached through
+    # getgroup() need own_object() first.  Internal changes that replace
+    # nested values (obj['points'] = new), as transform does, get by
+    # with the shallow copies of _ownobjects.  mirror() hands out a
+    # drawing that owns all of itself (_ownall), so that neither it nor
+    # its source can reach the other through getgroup().
+    
+    def clone(self):
+        rslt = CNC(beta=self.beta, arrays=self.arrays, compact=self.compact,
+                   uuids=self.uuids)    # shared, so the two never clash
+        rslt.indent = self.indent
+        rslt.nextid = self.nextid
+        rslt.content = dict(self.content)
+        rslt._boxes = dict(self._boxes)
+        rslt._offsets = dict(self._offsets)
+        rslt._exttotal = self._exttotal
+        self._cow = rslt._cow = True
+        self._owned = {}                # all of it is shared now
+        return rslt
+    
+    def _owns(self, thing):
+        return self._owned.get(id(thing)) is thing
+    
+    def _owngroup(self, group):
+        # content[group] (list or dict), copied first if shared
+        objects = self.content.get(group)
+        if not self._cow or objects is None or self._owns(objects): return objects  #
+        new = copy.copy(objects)
+        self.content[group] = new
+        self._owned[id(new)] = new
+        entry = self._index.get(group)
+        if entry is not None and entry[0] is objects: entry[0] = new  #
+        entry = self._names
+        if group == CC_TOOLPATHS and entry is not None and entry[0] is objects: entry[0] = new  #
+        entry = self._links
+        if group == CC_PATHLINKS and entry is not None and entry[0] is objects: entry[0] = new  #
+        return new
+    
+    def _position(self, group, obj):
+        objects = self.getgroup(group)
+        key = objkey(obj)
+        pnt = -1 if key is None else self.findobject(group, key)
+        if pnt >= 0 and objects[pnt] is obj: return pnt  #
+        for pnt in range(len(objects)):
+            if objects[pnt] is obj: return pnt  #
+        return -1
+    
+    def own_objects(self, group, objs):
+        # writable versions of the dicts objs from group, each shared
+        # one replaced in the group by a deep copy of its own.  Their
+        # cached boxes and offsets are dropped, as they are about to change.
+        return self._ownobjects(group, objs, copy_json)
+    
+    def _ownobjects(self, group, objs, copier=copy.copy):
+        # own_objects with shallow copies, for changes that only replace
+        # the values of the objects
+        if not self._cow:
+            for obj in objs:
+                self.invalidate_extents(obj)
+            return objs
+        rslt = []
+        for obj in objs:
+            if not self._owns(obj):
+                objects = self._owngroup(group)
+                pnt = self._position(group, obj)
+                new = copier(obj)
+                self._owned[id(new)] = new
+                if pnt >= 0:
+                    objects[pnt] = new
+                    if group in self.cc_idgroups: self._gridmoved(obj, new, group)  #
+                obj = new
+            else:
+                self.invalidate_extents(obj)
+            rslt.append(obj)
+        self._exttotal = None
+        return rslt
+    
+    def own_object(self, group, obj):
+        return self.own_objects(group, [obj])[0]
+    
+    def _ownall(self):
+        # every group and object of a clone copied, so that it shares
+        # nothing with the drawing it came from
+        for group in list(self.content):
+            objects = self._owngroup(group)
+            if type(objects) is list:
+                self.own_objects(group, list(objects))
+            elif type(objects) is dict:
+                objects.update(copy_json(objects))
+    
+    def to_objects(self):
+        # hold every shape, toolpath and link as its CC_Object
+        for group in GROUP_CLASSES:
+            objects = self.content.get(group)
+            if type(objects) is list:
+                self.content[group] = [as_object(group, obj, self.beta)
+                                       for obj in objects]
+        self.compact = True
+        self._cow = False
+        self._owned = {}
+        self.reindex()
+        self.invalidate_extents()
+    
+    def to_dicts(self):
+        for group in GROUP_CLASSES:
+            objects = self.content.get(group)
+            if type(objects) is list:
+                self.content[group] = [obj.json_dict() if isinstance(obj, CC_Object)
+                                       else obj for obj in objects]
+        self.compact = False
+        self._cow = False
+        self._owned = {}
+        self.reindex()
+        self.invalidate_extents()
+    
+    def _newdict(self, obj):
+        # what add_object and update_object store: obj itself when compact
+        rslt = obj if self.compact else obj.obj_dict()
+        if self.arrays and obj.group == CC_CURVES: pack_curve(rslt)  #
+        return rslt
     
     def getvalue(self, key):
         vals = self.content[CC_VALUES]
@@ -269,58 +1853,161 @@ class CNC:
         except:
             return []
     
+    def _handout(self, group, obj):
+        # obj itself, or on a cloned drawing a copy it owns
+        if not self._cow or self._owns(obj): return obj  #
+        return self.own_objects(group, [obj])[0]
+    
     def getobject(self, group, ccid):
-        rslt = None
-        if group in self.content:
-            objects = self.content[group]
-            for obj in objects:
-                if 'id' in obj:
-                    objid = obj['id']
-                    if objid == ccid:
-                        rslt = obj
-                        break
-                elif 'uuid' in obj:
-                    objid = obj['uuid']
-                    if objid == ccid:
-                        rslt = obj
-                        break
-        return rslt
+        pnt = self.findobject(group, ccid)
+        return None if pnt < 0 else self._handout(group, self.content[group][pnt])
     
     def getanyobject(self, ccid):
         rslt = None
-        for group in self.cc_idgroups:
-            tmp = self.getobject(group, ccid)
-            if tmp is not None:
-                rslt = [group, tmp]
+        for group in self.cc_idgroups + self.cc_uuidgroups:
+            pnt = self.findobject(group, ccid)
+            if pnt >= 0:
+                rslt = [group, self._handout(group, self.content[group][pnt])]
                 break
-        if rslt is None:
-            for group in self.cc_uuidgroups:
-                tmp = self.getobject(group, ccid)
-                if tmp is not None:
-                    rslt = [group, tmp]
-                    break
         return rslt
     
     def gettoolpath(self, name):
-        rslt = None
+        pnt = self.findname(name)
+        return None if pnt < 0 else self._handout(CC_TOOLPATHS, self.content[CC_TOOLPATHS][pnt])
+    
+    # Object index: per-group maps of id/uuid -> list position, plus a
+    # lower-cased toolpath name -> position map.  Each map remembers the
+    # list it was built from and its length, so a group replaced or
+    # extended directly through self.content is re-scanned on the next
+    # lookup.  Call reindex() after editing ids or names in place.
+    
+    def reindex(self):
+        self._index = {}
+        self._names = None
+        self._links = None
+        for group in self.content:
+            if type(self.content[group]) is list: self._groupindex(group)  #
+    
+    def _groupindex(self, group):
+        objects = self.content.get(group)
+        if type(objects) is not list: return None  #
+        entry = self._index.get(group)
+        if (entry is None or entry[0] is not objects or
+                entry[1] != len(objects)):
+            keymap = {}
+            for pnt in range(len(objects)):
+                key = objkey(objects[pnt])
+                if key is not None and key not in keymap: keymap[key] = pnt  #
+            entry = [objects, len(objects), keymap]
+            self._index[group] = entry
+        return entry[2]
+    
+    def _nameindex(self):
+        objects = self.content.get(CC_TOOLPATHS)
+        if type(objects) is not list: return None  #
+        entry = self._names
+        if (entry is None or entry[0] is not objects or
+                entry[1] != len(objects)):
+            names = {}
+            high = {}
+            for pnt in range(len(objects)):
+                if 'name' in objects[pnt]:
+                    sname = objects[pnt]['name'].lower()
+                    if sname not in names: names[sname] = pnt  #
+                    count_label(high, sname)
+            entry = [objects, len(objects), names, high]
+            self._names = entry
+        return entry[2]
+    
+    def findobject(self, group, ccid):
+        # position of ccid in group, or -1
+        for retry in (False, True):
+            keymap = self._groupindex(group)
+            if keymap is None: return -1  #
+            pnt = keymap.get(ccid, -1)
+            if pnt < 0 or objkey(self.content[group][pnt]) == ccid:
+                return pnt
+            self._index.pop(group, None)    # stale, rebuild once
+        return -1
+    
+    def findname(self, name):
+        # position of the toolpath called name (any case), or -1
         sname = name.lower()
-        if CC_TOOLPATHS in self.content:
-            objects = self.content[CC_TOOLPATHS]
-            for obj in objects:
-                if 'name' in obj:
-                    objname = obj['name'].lower()
-                    if objname == sname:
-                        rslt = obj
-                        break
-        return rslt
+        for retry in (False, True):
+            names = self._nameindex()
+            if names is None: return -1  #
+            pnt = names.get(sname, -1)
+            if pnt < 0: return pnt  #
+            path = self.content[CC_TOOLPATHS][pnt]
+            if path.get('name', '').lower() == sname: return pnt  #
+            self._names = None              # stale, rebuild once
+        return -1
+    
+    def _indexedrange(self, group, start):
+        # _indexed for all of content[group] from start, appended at once
+        objects = self.content[group]
+        entry = self._index.get(group)
+        if entry is not None and entry[0] is objects and entry[1] == start:
+            keymap = entry[2]
+            for pnt in range(start, len(objects)):
+                key = objkey(objects[pnt])
+                if key is not None: keymap.setdefault(key, pnt)  #
+            entry[1] = len(objects)
+        entry = self._names
+        if (group == CC_TOOLPATHS and entry is not None and
+                entry[0] is objects and entry[1] == start):
+            for pnt in range(start, len(objects)):
+                if 'name' in objects[pnt]:
+                    entry[2].setdefault(objects[pnt]['name'].lower(), pnt)
+                    count_label(entry[3], objects[pnt]['name'])
+            entry[1] = len(objects)
+    
+    def _indexed(self, group, pnt):
+        # record content[group][pnt] in the maps, if they are current
+        objects = self.content[group]
+        obj = objects[pnt]
+        entry = self._index.get(group)
+        if entry is not None and entry[0] is objects:
+            if entry[1] == pnt == len(objects) - 1: entry[1] += 1  #
+            if entry[1] == len(objects):
+                key = objkey(obj)
+                if key is not None: entry[2].setdefault(key, pnt)  #
+        entry = self._names
+        if (group == CC_TOOLPATHS and entry is not None and
+                entry[0] is objects):
+            if entry[1] == pnt == len(objects) - 1: entry[1] += 1  #
+            if entry[1] == len(objects) and 'name' in obj:
+                entry[2].setdefault(obj['name'].lower(), pnt)
+                count_label(entry[3], obj['name'])
     
     def setvalue(self, valname, val):
-        vals = self.content[CC_VALUES]
+        vals = self._owngroup(CC_VALUES)
         vals[valname] = val
     
-    def load(self, filename):
+    def load(self, filename, stream=False, cache=False):
+        # with cache, reads filename's sidecar when it is current, and
+        # otherwise loads the file and writes one
         txt = ''
         if '.' not in filename: filename += '.c2d'  #
+        if cache:
+            found = read_cache(filename, self.arrays)
+            if found is not None:
+                self.content, self.beta, nextid = found
+                self.filename = filename
+                self._setgroups()
+                return self._loaded(nextid)
+            arrays = self.arrays        # cache the coordinates as parsed
+            self.arrays = False
+            try:
+                done = self.load(filename, stream)
+            finally:
+                self.arrays = arrays
+            if done:
+                self.fixbeta()
+                write_cache(self, filename)
+                if arrays: self.pack_curves()  #
+            return done
+        if stream: return self.loadstream(filename)  #
         try:
             fin = open(filename, 'r')
             txt = fin.read()
@@ -328,91 +2015,155 @@ class CNC:
             self.filename = filename
         except:
             print('Unable to load "%s"' % filename)
+            return False
         
-        return (len(txt) > 0) and self.loads(txt)
+        return self.loads(txt)
     
     def loads(self, txt):
-        self.content = json.loads(txt)
+        # ValueError, with content left as it was, for text that is not
+        # a drawing
+        content = json.loads(txt)
+        if type(content) is not dict: raise ValueError('Not a .c2d drawing')  #
+        self.content = content
+        if self.arrays: self.pack_curves()  #
+        return self._loaded()
+    
+    def loadstream(self, filename):
+        # builds content one object at a time, packing each curve as it
+        # arrives when self.arrays is set, so the file text is never held.
+        # Fails as load does: False for a file that cannot be read, and
+        # ValueError, with content left as it was, for one that is not a
+        # whole drawing.
+        if '.' not in filename: filename += '.c2d'  #
+        content = {}
+        try:
+            fin = open(filename, 'r')
+        except OSError:
+            print('Unable to load "%s"' % filename)
+            return False
+        with fin:
+            self.filename = filename
+            for group, obj in c2dreader(fin).events():
+                if obj is None:
+                    content[group] = []
+                elif type(content.get(group)) is list:
+                    if self.arrays and group == CC_CURVES: pack_curve(obj)  #
+                    content[group].append(obj)
+                else:
+                    content[group] = obj
         
-        if id_is_int(self.beta):
-            nextid = self.nextid
-            for group in self.cc_idgroups:
-                objects = self.content[group]
-                for obj in objects:
-                    if 'id' in obj:
-                        tmpid = obj['id']
-                        if tmpid >= nextid: nextid = tmpid + 1  #
+        self.content = content
+        return self._loaded()
+    
+    @staticmethod
+    def iter_objects(filename, groups=None):
+        # stream (group, object) pairs from a file without loading it
+        if '.' not in filename: filename += '.c2d'  #
+        with open(filename, 'r') as fin:
+            for group, obj in iter_c2d(fin, groups):
+                yield group, obj
+    
+    def _loaded(self, nextid=None):
+        self._cow = False
+        self._owned = {}
+        if self.compact:
+            if nextid is None: self.fixbeta()  #
+            self.to_objects()
+        if nextid is not None:          # known already: index lazily
+            self._index = {}
+            self._names = None
+            self._links = None
             self.nextid = nextid
+            return True
+        self.reindex()
+        
+        nextid = 1
+        for group in self._index:
+            for tmpid in self._index[group][2]:
+                if type(tmpid) is int and tmpid >= nextid: nextid = tmpid + 1  #
+        self.nextid = nextid
         return True
 
     def fixbeta(self):
-        possible = []
-        polytest = CC_POLYGONS in self.content
-        crvs = self.getgroup(CC_CURVES)
-        crv = None if len(crvs) < 1 else crvs[0]
-        contest = False
-        concount = 0
-        paths = self.getgroup(CC_TOOLPATHS)
-        for path in paths:
-            if 'contour' in path:
-                concount += 1
-                if len(path['contour']) > 0:
-                    contest = True
-                    break
-
-        idset = uuidset = None
-
-        for known in KNOWN_BETA:
-            #print('Testing beta %s' % known)
-            all_ok = has_polygons(known) == polytest
-            #if not all_ok: print('Failed poly test')  #
-            if all_ok and concount > 0:
-                all_ok = has_contour(known) == contest
-                #if not all_ok: print('Failed contour test')  #
-            if all_ok and crv is not None:
-                all_ok = ('closed' in crv) == has_closed_flag(known)
-                #if not all_ok: print('Failed closed curve test')  #
-                if all_ok:
-                    all_ok = ('point_type' in crv) == has_point_type(known)
-                    #if not all_ok: print('Failed point_type test')  #
-            if all_ok:
-                q,idset,qq,uuidset = beta_groups(known)
-                if has_uuid(known):
-                    all_ok = False
-                    for item in uuidset:
-                        if item in self.content:
-                            all_ok = True
-                            break
-                    #if not all_ok: print('Failed uuid test')  #
-            if all_ok:
-                idcount = 0
-                idtest = False
-                for group in idset:
-                    if group in self.content:
-                        objects = self.getgroup(group)
-                        for obj in objects:
-                            if 'id' in obj:
-                                idcount += 1
-                                idtest = (type(obj['id']) is int)
-                                break
-                        if idcount > 0: break
-                all_ok = (idcount < 1) or (id_is_int(known) == idtest)
-                #if not all_ok: print('Failed id_is_int test')  #
-            if all_ok: possible.append(known)  #
-        
-        self.beta = possible[-1] if len(possible) > 0 else 'BAD'
+        self.beta = detect_beta(self.content)
+        self._setgroups()
     
-    def save(self, filename=None):
+    def _setgroups(self):
+        allgr, idgr, namgr, uugr = beta_groups(self.beta)
+        self.cc_allgroups = allgr
+        self.cc_idgroups = idgr
+        self.cc_namegroups = namgr
+        self.cc_uuidgroups = uugr
+    
+    def save(self, filename=None, only_if_changed=False):
+        # True once written.  With only_if_changed, a file that already
+        # holds this content (same document_hash) is left untouched and
+        # False returned.
         if filename is None: filename = self.filename  #
         if '.' not in filename: filename += '.c2d'  #
 
+        digest = None
+        if only_if_changed:
+            digest = self.content_hash()
+            if self._filehash(filename) == digest: return False  #
         try:
-            fout = open(filename, 'w')
-            fout.write(self.__repr__())
-            fout.close()
+            with open(filename, 'w') as fout:
+                self.write(fout)
             if self.filename is None: self.filename = filename  #
+            if digest is not None:
+                self._saved[os.path.abspath(filename)] = (_file_stamp(filename), digest)
+            return True
         except:
-            pass
+            return False
+    
+    def _filehash(self, filename):
+        # document_hash of what filename holds now.  Known for files this
+        # drawing saved; others are read once per size and mtime.
+        stamp = _file_stamp(filename)
+        if stamp is None: return None  #
+        path = os.path.abspath(filename)
+        known = self._saved.get(path)
+        if known is not None and known[0] == stamp: return known[1]  #
+        other = CNC()
+        if not other.load(filename): return None  #
+        digest = other.content_hash()
+        self._saved[path] = (stamp, digest)
+        return digest
+    
+    def content_hash(self):
+        return document_hash(self.content)
+    
+    def object_hashes(self):
+        # {(group, key): object_hash} with keys as diff() reports them
+        rslt = {}
+        for group in self.content:
+            for key, obj in _keyed(self.content[group]).items():
+                rslt[(group, key)] = object_hash(obj)
+        return rslt
+    
+    def diff(self, other):
+        # what changed from this drawing to other, as lists of (group, key)
+        # pairs: key is an object's id or uuid, a toolpath's lower-cased
+        # name if it has neither, or the name of a value in CC_VALUES.
+        # Members shared with a clone are not hashed.
+        rslt = {'added': [], 'removed': [], 'modified': []}
+        groups = list(self.content)
+        groups += [group for group in other.content if group not in self.content]
+        for group in groups:
+            mine = self.content.get(group)
+            theirs = other.content.get(group)
+            if mine is theirs: continue  #
+            old = _keyed(mine)
+            new = _keyed(theirs)
+            for key in old:
+                if key not in new:
+                    rslt['removed'].append((group, key))
+                elif (old[key] is not new[key] and
+                      object_hash(old[key]) != object_hash(new[key])):
+                    rslt['modified'].append((group, key))
+            for key in new:
+                if key not in old: rslt['added'].append((group, key))  #
+        return rslt
     
     def content_summary(self):
         filename = self.filename
@@ -449,196 +2200,668 @@ class CNC:
         return rslt
     
     def unique_name(self, group, test='Unique 001'):
-        objects = self.content[group]
-        pathnames = []
-        for path in objects:
-            if 'name' in path: pathnames.append(path['name'].lower())  #
-        while test.lower() in pathnames:
-            test = nextlabel(test)
-        return test
+        # test, or a label for it that no member of group has yet (any case)
+        return free_label(test, *self._namesinuse(group))
+    
+    def _namesinuse(self, group):
+        # (lower-cased names, high-water numbers) of group: the name
+        # index's own for toolpaths
+        if group == CC_TOOLPATHS and self._nameindex() is not None:
+            return self._names[2], self._names[3]
+        pathnames = set()
+        high = {}
+        for path in self.getgroup(group):
+            if 'name' in path:
+                pathnames.add(path['name'].lower())
+                count_label(high, path['name'])
+        return pathnames, high
     
     def update_object(self, obj):
         group = obj.group
-        isdone = False
+        pnt = -1
         
         if group in self.cc_namegroups:
-            sname = obj.name.lower()
-            paths = self.content[group]
-            for pnt in range(len(paths)):
-                if paths[pnt]['name'].lower() == sname:
-                    paths[pnt] = obj.obj_dict()
-                    isdone = True
-                    break
-            
+            pnt = self.findname(obj.name)
         elif group in self.cc_idgroups:
-            ccid = obj.ccid
-            objects = self.content[group]
-            for pnt in range(len(objects)):
-                if objects[pnt]['id'] == ccid:
-                    objects[pnt] = obj.obj_dict()
-                    isdone = True
-                    break
-                
+            pnt = self.findobject(group, obj.ccid)
         elif group in self.cc_uuidgroups:
-            tuuid = obj.uuid
-            objects = self.content[group]
-            for pnt in range(len(objects)):
-                if objects[pnt]['uuid'] == tuuid:
-                    objects[pnt] = obj.obj_dict()
-                    isdone = True
-                    break
+            pnt = self.findobject(group, obj.uuid)
         
-        if not isdone:
+        if pnt >= 0:
+            old = self.content[group][pnt]
+            self._owngroup(group)[pnt] = self._newdict(obj)
+            self._indexed(group, pnt)
+            if group == CC_PATHLINKS: self._links = None  #
+            self._exttotal = None
+            if group in self.cc_idgroups:
+                self._gridmoved(old, self.content[group][pnt], group)
+        else:
             self.add_object(obj)
     
     def add_object(self, obj):
         group = obj.group
         
         if group == CC_VALUES:
-            self.content[CC_VALUES][obj.name] = obj.value
+            self._owngroup(CC_VALUES)[obj.name] = obj.value
+            return
+        elif group == CC_PATHLINKS:     # its uuid is the shape's id
+            self.add_pathlink(obj)
+            return
         elif group in self.cc_idgroups:
             if id_is_int(self.beta):
                 obj.ccid = self.nextid
                 self.nextid += 1
             else:
-                obj.ccid = newuuid()
+                obj.ccid = self.uuids()
         elif group in self.cc_namegroups:
             obj.name = self.unique_name(group, obj.name)
+            if has_uuid(self.beta) and not obj.uuid: obj.uuid = self.uuids()  #
         elif group in self.cc_uuidgroups:
-            obj.uuid = newuuid()
+            obj.uuid = self.uuids()
 
         if group not in self.content: self.content[group] = []  #
-        self.content[group].append(obj.obj_dict())
+        self._owngroup(group).append(self._newdict(obj))
+        self._indexed(group, len(self.content[group]) - 1)
+        if group in self.cc_idgroups:
+            self._exttotal = None
+            self._gridmoved(None, self.content[group][-1], group)
+    
+    # Bulk versions of add_object and update_object take CC_Objects, or
+    # dicts of the group given, in any mix.  Ids, uuids and unique names
+    # are handed out a block at a time and each group is extended once,
+    # with the indexes, link graph and spatial grid brought up to date in
+    # the same pass.  With owned, dicts (and the values of CC_Objects)
+    # are kept as they are instead of being copied, so the caller must
+    # not use them afterwards.
+    
+    def _stored(self, group, obj, owned):
+        # what add_objects keeps for obj, as _newdict does
+        if isinstance(obj, CC_Object):
+            if self.compact:
+                rslt = obj
+            else:
+                rslt = obj.json_dict() if owned else obj.obj_dict()
+        else:
+            rslt = obj if owned else copy_json(obj)
+            if self.compact: rslt = as_object(group, rslt, self.beta)  #
+        if self.arrays and group == CC_CURVES: pack_curve(rslt)  #
+        return rslt
+    
+    def _allocate(self, group, objs, owned, ids=None):
+        # objs as stored, with the ids (given, or fresh uuids), uuids or
+        # names add_object would give them (set on any CC_Objects among
+        # objs as well)
+        stored = [self._stored(group, obj, owned) for obj in objs]
+        keys = None
+        if group in self.cc_idgroups:
+            keys = ids if ids is not None else self.uuids.block(len(objs))
+            attr, key = 'ccid', 'id'
+        elif group in self.cc_namegroups:
+            names, high = self._namesinuse(group)
+            names, high = set(names), dict(high)
+            keys = []
+            for new in stored:
+                name = free_label(new.get('name', ''), names, high)
+                names.add(name.lower())
+                count_label(high, name)
+                keys.append(name)
+            attr, key = 'name', 'name'
+            if has_uuid(self.beta):
+                fresh = iter(self.uuids.block(len(objs)))
+                for obj, new in zip(objs, stored):
+                    if not new.get('uuid'):
+                        new['uuid'] = next(fresh)
+                        if isinstance(obj, CC_Object): obj.uuid = new['uuid']  #
+        if keys is not None:
+            for obj, new, val in zip(objs, stored, keys):
+                new[key] = val
+                if isinstance(obj, CC_Object): setattr(obj, attr, val)  #
+        return stored
+    
+    def add_objects(self, objs, group=None, owned=False):
+        # returns the objects as stored, group by group; values go into
+        # CC_VALUES and links are merged through link_shapes
+        bygroup = {}
+        ids = {}            # integer ids follow the order of objs
+        nextid = self.nextid
+        intids = id_is_int(self.beta)
+        for obj in objs:
+            grp = obj.group if isinstance(obj, CC_Object) else group
+            if grp is None: raise ValueError('Plain dicts need a group')  #
+            bygroup.setdefault(grp, []).append(obj)
+            if intids and grp in self.cc_idgroups:
+                ids.setdefault(grp, []).append(nextid)
+                nextid += 1
+        self.nextid = nextid
+        
+        rslt = []
+        for grp, members in bygroup.items():
+            if grp == CC_VALUES:
+                vals = self._owngroup(CC_VALUES)
+                for obj in members:
+                    if isinstance(obj, CC_Object):
+                        vals[obj.name] = obj.value
+                    else:
+                        vals.update(obj)
+            elif grp == CC_PATHLINKS:
+                paths = {}
+                for obj in members:
+                    for uupath in obj['links']:
+                        paths.setdefault(uupath, []).append(obj['uuid'])
+                for uupath, shapes in paths.items():
+                    self.link_shapes(uupath, shapes)
+            else:
+                stored = self._allocate(grp, members, owned, ids.get(grp))
+                if grp not in self.content: self.content[grp] = []  #
+                objects = self._owngroup(grp)
+                start = len(objects)
+                objects.extend(stored)
+                self._indexedrange(grp, start)
+                if grp in self.cc_idgroups:
+                    self._exttotal = None
+                    self._gridappended(grp, stored)
+                rslt.extend(stored)
+        return rslt
+    
+    def update_objects(self, objs, group=None, owned=False):
+        # members already in the drawing (by name, id or uuid) are
+        # replaced where they stand, the rest go to add_objects
+        missing = []
+        for obj in objs:
+            grp = obj.group if isinstance(obj, CC_Object) else group
+            pnt = -1
+            if grp in self.cc_namegroups:
+                pnt = self.findname(obj.get('name', ''))
+            elif grp in self.cc_idgroups or grp in self.cc_uuidgroups:
+                key = objkey(obj)
+                if key is not None: pnt = self.findobject(grp, key)  #
+            if pnt < 0:
+                missing.append(obj)
+                continue
+            objects = self._owngroup(grp)
+            old = objects[pnt]
+            objects[pnt] = self._stored(grp, obj, owned)
+            self._indexed(grp, pnt)
+            if grp == CC_PATHLINKS: self._links = None  #
+            if grp in self.cc_idgroups: self._gridmoved(old, objects[pnt], grp)  #
+        self._exttotal = None
+        self.add_objects(missing, group, owned)
     
     def add_pathlink(self, pathlink):
-        tuuid = pathlink['uuid']
-        links = pathlink['links']
-        uuset = self.getgroup(CC_PATHLINKS)
-        uuseek = True
-        for pnt in len(uuset):
-            if uuset[pnt]['uuid'] == tuuid:
-                linkset = uuset[pnt]['links']
-                for link in links:
-                    linkseek = True
-                    for ll in linkset:
-                        if link == ll:
-                            linkseek = False
-                            break
-                    if linkseek: linkset.append(link)  #
-                uuseek = False
-                break
-        if uuseek: uuset.append(pathlink)  #
-        return
+        for uupath in pathlink['links']:
+            self.link_shapes(uupath, [pathlink['uuid']])
+    
+    # Link graph: shape id -> toolpath uuids and toolpath uuid -> shape
+    # ids, as dicts used for ordered sets, built from toolpath_links on
+    # first use.  Like the object index it remembers the list it came
+    # from and its length.  A shape with several entries has them merged,
+    # and the graph notes it so unlink_shapes edits each of them.
+    # link_shapes and unlink_shapes change the graph and toolpath_links
+    # together; call reindex() after editing a link's 'links' in place.
+    
+    def _linkgraph(self):
+        objects = self.content.get(CC_PATHLINKS)
+        if type(objects) is not list: objects = []  #
+        entry = self._links
+        if (entry is None or entry[0] is not objects or
+                entry[1] != len(objects)):
+            shapes = {}
+            paths = {}
+            seen = set()
+            repeated = set()            # shapes with more than one entry
+            for link in objects:
+                uushape = link['uuid']
+                if uushape in seen: repeated.add(uushape)  #
+                seen.add(uushape)
+                for uupath in link['links']:
+                    shapes.setdefault(uushape, {})[uupath] = None
+                    paths.setdefault(uupath, {})[uushape] = None
+            entry = [objects, len(objects), shapes, paths, repeated]
+            self._links = entry
+        return entry
+    
+    def path_shapes(self, uupath):
+        # ids of the shapes a toolpath cuts, in link order (a live view)
+        return self._linkgraph()[3].get(uupath, {}).keys()
+    
+    def shape_paths(self, uushape):
+        # uuids of the toolpaths that cut a shape (a live view)
+        return self._linkgraph()[2].get(uushape, {}).keys()
+    
+    def link_shapes(self, uupath, shapes):
+        # links each shape id in shapes to the toolpath uupath; returns
+        # the number of new links
+        graph = self._linkgraph()
+        fresh = [uushape for uushape in dict.fromkeys(shapes)
+                 if uupath not in graph[2].get(uushape, {})]
+        if len(fresh) < 1: return 0  #
+        if CC_PATHLINKS not in self.content: self.content[CC_PATHLINKS] = []  #
+        objects = self._owngroup(CC_PATHLINKS)
+        found = [self.findobject(CC_PATHLINKS, uushape) for uushape in fresh]
+        owned = iter(self._ownobjects(CC_PATHLINKS,
+                                      [objects[pnt] for pnt in found if pnt >= 0]))
+        for uushape, pnt in zip(fresh, found):
+            if pnt >= 0:
+                link = next(owned)
+                link['links'] = list(link['links']) + [uupath]
+            else:
+                link = PathLink(source={'uuid': uushape, 'links': [uupath]},
+                                beta=self.beta)
+                objects.append(self._newdict(link))
+                self._indexed(CC_PATHLINKS, len(objects) - 1)
+            graph[2].setdefault(uushape, {})[uupath] = None
+            graph[3].setdefault(uupath, {})[uushape] = None
+        graph[0], graph[1] = objects, len(objects)
+        return len(fresh)
+    
+    def unlink_shapes(self, uupath, shapes=None):
+        # drops the links from the toolpath uupath to the shapes, or to
+        # all of its shapes; link entries left empty are removed.  Returns
+        # the number of links dropped.
+        graph = self._linkgraph()
+        linked = graph[3].get(uupath, {})
+        if shapes is None: shapes = list(linked)  #
+        gone = [uushape for uushape in dict.fromkeys(shapes) if uushape in linked]
+        if len(gone) < 1: return 0  #
+        objects = self._owngroup(CC_PATHLINKS)
+        found = [self.findobject(CC_PATHLINKS, uushape) for uushape in gone
+                 if uushape not in graph[4]]
+        repeated = graph[4].intersection(gone)
+        if len(repeated) > 0:           # every entry of these, not the first
+            found += [pnt for pnt in range(len(objects))
+                      if objects[pnt]['uuid'] in repeated and
+                      uupath in objects[pnt]['links']]
+        emptied = False
+        for link in self._ownobjects(CC_PATHLINKS, [objects[pnt] for pnt in found]):
+            link['links'] = [uu for uu in link['links'] if uu != uupath]
+            if len(link['links']) < 1: emptied = True  #
+        for uushape in gone:
+            paths = graph[2][uushape]
+            del paths[uupath]
+            if len(paths) < 1: del graph[2][uushape]  #
+            del linked[uushape]
+        if len(linked) < 1: graph[3].pop(uupath, None)  #
+        if emptied:
+            objects = [link for link in objects if len(link['links']) > 0]
+            self.content[CC_PATHLINKS] = objects
+            if self._cow: self._owned[id(objects)] = objects  #
+        graph[0], graph[1] = objects, len(objects)
+        return len(gone)
+    
+    def _groupsig(self):
+        # (group, list, length) for the shape groups.  The lists themselves
+        # are held, not their id()s, which a new list could be given once
+        # the old one is freed.
+        return tuple((group, self.content.get(group), len(self.getgroup(group)))
+                     for group in self.cc_idgroups)
+    
+    @staticmethod
+    def _samesig(old, new):
+        return (len(old) == len(new) and
+                all(was[1] is now[1] and was[2] == now[2]
+                    for was, now in zip(old, new)))
     
     def extents(self):
-        ext = extents()
-        
+        # Cached, with the box of each shape.  The methods that change
+        # shapes (add, update, transform, simplify_curves, own_object,
+        # getobject) drop what they touch; a replaced or resized group
+        # list is noticed here.  Only a shape edited in place without
+        # going through one of them needs invalidate_extents(obj).
+        sig = self._groupsig()
+        if self._exttotal is None or not self._samesig(self._exttotal[0], sig):
+            ext = extents()
+            boxes = {}
+            found = []
+            for group, obj, box in self.object_boxes():
+                boxes[id(obj)] = (obj, box)
+                if box is not None: found.append(box)  #
+            if len(found) > 0:
+                lft, btm, rit, top = zip(*found)
+                ext.test(min(lft), min(btm))
+                ext.test(max(rit), max(top))
+            self._boxes = boxes         # drops boxes of departed objects
+            self._exttotal = (sig, ext.extents())
+        return self._exttotal[1]
+    
+    def object_boxes(self):
+        # [group, object, (lft, btm, rit, top) or None] for every shape
+        rslt = []
+        cache = self._boxes
         for group in self.cc_idgroups:
             objects = self.getgroup(group)
+            misses = []
             for obj in objects:
-                if 'position' in obj:
-                    ox,oy = obj['position']
+                if cache.get(id(obj), (None,))[0] is not obj: misses.append(obj)  #
+            if len(misses) > 0:
+                for obj, box in zip(misses, bulk_extents(group, misses)):
+                    cache[id(obj)] = (obj, box)
+            for obj in objects:
+                rslt.append([group, obj, cache[id(obj)][1]])
+        return rslt
+    
+    def invalidate_extents(self, obj=None):
+        if obj is None:
+            self._boxes = {}
+            self._offsets = {}
+            self._grid = None
+        else:
+            self._boxes.pop(id(obj), None)
+            self._offsets.pop(id(obj), None)
+            if self._grid is not None and id(obj) in self._grid[2]:
+                self._gridqueue[id(obj)] = self._grid[2][id(obj)]
+        self._exttotal = None
+    
+    # Spatial queries go through a gridindex of the shape boxes, keyed by
+    # id() of the shape dicts (each held in the grid's shape map).  The
+    # methods that change shapes queue the shapes they touch, through
+    # _gridmoved or invalidate_extents(obj), and the grid catches up on
+    # the next query; it is rebuilt when a group list is replaced or
+    # resized behind its back.
+    
+    def _spatial(self):
+        counts = self._groupsig()
+        if self._grid is None or not self._samesig(self._grid[0], counts):
+            boxes = self.object_boxes()
+            grid = gridindex.sized_for([box for group, obj, box in boxes])
+            shapes = {}
+            for group, obj, box in boxes:
+                shapes[id(obj)] = (group, obj)
+                grid.insert(id(obj), box)
+            self._grid = [counts, grid, shapes]
+            self._gridqueue = {}
+        else:
+            counts, grid, shapes = self._grid
+            for key, pair in self._gridqueue.items():
+                if pair is None:
+                    grid.remove(key)
+                    shapes.pop(key, None)
                 else:
-                    ox = oy = 0.0
-                
-                if group == CC_CURVES:
-                    points = obj['points']
-                    for pnt in points:
-                        ext.test(ox + pnt[0], oy + pnt[1])
-                
-                elif group == CC_POLYGONS:
-                    rot = obj['rotation']
-                    dorot = rot != 0.0
-                    if dorot: set_rotation(rot)  #
-                    
-                    points = obj['points']
-                    for pnt in points:
-                        xx, yy = pnt
-                        if dorot: xx,yy = rotate(xx, yy)  #
-                        ext.test(ox + xx, oy + yy)
-                
-                elif group == CC_RECTS:
-                    wd2 = obj['width'] / 2
-                    hd2 = obj['height'] / 2
-                    rot = obj['rotation']
-                    dorot = rot != 0.0
-                    if dorot: set_rotation(rot)  #
-                    xx,yy = rotate(ox-wd2, oy-hd2)
-                    ext.test(xx, yy)
-                    xx,yy = rotate(ox+wd2, oy-hd2)
-                    ext.test(xx, yy)
-                    xx,yy = rotate(ox-wd2, oy+hd2)
-                    ext.test(xx, yy)
-                    xx,yy = rotate(ox-wd2, oy+hd2)
-                    ext.test(xx, yy)
-                
-                elif group == CC_TEXTS:
-                    width = obj['width']
-                    height = obj['height']
-                    if width < 0.0: 
-                        text = obj['text']
-                        width = len(text) * height * .7
-                    
-                    rot = obj['rotation']
-                    dorot = rot != 0.0
-                    if dorot: set_rotation(rot)  #
-                    
-                    ext.test(ox,oy)
-                    xx,yy = 0, height
-                    if dorot: xx,yy = rotate(xx,yy)  #
-                    ext.test(ox+xx, oy+yy)
-                    xx,yy = width, 0
-                    if dorot: xx,yy = rotate(xx,yy)  #
-                    ext.test(ox+xx, oy+yy)
-                    xx,yy = width, height
-                    if dorot: xx,yy = rotate(xx,yy)  #
-                    ext.test(ox+xx, oy+yy)
-                    
-                if group == CC_CIRCLES or group == CC_REGPOLYS:
-                    rad = obj['radius']
-                    ext.test(ox-rad, oy-rad)
-                    ext.test(ox+rad, oy+rad)
-                
-        return ext.extents()
+                    group, obj = pair
+                    shapes[key] = pair
+                    grid.insert(key, self._box(group, obj))
+            self._gridqueue = {}
+        return self._grid[1]
     
-    def mirror(self):
-        rslt = CNC(beta=self.beta)
-        rslt.content = copy.deepcopy(self.content)
-        
-        width = rslt.getvalue('WIDTH')
+    def _gridmoved(self, old=None, new=None, group=None):
+        # queue grid changes: old leaves the grid, new (of group) enters
+        if self._grid is None: return  #
+        if old is not None: self._gridqueue[id(old)] = None  #
+        if new is not None:
+            self._gridqueue[id(new)] = (group, new)
+        if old is None:                 # an append: expect the longer group
+            self._grid[0] = tuple((grp, lst, cnt + (grp == group))
+                                  for grp, lst, cnt in self._grid[0])
+    
+    def _gridappended(self, group, objs):
+        # _gridmoved for objs appended to group all at once
+        if self._grid is None: return  #
+        for obj in objs:
+            self._gridqueue[id(obj)] = (group, obj)
+        self._grid[0] = tuple((grp, lst, cnt + (len(objs) if grp == group else 0))
+                              for grp, lst, cnt in self._grid[0])
+    
+    def _box(self, group, obj):
+        found = self._boxes.get(id(obj))
+        if found is None or found[0] is not obj:
+            found = (obj, bulk_extents(group, [obj])[0])
+            self._boxes[id(obj)] = found
+        return found[1]
+    
+    def query_region(self, lft, btm, rit, top):
+        # [group, object] for each shape whose box meets the rectangle
+        grid = self._spatial()
+        shapes = self._grid[2]
+        return [list(shapes[key]) for key in grid.query(lft, btm, rit, top)]
+    
+    def nearest(self, xx, yy, k=1):
+        # [group, object, distance] for the k shapes whose boxes are
+        # closest to the point, nearest first
+        grid = self._spatial()
+        shapes = self._grid[2]
+        return [list(shapes[key]) + [dist] for dist, key in grid.nearest(xx, yy, k)]
+    
+    def toolpath_shapes(self, path):
+        # [group, object] for each shape a toolpath cuts: toolpath_links
+        # in beta 286, the toolpath's own contour ids before that
+        if has_contour(self.beta):
+            ccids = path.get('contours', [])
+        else:
+            ccids = self.path_shapes(path.get('uuid'))
+        rslt = []
+        for ccid in ccids:
+            for group in self.cc_idgroups:
+                pnt = self.findobject(group, ccid)
+                if pnt >= 0:
+                    rslt.append([group, self.content[group][pnt]])
+                    break
+        return rslt
+    
+    def toolpath_offsets(self, path, tolerance=None, cache=True):
+        # [group, object, polylines] for each shape a toolpath cuts, from
+        # CarbideOffset.shape_offsets with the toolpath's tool, offset and
+        # stepover.  Kept per shape and tool settings like the extents
+        # boxes, until update_object, transform or invalidate_extents(obj),
+        # so the drawing holds the polylines of every toolpath asked for;
+        # with cache False what is already kept is used but nothing new
+        # is added.  The shapes missing are worked out a group at a time
+        # with bulk_offsets.
+        import CarbideOffset            # it builds on this module
+        if tolerance is None: tolerance = path.get('tolerance') or 0.01  #
+        direction = path.get('ofset_dir', OFF_NONE)
+        diameter = path.get('tool', {}).get('diameter', 0.0)
+        stepover = path.get('stepover', 0.0) if direction == OFF_POCKET else 0.0
+        key = (diameter, direction, stepover, tolerance)
+        shapes = self.toolpath_shapes(path)
+        done = {}                       # id(obj) -> polylines
+        missing = {}
+        for group, obj in shapes:
+            found = self._offsets.get(id(obj))
+            if found is not None and found[0] is obj and key in found[1]:
+                done[id(obj)] = found[1][key]
+            else:
+                missing.setdefault(group, {})[id(obj)] = obj
+        for group, objs in missing.items():
+            objs = list(objs.values())
+            for obj, lines in zip(objs, CarbideOffset.bulk_offsets(
+                    group, objs, diameter, direction, stepover, tolerance)):
+                done[id(obj)] = lines
+                if not cache: continue  #
+                found = self._offsets.get(id(obj))
+                if found is None or found[0] is not obj:
+                    found = self._offsets[id(obj)] = (obj, {})
+                found[1][key] = lines
+        return [[group, obj, done[id(obj)]] for group, obj in shapes]
+    
+    def machining_time(self, rapid=RAPID_RATE):
+        # Estimates cut length and time for every toolpath, in drawing
+        # units and minutes.  Each shape is cut once per stepdown pass;
+        # inside and outside profiles of closed shapes lose or gain the
+        # tool's circumference, pockets add area / stepover of clearing
+        # to the inside profile.  Each shape costs a plunge to full depth,
+        # a retract at the rapid rate and a rapid move from the last one.
+        # Texts are counted in 'unmeasured' but not timed.
+        retract = abs(self.getvalue('RETRACT') or 0.0)
+        linked = {}
+        paths = []
+        for path in self.getgroup(CC_TOOLPATHS):
+            shapes = self.toolpath_shapes(path)
+            paths.append((path, shapes))
+            for group, obj in shapes:
+                linked.setdefault(group, {})[id(obj)] = obj
+        measures = {}
+        for group in linked:
+            objs = list(linked[group].values())
+            for obj, item in zip(objs, zip(*shape_measures(group, objs))):
+                measures[id(obj)] = item
         
-        for group in rslt.cc_idgroups:
-            objects = rslt.getgroup(group)
-            for obj in objects:
-                obj['position'][0] = width - obj['position'][0]
-                
-                if group == CC_CIRCLES:
-                    pass    # no other changes needed
-                
-                elif group == CC_CURVES:
-                    points = obj['points']
-                    for pnt in points:
-                        pnt[0] = -pnt[0]
-                    cp1s = obj['control_point_1'] 
-                    for cp1 in cp1s:
-                        cp1[0] = -cp1[0]
-                    cp2s = obj['control_point_2'] 
-                    for cp2 in cp2s:
-                        cp2[0] = -cp2[0]
-                
-                elif group == CC_POLYGONS:
-                    obj['rotations'] = 180.0 - obj['rotatation']
-                    points = obj['points']
-                    for pnt in points:
-                        pnt[0] = -pnt[0]
-                
-                elif group in (CC_RECTS, CC_REGPOLYS, CC_TEXTS):
-                    obj['rotations'] = 180.0 - obj['rotatation']
+        rslt = {'toolpaths': [], 'length': 0.0, 'minutes': 0.0}
+        for path, shapes in paths:
+            speeds = path.get('speeds', {})
+            feed = speeds.get('feedrate', 0.0)
+            plungerate = speeds.get('plungerate', 0.0) or feed
+            depth = abs(path.get('end_depth', 0.0) - path.get('start_depth', 0.0))
+            stepdown = path.get('stepdown', 0.0)
+            passes = max(1, math.ceil(depth / stepdown - 1e-9)) if stepdown > 0 else 1
+            offset = path.get('ofset_dir', OFF_NONE)
+            rad = path.get('tool', {}).get('diameter', 0.0) / 2
+            stepover = path.get('stepover', 0.0)
+            
+            length = 0.0
+            travel = 0.0
+            unmeasured = 0
+            last = None
+            for group, obj in shapes:
+                perim, area, closed = measures[id(obj)]
+                if perim is None:
+                    unmeasured += 1
+                    continue
+                if closed and offset == OFF_OUTSIDE:
+                    perim += 2 * math.pi * rad
+                elif closed and offset in (OFF_INSIDE, OFF_POCKET):
+                    perim = max(0.0, perim - 2 * math.pi * rad)
+                if closed and offset == OFF_POCKET and stepover > 0:
+                    perim += area / stepover
+                length += perim
+                box = self._box(group, obj)
+                if box is not None:
+                    here = ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+                    if last is not None: travel += math.hypot(here[0] - last[0], here[1] - last[1])  #
+                    last = here
+            count = len(shapes) - unmeasured
+            cutlen = passes * length
+            cut = cutlen / feed if feed > 0 else 0.0
+            plunge = count * depth / plungerate if plungerate > 0 else 0.0
+            moves = (2 * count * retract + travel) / rapid if rapid > 0 else 0.0
+            entry = {'name': path.get('name'), 'uuid': path.get('uuid'),
+                     'enabled': path.get('enabled', True), 'shapes': count,
+                     'unmeasured': unmeasured, 'passes': passes,
+                     'length': length, 'cut_length': cutlen,
+                     'cut': cut, 'plunge': plunge, 'rapid': moves,
+                     'minutes': cut + plunge + moves}
+            rslt['toolpaths'].append(entry)
+            if entry['enabled']:
+                rslt['length'] += cutlen
+                rslt['minutes'] += entry['minutes']
         return rslt
     
+    def transform(self, matrix, objects=None):
+        # Applies an affine matrix to the shapes with the given ids/uuids,
+        # or to every shape.  Positions take the full matrix; curve and
+        # polygon points, held relative to the position, take its linear
+        # part.  Rects, regular polygons and texts get their rotation from
+        # where the matrix sends their x axis and their size from how far
+        # it stretches their axes (exact for moves, turns, mirrors and
+        # uniform scaling).  Uses no shared state, so separate drawings
+        # can be transformed from separate threads.
+        selected = {}
+        if objects is None:
+            for group in self.cc_idgroups:
+                if len(self.getgroup(group)) > 0: selected[group] = list(self.getgroup(group))  #
+        else:
+            for ccid in objects:
+                found = self.getanyobject(ccid)
+                if found is not None: selected.setdefault(found[0], []).append(found[1])  #
+        
+        aa, bb, cc, dd, tx, ty = matrix
+        linear = (aa, bb, cc, dd, 0.0, 0.0)
+        turned = linear != IDENTITY
+        scale = math.sqrt(abs(aa*dd - bb*cc))
+        
+        for group in selected:
+            objs = self._ownobjects(group, selected[group])
+            positions = transform_points(matrix, [obj['position'] for obj in objs])
+            for obj, pos in zip(objs, positions):
+                obj['position'] = pos
+                self.invalidate_extents(obj)
+            if not turned: continue  #
+            
+            if group == CC_CURVES:
+                for key in CURVE_ARRAYS:
+                    keyed = [obj for obj in objs if key in obj]
+                    moved = _transform_all(linear, [obj[key] for obj in keyed])
+                    for obj, pts in zip(keyed, moved):
+                        obj[key] = pts
+            
+            elif group == CC_POLYGONS:
+                for obj in objs:    # keep the rotation, re-express the points
+                    back = matrix_rotate(-obj['rotation'])
+                    local = matrix_multiply(matrix_rotate(obj['rotation']), linear)
+                    obj['points'] = transform_points(matrix_multiply(local, back),
+                                                     obj['points'])
+            
+            elif group in (CC_CIRCLES, CC_REGPOLYS):
+                for obj in objs:
+                    obj['radius'] = whole_number(obj['radius'] * scale)
+                    if group == CC_REGPOLYS:
+                        rot = math.radians(obj['rotation'])
+                        xx, yy = math.cos(rot), math.sin(rot)
+                        obj['rotation'] = whole_number(math.degrees(
+                            math.atan2(cc*xx + dd*yy, aa*xx + bb*yy)))
+            
+            elif group in (CC_RECTS, CC_TEXTS):
+                for obj in objs:
+                    rot = math.radians(obj['rotation'])
+                    xx, yy = math.cos(rot), math.sin(rot)
+                    axx, axy = aa*xx + bb*yy, cc*xx + dd*yy
+                    ayx, ayy = -aa*yy + bb*xx, -cc*yy + dd*xx
+                    obj['rotation'] = whole_number(math.degrees(math.atan2(axy, axx)))
+                    if obj['width'] >= 0.0:
+                        obj['width'] = whole_number(obj['width'] * math.hypot(axx, axy))
+                    obj['height'] = whole_number(obj['height'] * math.hypot(ayx, ayy))
+        return self
+    
+    def simplify_curves(self, tolerance=0.01, objects=None):
+        # simplify_curves over the curves with the given ids, or all of
+        # them; returns the curve and node counts before and after
+        if objects is None:
+            curves = list(self.getgroup(CC_CURVES))
+        else:
+            curves = [self.getobject(CC_CURVES, ccid) for ccid in objects]
+            curves = [obj for obj in curves if obj is not None]
+        simple = simplify_curves(curves, tolerance)
+        before = sum(len(obj['points']) for obj in curves)
+        changed = [pnt for pnt in range(len(curves))
+                   if len(simple[pnt][0]) < len(curves[pnt]['points'])]
+        objs = self._ownobjects(CC_CURVES, [curves[pnt] for pnt in changed])
+        for obj, pnt in zip(objs, changed):
+            pts, cp1, cp2, ptype = simple[pnt]
+            packed = is_array(obj['points'])
+            obj['points'] = pts if packed else pts.tolist()
+            obj['control_point_1'] = cp1 if packed else cp1.tolist()
+            obj['control_point_2'] = cp2 if packed else cp2.tolist()
+            if 'point_type' in obj: obj['point_type'] = ptype.tolist()  #
+            self.invalidate_extents(obj)
+        return {'curves': len(curves), 'changed': len(changed), 'points': before,
+                'kept': sum(len(simple[pnt][0]) for pnt in range(len(curves)))}
+    
+    def mirror(self):
+        # a drawing of its own: edits to either one never reach the other
+        cow, owned = self._cow, self._owned
+        rslt = self.clone()
+        rslt._ownall()
+        self._cow, self._owned = cow, owned     # nothing of it is shared now
+        width = rslt.getvalue('WIDTH')
+        return rslt.transform(matrix_mirror(width / 2))
+    
 # ----------------------------------------------------------------------
 
-class CC_Object:
+# Shapes, toolpaths and links are __slots__ objects that also read and
+# write like the dicts of a .c2d file (obj['radius'], 'id' in obj,
+# obj.get(...)) through _fields, their (file key, attribute) pairs.  A
+# key is present when its attribute is set; keys a class does not know
+# are kept in extra.  A CNC made with compact=True holds these objects
+# in place of dicts and only turns them into JSON as it writes them.
+
+class CC_Object(collections.abc.MutableMapping):
+    __slots__ = ('beta', 'group', 'position', 'ccid', 'extra')
+    _fields = ()
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._attrs = dict(cls._fields)
+        cls._allslots = tuple(slot for klass in cls.__mro__
+                              for slot in klass.__dict__.get('__slots__', ()))
+    
     def __init__(self, group, position=None, beta=CURR_BETA):
         if position is not None:
             try:
@@ -652,9 +2875,7 @@ class CC_Object:
         self.group = group
         self.position = position
         self.ccid = 0 if id_is_int(beta) else '?'
-        self.name = ''
-        self.uuid = ''
-        self.value = 0
+        self.extra = None
     
     def __str__(self):
         group = self.group
@@ -663,19 +2884,101 @@ class CC_Object:
         if group in idgrp:
             rslt = self.ccid
         elif group == CC_VALUES:
-            rslt = '%s = %s' % (self.name, self.value)
+            rslt = '%s = %s' % (getattr(self, 'name', ''), getattr(self, 'value', 0))
         elif self.group in namegrp:
-            rslt = self.name
+            rslt = getattr(self, 'name', '')
         elif group in uuidgrp:
-            rslt = str(self.uuid)
+            rslt = str(getattr(self, 'uuid', ''))
         else:
             rslt = '(Unknown)'
         return '%s: %s' % (group, rslt)
     
+    def __getitem__(self, key):
+        attr = self._attrs.get(key)
+        if attr is not None:
+            try:
+                return getattr(self, attr)
+            except AttributeError:
+                pass
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+    
+    def __setitem__(self, key, val):
+        attr = self._attrs.get(key)
+        if attr is not None:
+            setattr(self, attr, val)
+        else:
+            if self.extra is None: self.extra = {}  #
+            self.extra[key] = val
+    
+    def __delitem__(self, key):
+        attr = self._attrs.get(key)
+        if attr is not None and hasattr(self, attr):
+            delattr(self, attr)
+        elif attr is None and self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+    
+    def __contains__(self, key):
+        attr = self._attrs.get(key)
+        if attr is not None: return hasattr(self, attr)  #
+        return self.extra is not None and key in self.extra
+    
+    def __iter__(self):
+        for key, attr in self._fields:
+            if hasattr(self, attr): yield key  #
+        if self.extra is not None:
+            for key in self.extra:
+                yield key
+    
+    def __len__(self):
+        return sum(1 for key in self)
+    
+    # Still compared, hashed and truth-tested as objects, not as the
+    # mappings they read like; compare contents with object_hash().
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+    
+    def __bool__(self):
+        return True
+    
+    def __copy__(self):
+        rslt = type(self).__new__(type(self))
+        for slot in self._allslots:
+            if hasattr(self, slot): setattr(rslt, slot, getattr(self, slot))  #
+        if self.extra is not None: rslt.extra = dict(self.extra)  #
+        return rslt
+    
+    def _blank(self):
+        # start of an object filled in from a dict by as_object
+        pass
+    
+    def _filled(self):
+        pass
+    
+    def json_dict(self):
+        # the object as a .c2d dict, sharing its values
+        return dict(self.items())
+    
     def obj_dict(self):
-        return {}
+        return copy_json(self.json_dict())
+
+class Value(CC_Object):
+    __slots__ = ('name', 'value')
+    _fields = (('name', 'name'), ('value', 'value'))
+    
+    def __init__(self, name='', value=0, beta=CURR_BETA):
+        super().__init__(CC_VALUES, None, beta)
+        self.name = name
+        self.value = value
     
 class Circle(CC_Object):
+    __slots__ = ('radius', )
+    _fields = (('id', 'ccid'), ('position', 'position'), ('radius', 'radius'))
+    
     def __init__(self, position=None, radius=None, source=None,
                  beta=CURR_BETA):
         group = CC_CIRCLES
@@ -694,17 +2997,15 @@ class Circle(CC_Object):
     def __str__(self):
         return ('Circle, At %s, Radius %5.3f, ID: %s' % 
                 (self.position, self.radius, self.ccid))
-    
-    def obj_dict(self):
-        return {
-            "id": self.ccid,
-            "position": self.position,
-            "radius": self.radius
-        }
 
 class Curve(CC_Object):
+    __slots__ = ('points', 'cp1', 'cp2', 'pt', 'closed', 'ispoly')
+    _fields = (('id', 'ccid'), ('position', 'position'), ('points', 'points'),
+               ('control_point_1', 'cp1'), ('control_point_2', 'cp2'),
+               ('closed', 'closed'), ('point_type', 'pt'))
+    
     def __init__(self, position=None, ispoly=False, source=None,
-                 beta=CURR_BETA):
+                 beta=CURR_BETA, arrays=False):
         group = CC_CURVES
         
         super().__init__(group, position, beta)
@@ -712,6 +3013,31 @@ class Curve(CC_Object):
             curve_286(self, ispoly, source)
         else:
             curve_285(self, source)
+        if arrays: self.pack()  #
+    
+    def pack(self):
+        self.points = pack_points(self.points)
+        self.cp1 = pack_points(self.cp1)
+        self.cp2 = pack_points(self.cp2)
+    
+    def unpack(self):
+        self.points = unpack_points(self.points)
+        self.cp1 = unpack_points(self.cp1)
+        self.cp2 = unpack_points(self.cp2)
+    
+    def is_packed(self):
+        return is_array(self.points)
+    
+    def simplify(self, tolerance=0.01):
+        # simplify_curves on this curve alone; returns the nodes removed
+        pts, cp1, cp2, ptype = simplify_curves([self], tolerance)[0]
+        removed = len(self.points) - len(pts)
+        if removed > 0:
+            packed = self.is_packed()
+            self.points, self.cp1, self.cp2 = pts, cp1, cp2
+            if not packed: self.unpack()  #
+            if has_point_type(self.beta): self.pt = ptype.tolist()  #
+        return removed
     
     def __str__(self):
         wants_closed = has_closed_flag(self.beta)
@@ -736,13 +3062,18 @@ class Curve(CC_Object):
             cp2x, cp2y = cp1x
             cp1x, cp1y = aty
             atx, aty = atx
+        
+        # A packed curve goes back to lists to grow, and stays that way
+        # until pack() or until it is stored in an arrays drawing, so
+        # building one point by point costs no repacking.
+        if self.is_packed(): self.unpack()  #
 
         self.points.append([atx,aty])
         self.cp1.append([cp1x,cp1y])
         self.cp2.append([cp2x,cp2y])
         
         if has_point_type(self.beta):
-            if (len(self.points) > 0 and atx == self.points[0][0] and
+            if (len(self.points) > 1 and atx == self.points[0][0] and
                 aty == self.points[0][1]):
                 ptype = PT_CLOSER
             elif self.ispoly:
@@ -757,6 +3088,8 @@ class Curve(CC_Object):
         ptype = PT_POLY if hasptype and ispoly else PT_CURVE
         
         self.ispoly = ispoly
+        packed = self.is_packed()
+        if packed: self.unpack()  #
         
         cnt = len(self.points)
         if cnt < 1:
@@ -774,7 +3107,7 @@ class Curve(CC_Object):
                 self.cp2 = self.cp2[:cnt]
             elif len(self.cp2) < cnt:
                 for pnt in range(len(self.cp2), cnt):
-                    self.cp1.append([self.points[pnt][0],self.points[pnt][1]])
+                    self.cp2.append([self.points[pnt][0],self.points[pnt][1]])
             if hasptype:
                 if len(self.pt) > cnt:
                     self.pt = self.pt[:cnt]
@@ -796,23 +3129,17 @@ class Curve(CC_Object):
                     self.cp1[pnt][0] = self.cp1[pnt][0]
                     self.cp1[pnt][1] = self.cp1[pnt][1]
                     self.cp2[pnt][0] = self.cp2[pnt][0]
-                    self.cp2[pnt][1] = self.cp2[pnt][0]
+                    self.cp2[pnt][1] = self.cp2[pnt][1]
                 if hasptype:
                     self.pt[pnt] = ptype
             if hasptype and self.points[0] == self.points[-1]:
                 self.pt[-1] = PT_CLOSER
-        
-    def obj_dict(self):
-        rslt = {
-            "id": self.ccid,
-            "position": self.position,
-            "points": copy.deepcopy(self.points),
-            "control_point_1": copy.deepcopy(self.cp1),
-            "control_point_2": copy.deepcopy(self.cp2)
-        }
-        
-        if has_closed_flag(self.beta): rslt["closed"] = self.closed  #
-        if has_point_type(self.beta): rslt["point_type"] = self.pt  #
+        if packed: self.pack()  #
+
+    def _filled(self):
+        ptypes = self.get('point_type', [])
+        self.ispoly = (len(ptypes) > 0 and
+                       all(ptype in (PT_POLY, PT_CLOSER) for ptype in ptypes))
 
 def curve_286(crv286, ispoly, src286=None):
     if crv286.beta != '286':
@@ -857,6 +3184,10 @@ def curve_285(crv285, src285):
         crv285.cp2 = copy.deepcopy(src285.cp2)
 
 class Polygon(CC_Object):       # only use prior to beta 286
+    __slots__ = ('points', 'rotation')
+    _fields = (('id', 'ccid'), ('position', 'position'), ('points', 'points'),
+               ('rotation', 'rotation'))
+    
     def __init__(self, position=None, rotation=None, source=None,
                  beta=CURR_BETA):
         group = CC_POLYGONS
@@ -884,16 +3215,12 @@ class Polygon(CC_Object):       # only use prior to beta 286
         if aty is None:
             atx, aty = atx
         self.points.append([atx,aty])
-        
-    def obj_dict(self):
-        return {
-            "id": self.ccid,
-            "position": self.position,
-            "points": copy.deepcopy(self.points),
-            "rotation": self.rotation
-        }
-    
+
 class Rect(CC_Object):
+    __slots__ = ('width', 'height', 'rotation')
+    _fields = (('id', 'ccid'), ('position', 'position'), ('width', 'width'),
+               ('height', 'height'), ('rotation', 'rotation'))
+    
     def __init__(self, position=None, width=None, height=None, rotation=None,
                  source=None, beta=CURR_BETA):
         group = CC_RECTS
@@ -918,17 +3245,13 @@ class Rect(CC_Object):
         return ('Rectangle, At %s, %5.3fw x %5.3fh, Rotation %5.3f, ID: %s' %
                 (self.position, self.width, self.height,
                  self.rotation, self.ccid))
-    
-    def obj_dict(self):
-        return {
-            "id": self.ccid,
-            "position": self.position,
-            "width": self.width,
-            "height": self.height,
-            "rotation": self.rotation
-        }
 
 class RegPoly(CC_Object):
+    __slots__ = ('num_sides', 'radius', 'rotation')
+    _fields = (('id', 'ccid'), ('position', 'position'),
+               ('num_sides', 'num_sides'), ('radius', 'radius'),
+               ('rotation', 'rotation'))
+    
     def __init__(self, position=None, num_sides=None, radius=None,
                  rotation=None, source=None, beta=CURR_BETA):
         group = CC_REGPOLYS
@@ -945,7 +3268,7 @@ class RegPoly(CC_Object):
             if rotation is None: rotation = source['rotation']  #
         
         super().__init__(group, position, beta)
-        self.numsides = num_sides
+        self.num_sides = num_sides
         self.radius = radius
         self.rotation = rotation
     
@@ -954,17 +3277,13 @@ class RegPoly(CC_Object):
                 ' Rotation %5.3f, ID: %s' %
                 (self.position, self.num_sides, self.radius, self.rotation,
                  self.ccid))
-    
-    def obj_dict(self):
-        return {
-            "id": self.ccid,
-            "position": self.position,
-            "num_sides": self.num_sides,
-            "radius": self.radius,
-            "rotation": self.rotation
-        }
 
 class Text(CC_Object):
+    __slots__ = ('font', 'width', 'height', 'text', 'rotation')
+    _fields = (('id', 'ccid'), ('position', 'position'), ('font', 'font'),
+               ('width', 'width'), ('height', 'height'), ('text', 'text'),
+               ('rotation', 'rotation'))
+    
     def __init__(self, position=None, font=None, height=None, text=None,
                  rotation=None, width=None, source=None, beta=CURR_BETA):
         group = CC_TEXTS
@@ -998,19 +3317,11 @@ class Text(CC_Object):
                 ' Rotation %5.3f, ID: %s' %
                 (txt, self.position, self.font, self.height,
                  self.rotation, self.ccid))
-    
-    def obj_dict(self):
-        return {
-            "id": self.ccid,
-            "position": self.position,
-            "font": self.font,
-            "width": self.width,
-            "height": self.height,
-            "text": self.text,
-            "rotation": self.rotation
-        }
 
 class Toolpath(CC_Object):
+    # the file's dict is details, less the name and uuid
+    __slots__ = ('name', 'uuid', 'details')
+    
     def __init__(self, contour_id=None, name=None, end_depth=None,
                  stepdown=None, auto=None, source=None, beta=CURR_BETA):
         group = CC_TOOLPATHS
@@ -1056,19 +3367,21 @@ class Toolpath(CC_Object):
                 "vcarve": False
             }
         else:
-            details = copy.deepcopy(source)
+            details = copy_json(dict(source))
             if auto is not None: details['automatic_parameters'] = auto  #
             if contour_id is not None:
                 if has_contour(beta):
                     contour_list = [ contour_id ]
                 else:
                     contour_list = []
-                details['contour'] = contour_list
+                details['contours'] = contour_list
             if name is not None: details['name'] = name  #
             if end_depth is not None: details['end_depth'] = end_depth  #
             if stepdown is not None: details['stepdown'] = stepdown  #
             
         super().__init__(group, None, beta)
+        self.name = details.pop('name')
+        self.uuid = details.pop('uuid', '')
         self.details = details
     
     def __str__(self):
@@ -1076,10 +3389,52 @@ class Toolpath(CC_Object):
         depth = -self.details['end_depth']
         return ('ToolPath: %s (%s Down:%5.3f)' % (self.name, offset, depth))
     
-    def obj_dict(self):
-        return copy.deepcopy(self.details)
+    def _blank(self):
+        self.name = ''
+        self.uuid = ''
+        self.details = {}
+    
+    def __getitem__(self, key):
+        if key == 'name': return self.name  #
+        if key == 'uuid' and self.uuid: return self.uuid  #
+        return self.details[key]
+    
+    def __setitem__(self, key, val):
+        if key == 'name':
+            self.name = val
+        elif key == 'uuid':
+            self.uuid = val
+        else:
+            self.details[key] = val
+    
+    def __delitem__(self, key):
+        if key == 'uuid' and self.uuid:
+            self.uuid = ''
+        elif key in ('name', 'uuid'):
+            raise KeyError(key)
+        else:
+            del self.details[key]
+    
+    def __contains__(self, key):
+        if key == 'name': return True  #
+        if key == 'uuid': return bool(self.uuid)  #
+        return key in self.details
+    
+    def __iter__(self):
+        for key in self.details:
+            yield key
+        yield 'name'
+        if self.uuid: yield 'uuid'  #
+    
+    def __copy__(self):
+        rslt = super().__copy__()
+        rslt.details = dict(self.details)
+        return rslt
 
 class PathLink(CC_Object):
+    __slots__ = ('uuid', 'links')
+    _fields = (('uuid', 'uuid'), ('links', 'links'))
+    
     def __init__(self, shape=None, toolpath=None, source=None, beta=CURR_BETA):
         group = CC_PATHLINKS
         
@@ -1088,7 +3443,7 @@ class PathLink(CC_Object):
             uupaths = [ ('?' if toolpath is None else toolpath['uuid']) ]
         else:
             uushape = source['uuid']
-            uupaths = copy.deepcopy(source['links'])
+            uupaths = list(source['links'])
         
         super().__init__(group, None, beta)
         self.uuid = uushape
@@ -1102,17 +3457,33 @@ class PathLink(CC_Object):
         if len(pathtxt) > 0: pathtxt = pathtxt[2:]  #
         
         return ('ToolLink: Shape %s Using %s' % (shapetxt, pathtxt))
-    
-    def obj_dict(self):
-        return {
-            'uuid': self.uuid,
-            'links': copy.deepcopy(self.links)
-        }
-        
+
+GROUP_CLASSES = {CC_CIRCLES: Circle, CC_CURVES: Curve, CC_POLYGONS: Polygon,
+                 CC_RECTS: Rect, CC_REGPOLYS: RegPoly, CC_TEXTS: Text,
+                 CC_TOOLPATHS: Toolpath, CC_PATHLINKS: PathLink}
+
+def as_object(group, data, beta=CURR_BETA):
+    # the CC_Object for a .c2d dict, sharing its values; data itself
+    # when it is one already or its group has no class
+    cls = GROUP_CLASSES.get(group)
+    if cls is None or isinstance(data, CC_Object): return data  #
+    rslt = cls.__new__(cls)
+    rslt.beta = beta
+    rslt.group = group
+    rslt.extra = None
+    rslt._blank()
+    for key in data:
+        rslt[key] = data[key]
+    rslt._filled()
+    return rslt
+
 # --------------------------------------------------
 
-def convert_285to286(src285):
-    rslt = CNC(beta='286')
+def convert_285to286(src285, uuids=None):
+    # uuids as for CNC; seeded, the same drawing always converts to the
+    # same file, as each new uuid is keyed on the old id or toolpath name
+    rslt = CNC(beta='286', uuids=uuids)
+    uuids = rslt.uuids
     con286 = rslt.content
     val286 = con286[CC_VALUES]
     
@@ -1128,7 +3499,7 @@ def convert_285to286(src285):
     for obj in objects:
         newobj = curve_285to286(obj)
         ccid = newobj['id']
-        tuuid = newuuid()
+        tuuid = uuids('id:%s' % ccid)
         xid[ccid] = tuuid
         newobj['id'] = tuuid
         newobjects.append(newobj)
@@ -1137,7 +3508,7 @@ def convert_285to286(src285):
     for obj in objects:
         newobj = polygon_285to286(obj)
         ccid = newobj['id']
-        tuuid = newuuid()
+        tuuid = uuids('id:%s' % ccid)
         xid[ccid] = tuuid
         newobj['id'] = tuuid
         newobjects.append(newobj)
@@ -1145,42 +3516,34 @@ def convert_285to286(src285):
     
     for group in idgr:
         if group not in (CC_CURVES, CC_POLYGONS):
-            objects = src285.getgroup(group)
-            newobjects = []
-            for obj in objects:
-                newobj = copy.deepcopy(obj)
+            rslt.content[group] = copy_json(src285.getgroup(group))
+            for newobj in rslt.content[group]:
                 ccid = newobj['id']
-                tuuid = newuuid()
+                tuuid = uuids('id:%s' % ccid)
                 xid[ccid] = tuuid
                 newobj['id'] = tuuid
-                newobjects.append(newobj)
-            rslt.content[group] = newobjects
     
     for group in namegr:
         if group != CC_TOOLPATHS:
-            objects = src285.getgroup(group)
-            newobjects = []
-            for obj in objects:
-                newobjects.append(copy.deepcopy(obj))
-            rslt.content[group] = newobjects
+            rslt.content[group] = copy_json(src285.getgroup(group))
     
     objects = src285.getgroup(CC_TOOLPATHS)
     newobjects = []
     shapetopath = []
-    for obj in objects:
-        newobj = copy.deepcopy(obj)        
+    for pnt, obj in enumerate(objects):
+        newobj = copy_json(obj)
         contours = newobj['contours']
         newobj['contours'] = []
         addobj = False
         if len(contours) > 0:
-            tuuid = newuuid()
+            tuuid = uuids('path:%d' % pnt)  # names need not be unique
             newobj['uuid'] = tuuid
             for ccid in contours:
                 if ccid in xid:
                     shapetopath.append((xid[ccid], tuuid))
                     addobj = True
         if addobj: newobjects.append(newobj)  #
-    rslt.content[group] = newobjects
+    rslt.content[CC_TOOLPATHS] = newobjects
     
     if len(shapetopath) > 0:
         newobjects = []
@@ -1208,13 +3571,13 @@ def curve_285to286(crv285):
     xx,yy = crv285['position']
     position = [round(xx,5), round(yy,5)]
     
-    points = crv285['points']
+    points = unpack_points(crv285['points'])
     size = len(points)
-    cp1 = crv285['control_point_1']
+    cp1 = list(unpack_points(crv285['control_point_1']))
     if len(cp1) < size:
         for idx in range(len(cp1), size):
             cp1.append([points[idx][0],points[idx][1]])
-    cp2 = crv285['control_point_2']
+    cp2 = list(unpack_points(crv285['control_point_2']))
     if len(cp2) < size:
         for idx in range(len(cp2), size):
             cp2.append([points[idx][0],points[idx][1]])
@@ -1240,10 +3603,10 @@ def curve_285to286(crv285):
     rslt = {
         "id": ccid,
         "position": position,
-        "points": copy.deepcopy(newpoints),
-        "control_point_1": copy.deepcopy(newcp1),
-        "control_point_2": copy.deepcopy(newcp2),
-        "point_type": copy.deepcopy(newpt)
+        "points": newpoints,
+        "control_point_1": newcp1,
+        "control_point_2": newcp2,
+        "point_type": newpt
     }
     return rslt
 
@@ -1255,18 +3618,14 @@ def polygon_285to286(poly285):
     
     rot = poly285['rotation']
     dorot = rot != 0.0
-    if dorot: set_rotation(rot)  #
+    if dorot: matrix = matrix_rotate(rot)  #
     
-    points = poly285['points']
+    points = unpack_points(poly285['points'])
+    if dorot: points = transform_points(matrix, points)  #
     size = len(points)
     
-    newpoints = [None] * size
+    newpoints = [[round(tx,5), round(ty,5)] for tx, ty in points]
     newpt = [PT_POLY] * size
-    for idx in range(size):
-        tx = points[idx][0]
-        ty = points[idx][1]
-        if dorot: tx,ty = rotate(tx,ty)  #
-        newpoints[idx] = [round(tx,5), round(ty,5)]
     
     if newpoints[0] != newpoints[-1]:
         newpoints.append([newpoints[0][0], newpoints[0][1]])
@@ -1277,10 +3636,10 @@ def polygon_285to286(poly285):
     rslt = {
         "id": ccid,
         "position": position,
-        "points": copy.deepcopy(newpoints),
-        "control_point_1": copy.deepcopy(newpoints),
-        "control_point_2": copy.deepcopy(newpoints),
-        "point_type": copy.deepcopy(newpt)
+        "points": newpoints,
+        "control_point_1": copy_points(newpoints),
+        "control_point_2": copy_points(newpoints),
+        "point_type": newpt
     }
     return rslt
 
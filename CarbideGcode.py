@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+'''
+CarbideGcode - G-code for the toolpaths of a Carbide Create drawing.
+
+    python CarbideGcode.py drawing.c2d drawing.nc
+
+gcode_lines() is a generator: passes are emitted one at a time and the
+offsets of only one toolpath are held, so a program of any length can be
+streamed to a file without being held in memory (cache=True keeps every
+toolpath's offsets on the drawing instead, for reuse).  Every enabled toolpath cuts its linked
+shapes in stepdown passes from start_depth to end_depth, below ZERO_Z,
+at the toolpath's feed, plunge rate and spindle speed.  The tool centre
+follows CNC.toolpath_offsets(): inside or outside the outlines of closed
+shapes by the tool radius, or on the outline for open shapes and "No
+Offset".  Pockets are cleared a level at a time, from the innermost
+ring out to the inside profile.  Texts are skipped.
+'''
+
+import sys
+import math
+import argparse
+
+import CarbideClass as CC
+
+def _num(val):
+    txt = ('%.4f' % val).rstrip('0').rstrip('.')
+    return '0' if txt in ('-0', '') else txt
+
+def _comment(txt):
+    return '(%s)' % str(txt).replace('(', '[').replace(')', ']')
+
+def _depths(path):
+    # the z of each pass, top down, relative to ZERO_Z
+    top = abs(path.get('start_depth', 0.0))
+    bottom = abs(path.get('end_depth', 0.0))
+    step = path.get('stepdown', 0.0)
+    if bottom <= top: return [-bottom]  #
+    passes = max(1, math.ceil((bottom - top) / step - 1e-9)) if step > 0 else 1
+    return [-min(bottom, top + step * pnt) for pnt in range(1, passes + 1)]
+
+def toolpath_lines(cnc, path, tolerance=None, state=None, cache=False):
+    # G-code for one toolpath.  state carries the modal feed and the
+    # current tool and spindle speed between calls; cache is passed on
+    # to CNC.toolpath_offsets.
+    if state is None: state = {}  #
+    if tolerance is None: tolerance = path.get('tolerance') or 0.01  #
+    retract = cnc.getvalue('RETRACT') or 0.0
+    zero = cnc.getvalue('ZERO_Z') or 0.0
+    safe = _num(zero + retract)
+    speeds = path.get('speeds', {})
+    feed = _num(speeds.get('feedrate', 0.0))
+    plunge = _num(speeds.get('plungerate', 0.0) or speeds.get('feedrate', 0.0))
+    depths = [_num(zero + depth) for depth in _depths(path)]
+
+    yield _comment(path.get('name', ''))
+    tool = path.get('tool', {}).get('number')
+    if tool is not None and tool != state.get('tool'):
+        yield 'M5'
+        yield 'T%d M6' % tool
+        state['tool'] = tool
+        state['rpm'] = None
+    rpm = speeds.get('rpm')
+    if rpm is not None and rpm != state.get('rpm'):
+        yield 'S%d M3' % rpm
+        state['rpm'] = rpm
+
+    def move(cmd, axes, rate=None):
+        if rate is not None and rate != state.get('feed'):
+            state['feed'] = rate
+            axes += ' F' + rate
+        return cmd + ' ' + axes
+
+    def cut(line, levels):
+        closed = line[0] == line[-1]
+        coords = ['X%s Y%s' % (_num(xx), _num(yy)) for xx, yy in line]
+        for pnt, depth in enumerate(levels):
+            if pnt == 0 or not closed:  # closed shapes stay down
+                yield 'G0 Z' + safe
+                yield 'G0 ' + coords[0]
+            yield move('G1', 'Z' + depth, plunge)
+            for pos in range(1, len(coords)):
+                yield move('G1', coords[pos], feed)
+        yield 'G0 Z' + safe
+
+    pocket = path.get('ofset_dir', CC.OFF_NONE) == CC.OFF_POCKET
+    for group, obj, lines in cnc.toolpath_offsets(path, tolerance, cache):
+        lines = [line for line in lines if len(line) > 1]
+        if pocket:
+            for depth in depths:
+                for line in reversed(lines):
+                    for txt in cut(line, [depth]): yield txt  #
+        else:
+            for line in lines:
+                for txt in cut(line, depths): yield txt  #
+
+def gcode_lines(cnc, tolerance=None, toolpaths=None, cache=False):
+    # the whole program: toolpaths (by name, default all enabled ones)
+    # in drawing order, between a header and a footer
+    if toolpaths is not None: toolpaths = set(name.lower() for name in toolpaths)  #
+    retract = (cnc.getvalue('ZERO_Z') or 0.0) + (cnc.getvalue('RETRACT') or 0.0)
+    yield _comment(cnc)
+    yield 'G90 G17 G21'         # drawings hold mm whatever they display
+    yield 'G0 Z' + _num(retract)
+    state = {}
+    for path in cnc.getgroup(CC.CC_TOOLPATHS):
+        if toolpaths is None:
+            if not path.get('enabled', True): continue  #
+        elif str(path.get('name', '')).lower() not in toolpaths:
+            continue
+        for line in toolpath_lines(cnc, path, tolerance, state, cache):
+            yield line
+    yield 'G0 Z' + _num(retract)
+    yield 'M5'
+    yield 'M30'
+
+def write_gcode(cnc, fout, tolerance=None, toolpaths=None, block=4096,
+                cache=False):
+    # streams gcode_lines to fout a block of lines at a time; returns
+    # the number of lines written
+    count = 0
+    chunk = []
+    for line in gcode_lines(cnc, tolerance, toolpaths, cache):
+        chunk.append(line + '\n')
+        if len(chunk) >= block:
+            fout.writelines(chunk)
+            count += len(chunk)
+            chunk = []
+    fout.writelines(chunk)
+    return count + len(chunk)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write G-code for the toolpaths of a Carbide Create '
+                    'drawing.')
+    parser.add_argument('drawing', help='.c2d drawing to read')
+    parser.add_argument('output', nargs='?', help='G-code file (default: stdout)')
+    parser.add_argument('-t', '--toolpath', action='append',
+                        help='only this toolpath (may be repeated)')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='flattening tolerance (default: per toolpath)')
+    args = parser.parse_args(argv)
+
+    cnc = CC.CNC()
+    if not cnc.load(args.drawing):
+        print('Cannot read %s' % args.drawing, file=sys.stderr)
+        return 1
+    if args.output is None:
+        write_gcode(cnc, sys.stdout, args.tolerance, args.toolpath)
+    else:
+        with open(args.output, 'w') as fout:
+            write_gcode(cnc, fout, args.tolerance, args.toolpath)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+'''
+CarbideNest - lays copies of many drawings out on sheets of stock.
+
+    python CarbideNest.py sheet.c2d bracket.c2d@20 spacer.c2d@50 -W 600 -H 400
+
+Each drawing is nested as many times as its @COUNT (default once), with
+nest_drawings().  The sheets are written as sheet.c2d, sheet-2.c2d and
+so on, each holding its parts with fresh ids and one copy of every
+distinct toolpath, linked to all the parts it cuts.  --hulls turns parts
+to the angle that gives them the smallest box and --turns lets them lie
+a quarter turn round; --seed makes the ids the same from run to run.
+
+nest_drawings() and the rectangle packer under it, pack_rects(), can
+also be called from Python on CNC drawings and (width, height) boxes.
+'''
+
+import os
+import sys
+import math
+import time
+import argparse
+
+import CarbideClass as CC
+
+# Rectangle packing for nest_drawings.  Boxes go onto sheets with the
+# skyline bottom-left heuristic: biggest first, each where its top ends
+# lowest on the first sheet it fits, leftmost on ties.  A skyline is the
+# top edge of what is packed so far, as [x, y, width] segments left to
+# right, so a place costs a scan of the segments rather than a search of
+# free rectangles.  Hulls let a part be packed at the angle that gives
+# the smallest box round its convex hull, which is always square to one
+# of the hull's edges.
+
+PACK_EPS = 1e-9
+
+def convex_hull(points):
+    # monotone chain: the hull counterclockwise, without a closing point
+    pts = sorted(set((float(xx), float(yy)) for xx, yy in points))
+    if len(pts) < 3: return pts  #
+    
+    def half(seq):
+        rslt = []
+        for xx, yy in seq:
+            while len(rslt) > 1:
+                (ax, ay), (bx, by) = rslt[-2], rslt[-1]
+                if (bx - ax) * (yy - ay) - (by - ay) * (xx - ax) > 0: break  #
+                rslt.pop()
+            rslt.append((xx, yy))
+        return rslt
+    
+    lower = half(pts)
+    upper = half(reversed(pts))
+    return lower[:-1] + upper[:-1]
+
+def hull_angle(hull):
+    # the turn in degrees, between -45 and 45, that gives the hull its
+    # smallest box; 0 unless that is strictly smaller
+    def area(cs, sn):
+        xs = [cs*xx - sn*yy for xx, yy in hull]
+        ys = [sn*xx + cs*yy for xx, yy in hull]
+        return (max(xs) - min(xs)) * (max(ys) - min(ys))
+    
+    best, rslt = area(1.0, 0.0), 0.0
+    for pnt in range(len(hull)):
+        (ax, ay), (bx, by) = hull[pnt - 1], hull[pnt]
+        if ax == bx and ay == by: continue  #
+        ang = -math.atan2(by - ay, bx - ax)
+        ang -= math.pi / 2 * round(ang / (math.pi / 2))
+        size = area(math.cos(ang), math.sin(ang))
+        if size < best * (1 - 1e-9): best, rslt = size, math.degrees(ang)  #
+    return rslt
+
+class skyline:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.segs = [[0.0, 0.0, width]]
+    
+    def find(self, wid, hgt):
+        # (top, x, y, segment) of the lowest place for a wid x hgt box,
+        # or None where it does not fit
+        segs = self.segs
+        count = len(segs)
+        limit = self.height - hgt + PACK_EPS
+        best = None
+        for pnt in range(count):
+            xx = segs[pnt][0]
+            right = xx + wid - PACK_EPS
+            if right > self.width: break  #
+            yy = 0.0
+            end = pnt
+            while end < count and segs[end][0] < right:
+                if segs[end][1] > yy: yy = segs[end][1]  #
+                end += 1
+            if yy > limit: continue  #
+            if best is None or yy + hgt < best[0] - PACK_EPS: best = (yy + hgt, xx, yy, pnt)  #
+        return best
+    
+    def place(self, pnt, wid, top):
+        # raises the skyline to top across wid from segment pnt
+        segs = self.segs
+        xx = segs[pnt][0]
+        end = pnt
+        while end < len(segs) and segs[end][0] + segs[end][2] <= xx + wid + PACK_EPS:
+            end += 1
+        if end < len(segs) and segs[end][0] < xx + wid:
+            right = segs[end][0] + segs[end][2]
+            segs[end] = [xx + wid, segs[end][1], right - xx - wid]
+        segs[pnt:end] = [[xx, top, wid]]
+        if pnt + 1 < len(segs) and abs(segs[pnt + 1][1] - top) <= PACK_EPS:
+            segs[pnt][2] += segs.pop(pnt + 1)[2]
+        if pnt > 0 and abs(segs[pnt - 1][1] - top) <= PACK_EPS:
+            segs[pnt - 1][2] += segs.pop(pnt)[2]
+
+def pack_rects(sizes, width, height, turns=False):
+    # [sheet, x, y, turned] for each (width, height) in sizes, placing
+    # them on as many width x height sheets as it takes; turned boxes
+    # lie a quarter turn round.  Raises ValueError for a box too big for
+    # an empty sheet.
+    if turns:
+        order = sorted(range(len(sizes)), key=lambda pnt: (-max(sizes[pnt]),
+                                                           -min(sizes[pnt]), pnt))
+    else:
+        order = sorted(range(len(sizes)), key=lambda pnt: (-sizes[pnt][1],
+                                                           -sizes[pnt][0], pnt))
+    sheets = []
+    rslt = [None] * len(sizes)
+    for pnt in order:
+        wid, hgt = sizes[pnt]
+        shapes = [(wid, hgt, False)]
+        if turns and wid != hgt: shapes.append((hgt, wid, True))  #
+        least = min(wid, hgt) if turns else hgt
+        for sheet in range(len(sheets) + 1):
+            if sheet == len(sheets): sheets.append(skyline(width, height))  #
+            segs = sheets[sheet].segs
+            best = None
+            if min(seg[1] for seg in segs) + least <= height + PACK_EPS:
+                for swid, shgt, turned in shapes:
+                    found = sheets[sheet].find(swid, shgt)
+                    if found is not None and (best is None or found[0] < best[0][0] - PACK_EPS):
+                        best = (found, swid, turned)
+            if best is not None: break  #
+            if len(segs) == 1 and segs[0][1] == 0.0:
+                raise ValueError('Box %d (%g x %g) is bigger than the sheet' %
+                                 (pnt, wid, hgt))
+        (top, xx, yy, seg), swid, turned = best
+        sheets[sheet].place(seg, swid, top)
+        rslt[pnt] = [sheet, xx, yy, turned]
+    return rslt
+
+# Nesting.  nest_drawings lays copies of many parts out on sheets of
+# stock with pack_rects, each part packed as its box (turned to its
+# hull_angle first with hulls) plus spacing.  Every sheet is a new
+# beta 286 drawing: shapes get fresh ids from its uuidsource, and each
+# distinct toolpath (same settings and name) appears once, linked to
+# the shapes of every copy it cuts.  Beta 285 parts are converted first.
+
+def _nest_part(cnc, ids, hulls, tolerance):
+    # what nest_drawings needs of a part: its shapes as dicts, the turn
+    # and box it is packed with, and (hash, toolpath, shape ids) for each
+    # toolpath that cuts it
+    if cnc.beta < CC.CURR_BETA:
+        fresh = CC.uuidsource(0)        # keyed, so old ids map over
+        cnc = CC.convert_285to286(cnc, fresh)
+        if ids is not None: ids = [fresh('id:%s' % ccid) for ccid in ids]  #
+    wanted = None if ids is None else set(ids)
+    
+    shapes = []
+    points = []
+    ext = CC.extents()
+    for group, obj, box in cnc.object_boxes():
+        if wanted is not None and obj['id'] not in wanted: continue  #
+        shapes.append((group, obj.obj_dict() if isinstance(obj, CC.CC_Object) else obj))
+        if box is None: continue  #
+        ext.test(box[0], box[1])
+        ext.test(box[2], box[3])
+        if hulls:
+            lines = CC.flatten_shape(group, obj, tolerance)
+            if len(lines) < 1: lines = [[(box[0], box[1]), (box[2], box[3]),
+                                         (box[0], box[3]), (box[2], box[1])]]
+            for line in lines:
+                points.extend(line)
+    if len(shapes) < 1 or ext.lft > ext.rit: raise ValueError('%s: no shapes to nest' % cnc)  #
+    
+    rot = 0.0
+    box = ext.extents()
+    if len(points) > 2:
+        hull = convex_hull(points)
+        rot = hull_angle(hull)
+        if rot != 0.0:                  # flattening cuts corners by tolerance
+            turned = CC.transform_points(CC.matrix_rotate(rot), hull)
+            xs = [pt[0] for pt in turned]
+            ys = [pt[1] for pt in turned]
+            box = (min(xs) - tolerance, min(ys) - tolerance,
+                   max(xs) + tolerance, max(ys) + tolerance)
+    
+    ccids = set(obj['id'] for group, obj in shapes)
+    paths = []
+    for path in cnc.getgroup(CC.CC_TOOLPATHS):
+        cuts = [uushape for uushape in cnc.path_shapes(path.get('uuid'))
+                if uushape in ccids]
+        if len(cuts) < 1: continue  #
+        path = path.obj_dict() if isinstance(path, CC.CC_Object) else CC.copy_json(path)
+        path.pop('uuid', None)
+        paths.append((CC.object_hash(path), path, cuts))
+    return {'cnc': cnc, 'shapes': shapes, 'rot': rot, 'box': box, 'paths': paths}
+
+def nest_drawings(parts, width, height, spacing=0.0, margin=0.0, turns=False,
+                  hulls=False, tolerance=0.1, uuids=None):
+    # Returns the sheets holding parts: each part a CNC, or (CNC, ids)
+    # for some of its shapes; list a part twice for two copies.  spacing
+    # is kept between parts and margin inside the edge of the stock;
+    # turns lets parts lie a quarter turn round and hulls turns them to
+    # their best angle, flattened to tolerance.  uuids as for CNC, shared
+    # by all the sheets.
+    uuids = CC.as_uuidsource(uuids)
+    prepared = {}
+    records = []
+    for part in parts:
+        cnc, ids = part if isinstance(part, tuple) else (part, None)
+        key = (id(cnc), None if ids is None else tuple(ids))
+        if key not in prepared: prepared[key] = _nest_part(cnc, ids, hulls, tolerance)  #
+        records.append(prepared[key])
+    if len(records) < 1: return []  #
+    
+    sizes = [(rec['box'][2] - rec['box'][0] + spacing,
+              rec['box'][3] - rec['box'][1] + spacing) for rec in records]
+    places = pack_rects(sizes, width - 2 * margin + spacing,
+                        height - 2 * margin + spacing, turns)
+    
+    sheets = []
+    for sheet in range(max(place[0] for place in places) + 1):
+        cnc = CC.CNC(width=width, height=height, uuids=uuids)
+        for key, val in records[0]['cnc'].getgroup(CC.CC_VALUES).items():
+            if key not in ('WIDTH', 'HEIGHT'): cnc.setvalue(key, CC.copy_json(val))  #
+        sheets.append([cnc, {}, []])    # drawing, group -> new dicts, copies
+    
+    for rec, place in zip(records, places):
+        sheet, xx, yy, turned = place
+        cnc, bygroup, copies = sheets[sheet]
+        lft, btm, rit, top = rec['box']
+        wid, hgt = (top - btm, rit - lft) if turned else (rit - lft, top - btm)
+        matrix = CC.matrix_multiply(CC.matrix_rotate(rec['rot']),
+                                    CC.matrix_translate(-(lft + rit) / 2, -(btm + top) / 2))
+        if turned: matrix = CC.matrix_multiply(matrix, CC.matrix_rotate(90))  #
+        matrix = CC.matrix_multiply(matrix, CC.matrix_translate(margin + xx + wid / 2,
+                                                                margin + yy + hgt / 2))
+        news = []
+        for group, obj in rec['shapes']:
+            objs = bygroup.setdefault(group, [])
+            news.append((obj['id'], objs, len(objs)))
+            objs.append(CC.copy_json(obj))
+        copies.append((rec, matrix, news))
+    
+    rslt = []
+    for cnc, bygroup, copies in sheets:
+        for group in cnc.cc_idgroups:
+            if group in bygroup: cnc.add_objects(bygroup[group], group, owned=True)  #
+        merged = {}                     # toolpath hash -> [toolpath, shape ids]
+        for rec, matrix, news in copies:
+            xid = {ccid: objs[pnt]['id'] for ccid, objs, pnt in news}
+            cnc.transform(matrix, list(xid.values()))
+            for key, path, cuts in rec['paths']:
+                entry = merged.setdefault(key, [path, []])
+                entry[1].extend(xid[ccid] for ccid in cuts)
+        if len(merged) > 0:
+            paths = cnc.add_objects([CC.copy_json(entry[0]) for entry in merged.values()],
+                                    CC.CC_TOOLPATHS, owned=True)
+            for path, entry in zip(paths, merged.values()):
+                cnc.link_shapes(path['uuid'], entry[1])
+        rslt.append(cnc)
+    return rslt
+
+# ----------------------------------------------------------------------
+# Command line
+
+def part_count(arg):
+    # 'name.c2d@5' -> ('name.c2d', 5); a name without a count is one copy
+    name, sep, count = arg.rpartition('@')
+    if sep and count.isdigit(): return name, int(count)  #
+    return arg, 1
+
+def sheet_names(output, count):
+    base, ext = os.path.splitext(output)
+    if ext == '': ext = '.c2d'  #
+    return [base + ext if pnt == 0 else '%s-%d%s' % (base, pnt + 1, ext)
+            for pnt in range(count)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Nest copies of Carbide Create drawings onto sheets '
+                    'of stock.')
+    parser.add_argument('output', help='first sheet to write')
+    parser.add_argument('parts', nargs='+',
+                        help='drawings to nest, as DRAWING or DRAWING@COUNT')
+    parser.add_argument('-W', '--width', type=float, required=True,
+                        help='stock width')
+    parser.add_argument('-H', '--height', type=float, required=True,
+                        help='stock height')
+    parser.add_argument('--spacing', type=float, default=0.0,
+                        help='gap kept between parts')
+    parser.add_argument('--margin', type=float, default=0.0,
+                        help='gap kept inside the edge of the stock')
+    parser.add_argument('--turns', action='store_true',
+                        help='let parts lie a quarter turn round')
+    parser.add_argument('--hulls', action='store_true',
+                        help='turn parts to their smallest box first')
+    parser.add_argument('--seed', default=None,
+                        help='derive ids from this, not at random')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    parts = []
+    for arg in args.parts:
+        name, count = part_count(arg)
+        cnc = CC.CNC()
+        if not cnc.load(name):
+            print('Cannot read %s' % name, file=sys.stderr)
+            return 1
+        cnc.fixbeta()
+        parts.extend([cnc] * count)
+    try:
+        sheets = nest_drawings(parts, args.width, args.height, args.spacing,
+                               args.margin, args.turns, args.hulls,
+                               uuids=args.seed)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+    for cnc, name in zip(sheets, sheet_names(args.output, len(sheets))):
+        cnc.save(name)
+        print('%-30s %5d shapes' % (name, sum(len(cnc.getgroup(group))
+                                              for group in cnc.cc_idgroups)))
+    print('%d parts on %d sheets (%.2fs)' % (len(parts), len(sheets),
+                                             time.perf_counter() - start))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+
+'''
+CarbideOffset - the paths a tool centre follows to cut the shapes of a
+Carbide Create drawing.
+
+    lines = CarbideOffset.shape_offsets(CC.CC_CURVES, obj, 3.175, CC.OFF_INSIDE)
+
+shape_offsets() gives the polylines of one shape for a tool diameter and
+an offset direction (CarbideClass OFF_NONE, OFF_INSIDE, OFF_OUTSIDE or
+OFF_POCKET with a stepover), bulk_offsets() those of many shapes of a
+group at once.  offset_ring() and offset_rings() offset closed polylines
+by signed distances.  CNC.toolpath_offsets() keeps the results per shape
+and tool settings.  Everything here needs numpy.
+'''
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import CarbideClass as CC
+
+# Tool offsets.  offset_rings() moves closed polylines the way a tool
+# centre follows them, outwards for a positive distance: every edge shifts
+# along its normal, with arcs round the corners it opens up and plain
+# joins where it folds back.  Each raw ring is split where it crosses
+# itself, and only the pieces that keep the full distance from the
+# original, on the proper side of it, are chained back into rings.  The
+# arcs are circumscribed (each chord touches the circle) so that every
+# piece worth keeping passes that test.  Islands are not considered:
+# each shape is offset on its own.  All the rings of a call go through
+# together, packed end to end with a ring number for every point; edge
+# against edge and point against edge tests only pair up what a sweep
+# along one axis, ring by ring, finds overlapping.
+
+NEAR_EDGES = 4
+
+def _ring_links(sizes):
+    # the next and previous row of every row of rings packed end to end
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    full = sizes > 0
+    nxt = np.arange(1, ends[-1] + 1 if len(ends) > 0 else 1)
+    prv = nxt - 2
+    nxt[ends[full] - 1] = starts[full]
+    prv[starts[full]] = ends[full] - 1
+    return nxt, prv
+
+def _sweep(lo, hi, sizes, qlo=None, qhi=None, qrid=None):
+    # (query, item) index pairs within the same ring whose [lo, hi] spans
+    # overlap, items packed ring by ring; without queries, (item, item)
+    # pairs of overlapping items, each pair once
+    count = len(sizes)
+    rid = np.repeat(np.arange(count), sizes)
+    full = np.flatnonzero(sizes > 0)
+    at = (np.cumsum(sizes) - sizes)[full]
+    base = np.zeros(count)
+    span = np.ones(count)
+    width = np.zeros(count)
+    if len(full) > 0:
+        base[full] = np.minimum.reduceat(lo, at)
+        span[full] = np.maximum(np.maximum.reduceat(hi, at) - base[full], 1e-300)
+        width[full] = np.maximum.reduceat(hi - lo, at)
+    
+    def key(val, ring):
+        # ring number plus the place within the ring, kept apart
+        return ring * 4.0 + np.clip((val - base[ring]) / span[ring], -1.0, 2.0)
+    
+    skey = key(lo, rid)
+    order = np.argsort(skey)
+    skey = skey[order]
+    if qlo is None:
+        qi = order
+        first = np.arange(1, len(order) + 1)
+        last = np.searchsorted(skey, key(hi[order], rid[order]), 'right')
+    else:
+        qi = np.arange(len(qlo))
+        reach = width[qrid] * (1 + 1e-9) + 1e-9
+        first = np.searchsorted(skey, key(qlo - reach, qrid), 'left')
+        last = np.searchsorted(skey, key(qhi, qrid), 'right')
+    counts = np.maximum(last - first, 0)
+    items = order[CC._ranges(first, counts)]
+    queries = np.repeat(qi, counts)
+    if qlo is None:
+        keep = (lo[items] <= hi[queries]) & (lo[queries] <= hi[items])
+    else:
+        keep = (lo[items] <= qhi[queries]) & (qlo[queries] <= hi[items])
+    return queries[keep], items[keep]
+
+def _crossings(ring, sizes):
+    # (edge, edge, t, u) for each crossing of two edges of the same ring
+    nxt, prv = _ring_links(sizes)
+    ends = ring[nxt]
+    low, high = np.minimum(ring, ends), np.maximum(ring, ends)
+    ii, jj = _sweep(low[:, 0], high[:, 0], sizes)
+    ii, jj = np.minimum(ii, jj), np.maximum(ii, jj)
+    near = (jj > ii + 1) & (nxt[jj] != ii)
+    near &= (low[ii, 1] <= high[jj, 1]) & (low[jj, 1] <= high[ii, 1])
+    ii, jj = ii[near], jj[near]
+    rr = ends[ii] - ring[ii]
+    ss = ends[jj] - ring[jj]
+    qp = ring[jj] - ring[ii]
+    den = rr[:, 0] * ss[:, 1] - rr[:, 1] * ss[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tt = (qp[:, 0] * ss[:, 1] - qp[:, 1] * ss[:, 0]) / den
+        uu = (qp[:, 0] * rr[:, 1] - qp[:, 1] * rr[:, 0]) / den
+    hit = (den != 0.0) & (tt >= 0.0) & (tt < 1.0) & (uu >= 0.0) & (uu < 1.0)
+    return ii[hit], jj[hit], tt[hit], uu[hit]
+
+def _closer(cols, pts, which, edge, reach):
+    # whether each point which is nearer than its reach to edge, the
+    # edges given by start x, y, run x, y and squared length
+    ax, ay, bx, by, den = [col[edge] for col in cols]
+    px = pts[0][which] - ax
+    py = pts[1][which] - ay
+    tt = np.clip((px * bx + py * by) / np.where(den > 0.0, den, 1.0), 0.0, 1.0)
+    return np.hypot(px - bx * tt, py - by * tt) < reach[which]
+
+def _ring_near(ring, sizes, pts, prid, reach, src):
+    # for each of pts, whether its ring prid passes nearer than reach, and
+    # if not, whether the point is inside that ring (even-odd).  The edges
+    # round the point src each came from are tried first; what they leave
+    # only meets the edges that come within reach on x, or span its y.
+    nxt, prv = _ring_links(sizes)
+    aa = ring
+    ab = ring[nxt] - ring
+    low, high = np.minimum(aa, aa + ab), np.maximum(aa, aa + ab)
+    starts = (np.cumsum(sizes) - sizes)[prid]
+    size = sizes[prid]
+    step = np.arange(-NEAR_EDGES, NEAR_EDGES + 1)
+    which = np.repeat(np.arange(len(pts)), len(step))
+    edge = starts[which] + (src[which] - starts[which] + np.tile(step, len(pts))) % size[which]
+    cols = [np.ascontiguousarray(col) for col in (aa.T, ab.T)]
+    cols = (*cols[0], *cols[1], (ab * ab).sum(axis=1))
+    xy = np.ascontiguousarray(pts.T)
+    near = np.zeros(len(pts), dtype=bool)
+    near[which[_closer(cols, xy, which, edge, reach)]] = True
+    
+    rest = np.flatnonzero(~near)
+    which, edge = _sweep(low[:, 0], high[:, 0], sizes,
+                         pts[rest, 0] - reach[rest], pts[rest, 0] + reach[rest], prid[rest])
+    which = rest[which]
+    meet = ((low[edge, 1] <= pts[which, 1] + reach[which]) &
+            (pts[which, 1] - reach[which] <= high[edge, 1]))
+    which, edge = which[meet], edge[meet]
+    near[which[_closer(cols, xy, which, edge, reach)]] = True
+    
+    rest = np.flatnonzero(~near)
+    which, edge = _sweep(low[:, 1], high[:, 1], sizes, pts[rest, 1], pts[rest, 1], prid[rest])
+    which = rest[which]
+    yy = pts[which, 1]
+    span = (aa[edge, 1] > yy) != (aa[edge, 1] + ab[edge, 1] > yy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cross = aa[edge, 0] + (yy - aa[edge, 1]) * ab[edge, 0] / ab[edge, 1]
+    hits = span & (pts[which, 0] < cross)
+    inside = np.bincount(which[hits], minlength=len(pts)) % 2 == 1
+    return near, inside
+
+def _raw_offset(ring, rid, sizes, dists, tolerance):
+    # rings counter-clockwise without repeated end points; the raw rings,
+    # their ring numbers and the point each raw point came from
+    nxt, prv = _ring_links(sizes)
+    edge = ring[nxt] - ring
+    elen = np.hypot(*edge.T)
+    normal = np.column_stack((edge[:, 1], -edge[:, 0])) / elen[:, None]
+    before = normal[prv]                    # normal of the edge into each point
+    turn = np.arctan2(before[:, 0] * normal[:, 1] - before[:, 1] * normal[:, 0],
+                      (before * normal).sum(axis=1))
+    dist = dists[rid]
+    rad = np.abs(dist)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = np.where(rad > tolerance, 2 * np.arccos(1 - tolerance / rad), math.pi / 2)
+    steps = np.where(dist * turn > 0.0, np.maximum(1, np.ceil(np.abs(turn) / step)), 0)
+    # a fold is mitred when the mitre stays within half of both edges,
+    # so that it cannot cross a neighbour; others are left to the trim.
+    # A bend of one arc step is its mitre too, the arc's ends lying on
+    # the way to it.
+    reach = rad * np.tan(np.abs(turn) / 2)
+    short = reach <= np.minimum(elen, elen[prv]) / 2
+    mitre = ((steps == 0) & (short | (np.abs(turn) < 1e-4))) | ((steps == 1) & short)
+    counts = np.where(mitre, 1, steps + 2).astype(int)
+    
+    owner = np.repeat(np.arange(len(ring)), counts)
+    pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    turns, stepped = turn[owner], np.maximum(steps[owner], 1)
+    frac = np.clip((pos - 0.5) / stepped, 0.0, 1.0)
+    frac[pos == counts[owner] - 1] = 1.0
+    frac[mitre[owner]] = 0.5
+    scale = np.where((pos == 0) | (pos == counts[owner] - 1), 1.0, 1 / np.cos(turns / stepped / 2))
+    scale[mitre[owner]] = 1 / np.cos(turns[mitre[owner]] / 2)
+    ang = np.arctan2(before[owner, 1], before[owner, 0]) + turns * frac
+    raw = ring[owner] + (dist[owner] * scale)[:, None] * np.column_stack((np.cos(ang), np.sin(ang)))
+    rawid = rid[owner]
+    nxt, prv = _ring_links(np.bincount(rawid, minlength=len(sizes)))
+    keep = np.hypot(*(raw - raw[prv]).T) > 1e-12
+    lone = np.flatnonzero(np.bincount(rawid[keep], minlength=len(sizes)) < 1)
+    keep[np.searchsorted(rawid, lone)[sizes[lone] > 0]] = True
+    return raw[keep], rawid[keep], owner[keep]
+
+def _chain(starts):
+    # the closed rings the pieces of one raw ring chain into, pieces
+    # (end tag, rows) listed under their start tags
+    rslt = []
+    while len(starts) > 0:
+        tag = next(iter(starts))
+        first = tag
+        line = []
+        while tag in starts:
+            piece = starts[tag].pop()
+            if len(starts[tag]) < 1: del starts[tag]  #
+            line.append(piece[1])
+            tag = piece[0]
+            if tag == first: break  #
+        if tag == first and sum(map(len, line)) > 2: rslt.append(np.concatenate(line))  #
+    return rslt
+
+def _cycles(after):
+    # for a permutation given by each item's successor, the first item of
+    # its cycle and its place along the cycle from there
+    cnt = len(after)
+    lead, jump = np.arange(cnt), after
+    span = 1
+    while span < cnt:
+        lead = np.minimum(lead, lead[jump])
+        jump = jump[jump]
+        span *= 2
+    last = after == lead
+    rank = np.where(last, 0, 1)
+    jump = np.where(last, np.arange(cnt), after)
+    span = 1
+    while span < cnt:
+        rank = rank + rank[jump]
+        jump = jump[jump]
+        span *= 2
+    return lead, rank[lead] - rank
+
+def _offset_packed(ring, sizes, dists, tolerance):
+    # offset_rings on rings packed end to end: the result rings packed
+    # without repeated end points, their sizes and the input ring of each
+    count = len(sizes)
+    rid = np.repeat(np.arange(count), sizes)
+    ends = np.cumsum(sizes)
+    full = np.flatnonzero(sizes > 1)
+    shut = full[(ring[ends[full] - sizes[full]] == ring[ends[full] - 1]).all(axis=1)]
+    keep = np.ones(len(ring), dtype=bool)
+    keep[ends[shut] - 1] = False
+    ring, rid = ring[keep], rid[keep]
+    nxt, prv = _ring_links(np.bincount(rid, minlength=count))
+    keep = np.hypot(*(ring - ring[prv]).T) > 1e-12
+    ring, rid = ring[keep], rid[keep]
+    sizes = np.bincount(rid, minlength=count)
+    nxt, prv = _ring_links(sizes)
+    area = 0.5 * np.bincount(rid, weights=ring[:, 0] * ring[nxt, 1] - ring[nxt, 0] * ring[:, 1],
+                             minlength=count)
+    # unmoved rings come back as they are, degenerate ones not at all;
+    # the rest turn counter-clockwise
+    still = np.flatnonzero((sizes >= 3) & (dists == 0.0))
+    outs = [ring[np.isin(rid, still)]]
+    outsizes = [sizes[still]]
+    outids = [still]
+    use = (sizes >= 3) & (dists != 0.0) & (area != 0.0)
+    keep = use[rid]
+    flip = np.flatnonzero(keep & (area < 0.0)[rid])
+    starts = np.cumsum(sizes) - sizes
+    order = np.arange(len(ring))
+    order[flip] = 2 * starts[rid[flip]] + sizes[rid[flip]] - 1 - flip
+    ring, rid = ring[order[keep]], rid[keep]
+    sizes = np.bincount(rid, minlength=count)
+    
+    raw, rawid, rawsrc = _raw_offset(ring, rid, sizes, dists, tolerance)
+    rawsizes = np.bincount(rawid, minlength=count)
+    ii, jj, tt, uu = _crossings(raw, rawsizes)
+    # every point of the raw rings, with each crossing inserted on both of
+    # its edges in order along them; crossings are tagged 0, 1, ...
+    cnt = len(raw)
+    cross = np.concatenate((ii, jj))
+    along = np.concatenate((tt, uu))
+    order = np.lexsort((along, cross))
+    cross, along = cross[order], along[order]
+    at = np.arange(cnt) + np.searchsorted(cross, np.arange(cnt))
+    put = cross + np.arange(1, len(cross) + 1)
+    edges = np.empty(cnt + len(cross), dtype=int)
+    edges[at] = np.arange(cnt)
+    edges[put] = cross
+    tags = np.full(len(edges), -1)
+    tags[put] = order % max(len(ii), 1)
+    nxt, prv = _ring_links(rawsizes)
+    seq = np.empty((len(edges), 2))
+    seq[at] = raw
+    seq[put] = raw[cross] + (raw[nxt[cross]] - raw[cross]) * along[:, None]
+    # each ring turned to start at its first crossing and run round to it
+    # again; pieces run from one crossing to the next, the whole ring if none
+    seqsizes = np.bincount(rawid[edges], minlength=count)
+    seqstarts = np.cumsum(seqsizes) - seqsizes
+    first = seqstarts.copy()
+    cuts = np.flatnonzero(tags >= 0)
+    crossed, at = np.unique(rawid[edges[cuts]], return_index=True)
+    first[crossed] = cuts[at]
+    lengths = seqsizes + (seqsizes > 0)
+    seqid = np.repeat(np.arange(count), lengths)
+    step = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    order = (first[seqid] + step - seqstarts[seqid]) % np.maximum(seqsizes, 1)[seqid]
+    order += seqstarts[seqid]
+    seq, tags, edges = seq[order], tags[order], edges[order]
+    plain = np.ones(count, dtype=bool)
+    plain[crossed] = False
+    cuts = np.flatnonzero((tags >= 0) | (plain[seqid] & ((step == 0) | (step == seqsizes[seqid]))))
+    same = seqid[cuts[:-1]] == seqid[cuts[1:]]
+    lo, hi = cuts[:-1][same], cuts[1:][same]
+    
+    # each piece is judged by the middle of its longest edge
+    lens = np.hypot(*np.diff(seq, axis=0).T)
+    lens[seqid[:-1] != seqid[1:]] = -1.0
+    owner = np.repeat(np.arange(len(lo)), hi - lo)
+    edge = CC._ranges(lo, hi - lo)
+    longest = np.maximum.reduceat(lens, lo) if len(lo) > 0 else lens[:0]
+    hit = np.flatnonzero(lens[edge] == longest[owner])
+    mid = edge[hit[np.unique(owner[hit], return_index=True)[1]]]
+    pieceid = seqid[lo]
+    dist = dists[pieceid]
+    near, inside = _ring_near(ring, sizes, (seq[mid] + seq[mid + 1]) / 2, pieceid,
+                              np.abs(dist) * (1 - 1e-9) - 1e-12, rawsrc[edges[mid]])
+    good = np.flatnonzero(~near & (inside == (dist < 0.0)))
+    
+    # where each crossing starts and ends one kept piece, a ring's pieces
+    # make whole cycles, each led by its first piece; any other ring is
+    # chained a piece at a time
+    head, tail, pieceid = tags[lo[good]], tags[hi[good]], pieceid[good]
+    odd = np.zeros(count, dtype=bool)
+    for tag in (head, tail):
+        found = np.sort(tag[tag >= 0])
+        odd[pieceid[np.isin(tag, found[1:][found[1:] == found[:-1]])]] = True
+    follow = np.full(len(ii) + 1, -1)
+    follow[head] = np.arange(len(good))
+    after = np.where(head < 0, np.arange(len(good)), follow[tail])
+    odd[pieceid[after < 0]] = True
+    fast = np.flatnonzero(~odd[pieceid])
+    local = np.zeros(len(good), dtype=int)
+    local[fast] = np.arange(len(fast))
+    lead, place = _cycles(local[after[fast]])
+    order = np.lexsort((place, lead))
+    pieces = good[fast[order]]
+    lengths = hi[pieces] - lo[pieces]
+    outs.append(seq[CC._ranges(lo[pieces], lengths)])
+    lead = lead[order]
+    at = np.flatnonzero(np.concatenate(([True], lead[1:] != lead[:-1])))[:len(lead)]
+    outsizes.append(np.add.reduceat(lengths, at) if len(at) > 0 else lengths)
+    outids.append(pieceid[fast[lead[at]]])
+    outkeys = [np.zeros(len(still), dtype=int), lead[at]]
+    
+    chains = {}
+    slow = np.flatnonzero(odd[pieceid])
+    for ringno, start, end, first, last in zip(*[arr.tolist() for arr in (
+            pieceid[slow], head[slow], tail[slow], lo[good[slow]], hi[good[slow]])]):
+        starts = chains.setdefault(ringno, {})
+        starts.setdefault(start, []).append((end, seq[first:last]))
+    for ringno, starts in chains.items():
+        found = _chain(starts)
+        outs.extend(found)
+        outsizes.append([len(line) for line in found])
+        outids.append([ringno] * len(found))
+        outkeys.append(range(len(found)))
+    
+    ring = np.concatenate(outs)
+    sizes = np.concatenate(outsizes).astype(int)
+    ids = np.concatenate(outids).astype(int)
+    starts = np.cumsum(sizes) - sizes
+    order = np.lexsort((np.concatenate(outkeys).astype(int), ids))
+    order = order[sizes[order] > 2]
+    return ring[CC._ranges(starts[order], sizes[order])], sizes[order], ids[order]
+
+def _packed_rings(rings):
+    # rings as one array of points and the size of each
+    sizes = np.fromiter(map(len, rings), int, len(rings))
+    if sizes.sum() < 1: return np.zeros((0, 2)), sizes  #
+    return np.concatenate([CC.pack_points(pts) for pts in rings if len(pts) > 0]), sizes
+
+def _ring_lists(ring, sizes, ids, count):
+    # packed result rings as lists of (x, y), closed, grouped by input ring
+    rows = list(zip(ring[:, 0].tolist(), ring[:, 1].tolist()))
+    rslt = [[] for pnt in range(count)]
+    at = 0
+    for size, ringno in zip(sizes.tolist(), ids.tolist()):
+        line = rows[at:at + size]
+        line.append(line[0])
+        rslt[ringno].append(line)
+        at += size
+    return rslt
+
+def offset_rings(rings, dists, tolerance=0.01):
+    # offset_ring for many rings at once, each by its own distance: the
+    # list of result rings for every ring
+    if np is None: raise ImportError('offsets need numpy')  #
+    ring, sizes = _packed_rings(rings)
+    dists = np.broadcast_to(np.asarray(dists, dtype=np.float64), sizes.shape)
+    return _ring_lists(*_offset_packed(ring, sizes, dists, tolerance), len(rings))
+
+def offset_ring(ring, dist, tolerance=0.01):
+    # closed polylines (lists of (x, y), first point repeated) a tool
+    # centre follows at dist outside ring, or inside it when dist < 0
+    if np is None: raise ImportError('offsets need numpy')  #
+    return offset_rings([np.array(ring, dtype=np.float64).reshape(-1, 2)], dist, tolerance)[0]
+
+def _resized(group, obj, dist, tolerance):
+    # the offset of a shape that is a shape of its own kind, flattened:
+    # circles either way, rects and regular polygons inwards (outwards
+    # their corners turn round); None for anything else
+    if group == CC.CC_CIRCLES:
+        size = {'radius': obj['radius'] + dist}
+    elif group == CC.CC_RECTS and dist < 0.0:
+        size = {'width': obj['width'] + 2 * dist, 'height': obj['height'] + 2 * dist}
+    elif group == CC.CC_REGPOLYS and dist < 0.0:
+        size = {'radius': obj['radius'] + dist / math.cos(math.pi / obj['num_sides'])}
+    else:
+        return None
+    if min(size.values()) <= 0.0: return []  #
+    sized = dict(obj)
+    sized.update(size)
+    return CC.flatten_shape(group, sized, tolerance)
+
+def bulk_offsets(group, objects, diameter, direction=CC.OFF_NONE, stepover=0.0,
+                 tolerance=0.01):
+    # shape_offsets for many shapes of a group: the rings of a pocket
+    # level are offset together for all the shapes still clearing
+    lines = CC.flatten_shapes(group, objects, tolerance)
+    rad = diameter / 2
+    if direction == CC.OFF_NONE or rad <= 0.0: return lines  #
+    rslt = []
+    work = []
+    for pnt, found in enumerate(lines):
+        closed = [line for line in found if len(line) > 3 and line[0] == line[-1]]
+        rslt.append(found if len(closed) < len(found) else [])
+        if len(closed) == len(found): work.append((pnt, closed))  #
+    dist = rad if direction == CC.OFF_OUTSIDE else -rad
+    pocket = direction == CC.OFF_POCKET and stepover > 0.0
+    
+    if len(objects) > 0 and _resized(group, objects[0], dist, tolerance) is not None:
+        while len(work) > 0:
+            rings = [(pnt, _resized(group, objects[pnt], dist, tolerance)) for pnt, closed in work]
+            for pnt, found in rings: rslt[pnt].extend(found)  #
+            work = [(pnt, found) for pnt, found in rings if pocket and len(found) > 0]
+            dist -= stepover
+        return rslt
+    
+    ring, sizes = _packed_rings([line for pnt, closed in work for line in closed])
+    owner = np.repeat(np.array([pnt for pnt, closed in work], dtype=int),
+                      [len(closed) for pnt, closed in work])
+    step = dist
+    while len(sizes) > 0:
+        ring, sizes, ids = _offset_packed(ring, sizes, np.full(len(sizes), step), tolerance)
+        owner = owner[ids]
+        for pnt, found in zip(owner.tolist(), _ring_lists(ring, sizes, np.arange(len(sizes)),
+                                                           len(sizes))):
+            rslt[pnt].extend(found)
+        if not pocket: break  #
+        step = -stepover
+    return rslt
+
+def shape_offsets(group, obj, diameter, direction=CC.OFF_NONE, stepover=0.0,
+                  tolerance=0.01):
+    # the polylines a tool of diameter follows to cut a shape: its outline
+    # for OFF_NONE and for open shapes, else the inside or outside offset;
+    # pockets add clearing rings every stepover inside the inside offset,
+    # each ring offset from the one before
+    return bulk_offsets(group, [obj], diameter, direction, stepover, tolerance)[0]
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+'''
+CarbideProfile - opt-in timing of CarbideClass and the modules built on
+it.
+
+    with CarbideProfile.profiled() as prof:
+        cnc = CC.CNC('drawing.c2d')
+        cnc.mirror().save('mirrored.c2d')
+    print(prof.report())
+    prof.save_trace('mirrored.json')
+
+A profiler keeps calls, inclusive and self time and the longest call of
+every wrapped method and function (as_dict, report), and with trace=True
+a timeline of the calls that chrome://tracing or Perfetto can show.
+'''
+
+import os
+import json
+import time
+import types
+import inspect
+import functools
+import importlib
+import threading
+import contextlib
+
+import CarbideClass as CC
+
+# enable_profiling() swaps timing wrappers in for the methods of CNC and
+# the CC_Object classes and for the module functions in
+# PROFILED_FUNCTIONS, by module; once the last profiler is disabled the
+# originals go back, so nothing is paid while profiling is off.  Times
+# are kept inclusive ('total') and less time spent in other wrapped calls
+# ('self'), so json parsing shows up as the self time of CNC.loads.
+
+PROFILED_FUNCTIONS = {
+    'CarbideClass': ('write_c2d', 'tight', 'bulk_extents', 'object_extents',
+                     'shape_measures', 'flatten_shape', 'flatten_shapes',
+                     'transform_points', 'convert_285to286', 'curve_285to286',
+                     'polygon_285to286'),
+    'CarbideOffset': ('offset_rings', 'bulk_offsets'),
+    'CarbideNest': ('pack_rects', 'nest_drawings')}
+
+class profiler:
+    def __init__(self, trace=False, limit=1000000):
+        self.stats = {}                 # name -> [calls, total, self, max]
+        self.events = [] if trace else None
+        self.limit = limit
+        self.start = time.perf_counter()
+    
+    def record(self, name, start, elapsed, inner):
+        entry = self.stats.get(name)
+        if entry is None: entry = self.stats[name] = [0, 0.0, 0.0, 0.0]  #
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] += elapsed - inner
+        if elapsed > entry[3]: entry[3] = elapsed  #
+        if self.events is not None and len(self.events) < self.limit:
+            self.events.append((name, start, elapsed, threading.get_ident()))
+    
+    def as_dict(self):
+        rslt = {}
+        for name, (calls, total, own, most) in self.stats.items():
+            rslt[name] = {'calls': calls, 'total': total, 'self': own,
+                          'mean': total / calls, 'max': most}
+        return rslt
+    
+    def report(self, count=20):
+        rslt = ['%-32s %9s %10s %10s' % ('function', 'calls', 'total', 'self')]
+        ranked = sorted(self.stats.items(), key=lambda item: -item[1][2])
+        for name, (calls, total, own, most) in ranked[:count]:
+            rslt.append('%-32s %9d %9.4fs %9.4fs' % (name, calls, total, own))
+        return '\n'.join(rslt)
+    
+    def chrome_trace(self):
+        # the trace events in Chrome's trace event format (chrome://tracing
+        # or Perfetto); needs a profiler made with trace=True
+        pid = os.getpid()
+        events = []
+        for name, start, elapsed, tid in self.events or []:
+            events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': (start - self.start) * 1e6,
+                           'dur': elapsed * 1e6})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+    
+    def save_trace(self, filename):
+        with open(filename, 'w') as fout:
+            json.dump(self.chrome_trace(), fout)
+
+_profilers = []
+_profiled = {}                  # (module or class, attribute) -> original
+_profstack = threading.local()
+
+def _timed(name, func):
+    clock = time.perf_counter
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_profstack, 'inner', None)
+        if stack is None: stack = _profstack.inner = []  #
+        stack.append(0.0)
+        start = clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = clock() - start
+            inner = stack.pop()
+            if len(stack) > 0: stack[-1] += elapsed  #
+            for prof in _profilers:
+                prof.record(name, start, elapsed, inner)
+    return wrapper
+
+def _profile_targets():
+    rslt = []
+    for modname, names in PROFILED_FUNCTIONS.items():
+        module = importlib.import_module(modname)
+        rslt.extend((module, name, name) for name in names)
+    classes = [CC.CNC, CC.CC_Object] + CC.CC_Object.__subclasses__()
+    for cls in classes:
+        for attr, value in cls.__dict__.items():
+            if (isinstance(value, types.FunctionType) and
+                not inspect.isgeneratorfunction(value)):
+                rslt.append((cls, attr, '%s.%s' % (cls.__name__, attr)))
+    return rslt
+
+def enable_profiling(trace=False):
+    # starts and returns a profiler; several may run at once
+    if len(_profiled) == 0:
+        for owner, attr, name in _profile_targets():
+            _profiled[(owner, attr)] = owner.__dict__[attr]
+            setattr(owner, attr, _timed(name, owner.__dict__[attr]))
+    prof = profiler(trace)
+    _profilers.append(prof)
+    return prof
+
+def disable_profiling(prof=None):
+    # stops prof (default: all profilers), unwrapping when none are left
+    if prof is None:
+        del _profilers[:]
+    elif prof in _profilers:
+        _profilers.remove(prof)
+    if len(_profilers) == 0:
+        for (owner, attr), func in _profiled.items():
+            setattr(owner, attr, func)
+        _profiled.clear()
+
+@contextlib.contextmanager
+def profiled(trace=True):
+    # with profiled() as prof: ... then prof.as_dict() or prof.save_trace()
+    prof = enable_profiling(trace)
+    try:
+        yield prof
+    finally:
+        disable_profiling(prof)
@@ -0,0 +1,851 @@
+# -*- coding: utf-8 -*-
+
+'''
+Checks that the fast paths of CarbideClass give what the plain ones do,
+against the drawings themselves or a straightforward reference written
+out here.  Run with pytest from the project folder.
+'''
+
+import os
+import io
+import json
+import math
+import random
+
+import pytest
+
+import CarbideClass as CC
+import CarbideOffset
+
+DRAWING = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'DinoStrip2.c2d')
+
+def written(cnc):
+    fout = io.StringIO()
+    cnc.write(fout)
+    return fout.getvalue()
+
+def source_text():
+    with open(DRAWING, 'r') as fin:
+        return fin.read()
+
+# --------------------------------------------------------------------
+# Array-backed curves
+
+@pytest.mark.parametrize('kwargs', [{}, {'arrays': True},
+                                    {'arrays': True, 'compact': True}])
+def test_round_trip_is_byte_identical(kwargs):
+    assert written(CC.CNC(DRAWING, **kwargs)) == source_text()
+
+def test_unpacked_curves_write_the_same():
+    cnc = CC.CNC(DRAWING, arrays=True)
+    cnc.unpack_curves()
+    assert written(cnc) == source_text()
+
+def counted(monkeypatch, name):
+    # calls made to the CarbideClass function name
+    calls = []
+    func = getattr(CC, name)
+    def wrapper(*args):
+        calls.append(args)
+        return func(*args)
+    monkeypatch.setattr(CC, name, wrapper)
+    return calls
+
+def test_addpoint_on_packed_curve_is_linear(monkeypatch):
+    # a packed curve is converted once to grow, not once per point
+    crv = CC.Curve(arrays=True)
+    crv.pack()
+    packs = counted(monkeypatch, 'pack_points')
+    unpacks = counted(monkeypatch, 'unpack_points')
+    for pnt in range(2000):
+        crv.addpoint(pnt, pnt * 0.5)
+    assert len(packs) == 0 and len(unpacks) == 3      # points, cp1, cp2
+    assert not crv.is_packed() and len(crv.points) == 2000
+    cnc = CC.CNC(arrays=True)
+    cnc.add_object(crv)
+    assert CC.is_array(cnc.getgroup(CC.CC_CURVES)[0]['points'])
+
+# --------------------------------------------------------------------
+# Streaming reader
+
+@pytest.mark.parametrize('kwargs', [{}, {'arrays': True}, {'compact': True}])
+def test_streamed_load_matches_plain(kwargs):
+    streamed = CC.CNC(DRAWING, stream=True, **kwargs)
+    plain = CC.CNC(DRAWING, **kwargs)
+    assert written(streamed) == source_text()
+    assert (streamed.beta, streamed.nextid) == (plain.beta, plain.nextid)
+
+def test_small_chunks_read_the_same():
+    whole = json.loads(source_text())
+    with open(DRAWING, 'r') as fin:
+        found = list(CC.iter_c2d(fin, chunk=7))
+    assert [obj for group, obj in found if group == CC.CC_CURVES] == whole[CC.CC_CURVES]
+    assert [group for group, obj in found].count(CC.CC_VALUES) == 1
+
+def test_iter_objects_picks_groups():
+    found = list(CC.CNC.iter_objects(DRAWING, [CC.CC_CIRCLES]))
+    assert [obj for group, obj in found] == CC.CNC(DRAWING).getgroup(CC.CC_CIRCLES)
+
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.parametrize('txt', ['', 'hello', '[1, 2]', source_text()[:5000]],
+                         ids=['empty', 'text', 'list', 'truncated'])
+def test_bad_drawings_raise(tmp_path, stream, txt):
+    filename = str(tmp_path / 'bad.c2d')
+    with open(filename, 'w') as fout:
+        fout.write(txt)
+    cnc = CC.CNC()
+    before = written(cnc)
+    with pytest.raises(ValueError):
+        cnc.load(filename, stream=stream)
+    assert written(cnc) == before
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_missing_drawing_is_false(tmp_path, stream):
+    cnc = CC.CNC()
+    before = written(cnc)
+    assert cnc.load(str(tmp_path / 'missing.c2d'), stream=stream) is False
+    assert written(cnc) == before and cnc.filename is None
+
+# --------------------------------------------------------------------
+# Sidecar cache
+
+@pytest.fixture
+def imaged(tmp_path):
+    # DinoStrip2 with a background image well past CACHE_TEXT
+    cnc = CC.CNC(DRAWING)
+    cnc.setvalue('BACKGROUND_IMAGE', 'QUJD' * 50000)
+    filename = str(tmp_path / 'imaged.c2d')
+    cnc.save(filename)
+    return filename
+
+@pytest.mark.parametrize('kwargs', [{}, {'arrays': True}, {'compact': True}])
+def test_cache_round_trip(imaged, kwargs):
+    plain = written(CC.CNC(imaged, **kwargs))
+    CC.CNC(imaged, cache=True, **kwargs)
+    with open(imaged + CC.CACHE_SUFFIX, 'rb') as fin:
+        preamble = CC._PREAMBLE.unpack(fin.read(CC._PREAMBLE.size))
+        fin.seek(preamble[1])
+        assert b'QUJDQUJD' not in fin.read(preamble[2])     # not in the header
+    assert CC.read_cache(imaged, kwargs.get('arrays', False)) is not None
+    assert written(CC.CNC(imaged, cache=True, **kwargs)) == plain
+
+def test_cache_checks_its_source(imaged):
+    CC.CNC(imaged, cache=True)
+    info = os.stat(imaged)
+    os.utime(imaged, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+    assert CC.read_cache(imaged) is not None         # touched, same bytes
+    with open(imaged, 'r') as fin:
+        txt = fin.read()
+    with open(imaged, 'w') as fout:
+        fout.write(txt.replace('"Skull Pivot"', '"Skull Pivet"'))
+    os.utime(imaged, ns=(info.st_atime_ns, info.st_mtime_ns + 2 * 10**9))
+    assert CC.read_cache(imaged) is None             # same size, new text
+    assert CC.CNC(imaged, cache=True).gettoolpath('Skull Pivet') is not None
+
+def test_cache_load_sets_groups(imaged):
+    CC.CNC(imaged, cache=True)
+    cnc = CC.CNC(beta='285')
+    assert cnc.load(imaged, cache=True)
+    assert cnc.beta == '286' and CC.CC_PATHLINKS in cnc.cc_uuidgroups
+    assert len(cnc.path_shapes(cnc.gettoolpath('Jaw')['uuid'])) > 0
+
+# --------------------------------------------------------------------
+# Format detection
+
+def saved(cnc, tmp_path, name='saved.c2d'):
+    filename = str(tmp_path / name)
+    cnc.save(filename)
+    return filename
+
+def test_sniffed_beta_matches_detected(tmp_path):
+    old = CC.CNC(beta='285')
+    old.add_object(CC.Circle([5, 5], 2.0, beta='285'))
+    for cnc in (CC.CNC(DRAWING), old):
+        filename = saved(cnc, tmp_path)
+        assert CC.sniff_beta(filename) == CC.detect_beta(cnc.content) == cnc.beta
+
+def test_sniff_stops_short_without_guessing():
+    assert CC.sniff_beta(DRAWING, limit=20) is None    # inside the first circle
+    assert CC.sniff_beta(DRAWING, limit=400) == '286'  # a uuid id was read
+
+def test_sniff_rejects_what_no_beta_allows(tmp_path):
+    with open(str(tmp_path / 'text.c2d'), 'w') as fout:
+        fout.write('not a drawing')
+    assert CC.sniff_beta(str(tmp_path / 'text.c2d')) == 'BAD'
+    mixed = {CC.CC_POLYGONS: [{'id': '{0}'}]}      # a 285 group, 286 ids
+    assert CC.allowed_betas(CC.beta_evidence(mixed)) == []
+    assert CC.detect_beta(mixed) == 'BAD'
+
+# --------------------------------------------------------------------
+# CC_Object mappings
+
+def test_objects_keep_identity():
+    one, two = CC.Circle(), CC.Circle()
+    assert one == one and one != two and dict(one) == dict(two)
+    assert len({one: 1, two: 2}) == 2
+    assert CC.object_hash(one) == CC.object_hash(two)
+    
+    val = CC.Value('WIDTH', 0)
+    assert val and val.json_dict() == {'name': 'WIDTH', 'value': 0}
+    assert val['value'] == 0 and 'name' in val
+
+# --------------------------------------------------------------------
+# Object index
+
+def test_index_finds_every_object():
+    cnc = CC.CNC(DRAWING)
+    for group in cnc.cc_idgroups + cnc.cc_uuidgroups:
+        keys = [CC.objkey(obj) for obj in cnc.getgroup(group)]
+        for pnt, key in enumerate(keys):
+            assert cnc.findobject(group, key) == keys.index(key)
+        assert cnc.findobject(group, 'none such') == -1
+    circle = cnc.getgroup(CC.CC_CIRCLES)[-1]
+    assert cnc.getanyobject(circle['id']) == [CC.CC_CIRCLES, circle]
+    for path in cnc.getgroup(CC.CC_TOOLPATHS):
+        assert cnc.gettoolpath(path['name'].swapcase()) is path
+
+def test_index_follows_adds_and_direct_edits():
+    cnc = CC.CNC(DRAWING)
+    circle = CC.Circle([1, 2], 3.0)
+    cnc.add_object(circle)
+    assert cnc.getobject(CC.CC_CIRCLES, circle.ccid)['radius'] == 3.0
+    
+    circles = cnc.content[CC.CC_CIRCLES] = cnc.getgroup(CC.CC_CIRCLES)[::-1]
+    assert cnc.findobject(CC.CC_CIRCLES, circle.ccid) == 0
+    circles.append(dict(circles[0], id='appended'))
+    assert cnc.findobject(CC.CC_CIRCLES, 'appended') == len(circles) - 1
+    
+    circles[0]['id'] = 'renamed'
+    path = cnc.getgroup(CC.CC_TOOLPATHS)[0]
+    old, path['name'] = path['name'], 'Renamed'
+    cnc.reindex()
+    assert cnc.findobject(CC.CC_CIRCLES, 'renamed') == 0
+    assert cnc.findobject(CC.CC_CIRCLES, circle.ccid) == -1
+    assert cnc.gettoolpath('renamed') is path and cnc.gettoolpath(old) is None
+
+def toolpath_names(cnc):
+    return [path['name'] for path in cnc.getgroup(CC.CC_TOOLPATHS)]
+
+def test_repeated_names_get_the_next_label():
+    cnc = CC.CNC()
+    for name in ['Cut', 'cut', 'CUT', 'Cut_009', 'Cut', 'Pocket 7', 'pocket 7']:
+        cnc.add_object(CC.Toolpath(name=name))
+    assert toolpath_names(cnc) == ['Cut', 'cut_001', 'CUT_002', 'Cut_009', 'Cut_010',
+                                   'Pocket 7', 'pocket 8']
+    assert cnc.unique_name(CC.CC_TOOLPATHS, 'CUT_001') == 'CUT_011'
+    assert cnc.unique_name(CC.CC_TOOLPATHS, 'Other') == 'Other'
+
+def test_unique_names_in_bulk_and_after_direct_edits():
+    cnc = CC.CNC()
+    cnc.add_objects([CC.Toolpath(name='Cut') for pnt in range(3)] + [CC.Toolpath(name='cut_002')])
+    assert toolpath_names(cnc) == ['Cut', 'Cut_001', 'Cut_002', 'cut_003']
+    paths = cnc.getgroup(CC.CC_TOOLPATHS)
+    paths.append(dict(paths[0], name='CUT_050', uuid=cnc.uuids()))
+    cnc.add_object(CC.Toolpath(name='Cut'))
+    assert toolpath_names(cnc)[-1] == 'Cut_051'
+    names = [name.lower() for name in toolpath_names(cnc)]
+    assert len(set(names)) == len(names)
+
+# --------------------------------------------------------------------
+# Extents
+
+@pytest.fixture(scope='module')
+def bench_drawing():
+    import CarbideBench
+    fout = io.StringIO()
+    CarbideBench.make_drawing(shapes=600, points=40, seed=1).write(fout)
+    return fout.getvalue()
+
+def loaded(txt, **kwargs):
+    cnc = CC.CNC(**kwargs)
+    cnc.loads(txt)
+    return cnc
+
+def anchor_box(group, obj):
+    # the extents loop CarbideClass started with: curve anchors only
+    if group != CC.CC_CURVES: return CC.object_extents(group, obj)  #
+    ox, oy = obj['position']
+    xs = [ox + pt[0] for pt in obj['points']]
+    ys = [oy + pt[1] for pt in obj['points']]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def sampled_box(group, obj, steps=50):
+    # curves sampled densely along every segment
+    if group != CC.CC_CURVES: return CC.object_extents(group, obj)  #
+    ox, oy = obj['position']
+    xs, ys = [], []
+    for seg in CC.curve_segments(obj):
+        for pnt in range(steps + 1):
+            tt = pnt / steps
+            xs.append(ox + CC.bezier_point(*[pt[0] for pt in seg], tt))
+            ys.append(oy + CC.bezier_point(*[pt[1] for pt in seg], tt))
+    return (min(xs), min(ys), max(xs), max(ys))
+
+@pytest.mark.parametrize('kwargs', [{}, {'arrays': True}, {'compact': True}])
+def test_bulk_extents_match_scalar_and_sampled(bench_drawing, kwargs):
+    cnc = loaded(bench_drawing, **kwargs)
+    for group in cnc.cc_idgroups:
+        objects = cnc.getgroup(group)
+        for obj, box in zip(objects, CC.bulk_extents(group, objects)):
+            assert box == pytest.approx(CC.object_extents(group, obj), abs=1e-9)
+            assert box == pytest.approx(sampled_box(group, obj), abs=1e-2)
+            anchors = anchor_box(group, obj)
+            assert box[0] <= anchors[0] + 1e-9 and box[1] <= anchors[1] + 1e-9
+            assert box[2] >= anchors[2] - 1e-9 and box[3] >= anchors[3] - 1e-9
+
+def union_box(cnc):
+    boxes = [CC.object_extents(group, obj) for group in cnc.cc_idgroups
+             for obj in cnc.getgroup(group)]
+    boxes = [box for box in boxes if box is not None]
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+def moved(cnc, group, obj, dx):
+    obj = cnc.own_object(group, obj)
+    obj['position'] = [obj['position'][0] + dx, obj['position'][1]]
+    return obj
+
+def test_extents_cache_follows_changes(bench_drawing):
+    cnc = loaded(bench_drawing)
+    first = cnc.extents()
+    assert first == pytest.approx(union_box(cnc), abs=1e-9)
+    assert cnc.extents() is first
+    
+    # a shape moved in place through own_object
+    curves = cnc.getgroup(CC.CC_CURVES)
+    far = max(curves, key=lambda obj: CC.object_extents(CC.CC_CURVES, obj)[2])
+    moved(cnc, CC.CC_CURVES, far, 1000.0)
+    assert cnc.extents()[2] == pytest.approx(first[2] + 1000.0)
+    assert cnc.extents() == pytest.approx(union_box(cnc), abs=1e-9)
+    
+    # a group list replaced by one of the same length
+    second = cnc.extents()
+    circles = [dict(obj) for obj in cnc.getgroup(CC.CC_CIRCLES)]
+    for obj in circles:
+        obj['position'] = [obj['position'][0], obj['position'][1] - 5000.0]
+    cnc.content[CC.CC_CIRCLES] = circles
+    assert cnc.extents()[1] < second[1] - 4000.0
+    assert cnc.extents() == pytest.approx(union_box(cnc), abs=1e-9)
+
+def test_clone_extents_keep_apart(bench_drawing):
+    cnc = loaded(bench_drawing)
+    first = cnc.extents()
+    other = cnc.clone()
+    curves = other.getgroup(CC.CC_CURVES)
+    far = max(curves, key=lambda obj: CC.object_extents(CC.CC_CURVES, obj)[2])
+    moved(other, CC.CC_CURVES, far, 1000.0)
+    assert other.extents()[2] == pytest.approx(first[2] + 1000.0)
+    assert cnc.extents() == first
+    assert cnc.extents() == pytest.approx(union_box(cnc), abs=1e-9)
+
+# --------------------------------------------------------------------
+# Spatial queries
+
+def brute_boxes(cnc):
+    return [(obj, CC.object_extents(group, obj)) for group in cnc.cc_idgroups
+            for obj in cnc.getgroup(group)]
+
+def meets(box, lft, btm, rit, top):
+    return box is not None and box[0] <= rit and box[2] >= lft and box[1] <= top and box[3] >= btm
+
+def test_region_and_nearest_match_brute_force(bench_drawing):
+    cnc = loaded(bench_drawing)
+    boxes = brute_boxes(cnc)
+    lft, btm, rit, top = cnc.extents()
+    wide, high = rit - lft, top - btm
+    for fx, fy, fw in ((0.1, 0.2, 0.05), (0.5, 0.5, 0.3), (-0.2, -0.2, 0.1), (0, 0, 1.5)):
+        region = (lft + fx * wide, btm + fy * high, lft + (fx + fw) * wide, btm + (fy + fw) * high)
+        found = [id(obj) for group, obj in cnc.query_region(*region)]
+        assert sorted(found) == sorted(id(obj) for obj, box in boxes if meets(box, *region))
+    for fx, fy in ((0.3, 0.7), (0.5, 0.5), (2.0, -1.0)):
+        xx, yy = lft + fx * wide, btm + fy * high
+        dists = sorted(CC.box_distance(box, xx, yy) for obj, box in boxes if box is not None)
+        near = cnc.nearest(xx, yy, k=5)
+        assert [dist for group, obj, dist in near] == pytest.approx(dists[:5], abs=1e-9)
+        for group, obj, dist in near:
+            assert CC.box_distance(CC.object_extents(group, obj), xx, yy) == pytest.approx(dist)
+
+def test_spatial_queries_follow_edits(bench_drawing):
+    cnc = loaded(bench_drawing)
+    lft, btm, rit, top = cnc.extents()
+    away = rit - lft + 1000.0
+    assert cnc.query_region(rit + 900, btm, rit + 2 * away, top) == []
+    
+    far = moved(cnc, CC.CC_CURVES, cnc.getgroup(CC.CC_CURVES)[0], away)
+    assert [obj for group, obj in cnc.query_region(rit + 900, btm, rit + 2 * away, top)] == [far]
+    
+    circle = CC.Circle([lft - 50, btm - 50], 1.0)
+    cnc.add_object(circle)
+    (group, obj, dist), = cnc.nearest(lft - 50, btm - 50)
+    assert group == CC.CC_CIRCLES and obj['id'] == circle.ccid and dist == 0
+    
+    cnc.content[CC.CC_CIRCLES] = []
+    assert all(group != CC.CC_CIRCLES for group, obj, dist in cnc.nearest(lft - 50, btm - 50, k=3))
+    assert sorted(id(obj) for group, obj in cnc.query_region(lft, btm, rit, top)) == \
+           sorted(id(obj) for obj, box in brute_boxes(cnc) if meets(box, lft, btm, rit, top))
+
+# --------------------------------------------------------------------
+# Copy-on-write clones
+
+@pytest.mark.parametrize('kwargs', [{}, {'arrays': True}, {'compact': True}])
+def test_clone_edits_stay_in_the_clone(kwargs):
+    cnc = CC.CNC(DRAWING, **kwargs)
+    before = written(cnc)
+    other = cnc.clone()
+    
+    crv = other.own_object(CC.CC_CURVES, other.getgroup(CC.CC_CURVES)[0])
+    crv['points'][0][0] = crv['points'][0][0] + 7.0
+    crv = other.getobject(CC.CC_CURVES, other.getgroup(CC.CC_CURVES)[1]['id'])
+    crv['control_point_1'][0][1] = crv['control_point_1'][0][1] - 3.0
+    path = other.gettoolpath('Skull Pivot')
+    path['speeds']['feedrate'] = path['speeds']['feedrate'] + 100
+    path['tool']['diameter'] = 1.5
+    
+    assert written(cnc) == before
+    assert other.content_hash() != cnc.content_hash()
+    changes = cnc.diff(other)
+    assert len(changes['modified']) == 3
+    assert changes['added'] == changes['removed'] == []
+
+def test_mirror_leaves_the_original():
+    cnc = CC.CNC(DRAWING)
+    before = written(cnc)
+    hashed = cnc.content_hash()
+    twice = cnc.mirror().mirror()
+    assert written(cnc) == before and cnc.content_hash() == hashed
+    assert twice.content_hash() == hashed
+
+@pytest.mark.parametrize('kwargs', [{}, {'arrays': True}, {'compact': True}])
+def test_source_edits_stay_out_of_the_mirror(kwargs):
+    cnc = CC.CNC(DRAWING, **kwargs)
+    mirrored = cnc.mirror()
+    before = written(mirrored)
+    cnc.getgroup(CC.CC_TOOLPATHS)[0]['name'] = 'X'
+    cnc.getgroup(CC.CC_VALUES)['WIDTH'] = 1
+    crv = cnc.getgroup(CC.CC_CURVES)[0]
+    crv['points'][0][0] = crv['points'][0][0] + 7.0
+    cnc.getgroup(CC.CC_CIRCLES)[0]['radius'] = 99
+    assert written(mirrored) == before
+
+def same_numbers(old, new):
+    # new matches old, ints where old has ints and floats to rounding
+    if type(old) is int: return type(new) is int and new == old  #
+    if type(old) is float: return new == pytest.approx(old, abs=1e-9)  #
+    if type(old) is list:
+        return len(old) == len(new) and all(map(same_numbers, old, new))
+    if type(old) is dict:
+        return old.keys() == new.keys() and all(same_numbers(old[key], new[key])
+                                                 for key in old)
+    return old == new
+
+@pytest.mark.parametrize('kwargs', [{}, {'arrays': True}, {'compact': True}])
+def test_mirror_keeps_whole_numbers(kwargs):
+    cnc = CC.CNC(DRAWING, **kwargs)
+    once = written(cnc.mirror())
+    assert '.0,' not in once and '.0\n' not in once
+    assert same_numbers(json.loads(source_text()),
+                        json.loads(written(cnc.mirror().mirror())))
+
+# --------------------------------------------------------------------
+# Toolpath links
+
+def test_added_links_keep_their_shape():
+    cnc = CC.CNC(DRAWING)
+    circle = cnc.getgroup(CC.CC_CIRCLES)[0]
+    uupath = cnc.getgroup(CC.CC_TOOLPATHS)[-1]['uuid']
+    cnc.add_object(CC.PathLink(shape=circle, toolpath={'uuid': uupath}))
+    assert circle['id'] in cnc.path_shapes(uupath)
+    
+    other = cnc.getgroup(CC.CC_TOOLPATHS)[0]['uuid']
+    cnc.update_object(CC.PathLink(source={'uuid': circle['id'], 'links': [other]}))
+    assert list(cnc.shape_paths(circle['id'])) == [other]
+    assert circle['id'] not in cnc.path_shapes(uupath)
+    
+    crv = cnc.getgroup(CC.CC_CURVES)[0]
+    cnc.update_object(CC.PathLink(shape=crv, toolpath={'uuid': other}))
+    assert crv['id'] in cnc.path_shapes(other)
+    assert all(link['uuid'] != '?' for link in cnc.getgroup(CC.CC_PATHLINKS))
+
+def test_unlink_clears_repeated_entries():
+    cnc = CC.CNC(DRAWING)
+    links = cnc.getgroup(CC.CC_PATHLINKS)
+    uushape = links[0]['uuid']
+    uupath = links[0]['links'][0]
+    other = cnc.getgroup(CC.CC_TOOLPATHS)[0]['uuid']
+    kept = list(dict.fromkeys([uu for uu in links[0]['links'] if uu != uupath] + [other]))
+    links.append({'uuid': uushape, 'links': [uupath, other]})
+    links.append({'uuid': uushape, 'links': [uupath]})
+    cnc.reindex()
+    assert uupath in cnc.shape_paths(uushape) and other in cnc.shape_paths(uushape)
+    
+    assert cnc.unlink_shapes(uupath, [uushape]) == 1
+    entries = [link for link in cnc.getgroup(CC.CC_PATHLINKS) if link['uuid'] == uushape]
+    assert all(uupath not in link['links'] for link in entries)
+    cnc.reindex()
+    assert uushape not in cnc.path_shapes(uupath)
+    assert list(cnc.shape_paths(uushape)) == kept
+
+# --------------------------------------------------------------------
+# Tool offsets
+
+def ring_area(ring):
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:])) / 2
+
+def line_gap(pt, line):
+    # distance from pt to the polyline line
+    gap = math.inf
+    for (x0, y0), (x1, y1) in zip(line, line[1:]):
+        dx, dy = x1 - x0, y1 - y0
+        den = dx * dx + dy * dy
+        tt = 0.0 if den <= 0.0 else ((pt[0] - x0) * dx + (pt[1] - y0) * dy) / den
+        tt = min(1.0, max(0.0, tt))
+        gap = min(gap, math.hypot(pt[0] - x0 - dx * tt, pt[1] - y0 - dy * tt))
+    return gap
+
+SQUARE = [(0, 0), (20, 0), (20, 20), (0, 20), (0, 0)]
+ELL = [(0, 0), (20, 0), (20, 10), (10, 10), (10, 20), (0, 20), (0, 0)]
+
+@pytest.mark.parametrize('ring, dist, low, high', [
+    (SQUARE, -2.0, 256.0, 256.0),
+    (SQUARE[::-1], -2.0, 256.0, 256.0),
+    (SQUARE, 2.0, 560 + 4 * math.pi, 560 + 4 * math.pi + 0.15),
+    (ELL, -2.0, 160 - math.pi - 0.04, 160 - math.pi),
+    (ELL, 2.0, 456 + 5 * math.pi, 456 + 5 * math.pi + 0.15)])
+def test_offset_areas(ring, dist, low, high):
+    found = CarbideOffset.offset_ring(ring, dist, 0.01)
+    assert len(found) == 1 and found[0][0] == found[0][-1]
+    assert low - 1e-9 <= abs(ring_area(found[0])) <= high + 1e-9
+
+def test_offsets_vanish_past_the_middle():
+    assert CarbideOffset.offset_ring(ELL, -6.0, 0.01) == []
+    assert CarbideOffset.offset_ring(SQUARE, -10.5, 0.01) == []
+
+def test_bulk_offsets_match_one_by_one(bench_drawing):
+    cnc = loaded(bench_drawing)
+    for group in cnc.cc_idgroups:
+        objects = cnc.getgroup(group)
+        assert CC.flatten_shapes(group, objects) == [CC.flatten_shape(group, obj)
+                                                     for obj in objects]
+    rings = [line for group, obj in cnc.toolpath_shapes(cnc.getgroup(CC.CC_TOOLPATHS)[0])
+             for line in CC.flatten_shape(group, obj) if line[0] == line[-1]]
+    dists = [(-1.5, 0.0, 2.0)[pnt % 3] for pnt in range(len(rings))]
+    one = [CarbideOffset.offset_ring(ring, dist, 0.01) for ring, dist in zip(rings, dists)]
+    assert CarbideOffset.offset_rings(rings, dists, 0.01) == one
+    for path in cnc.getgroup(CC.CC_TOOLPATHS):
+        direction = path['ofset_dir']
+        stepover = path['stepover'] if direction == CC.OFF_POCKET else 0.0
+        for group, obj, lines in cnc.toolpath_offsets(path)[::10]:
+            assert lines == CarbideOffset.shape_offsets(
+                group, obj, path['tool']['diameter'], direction, stepover, 0.01)
+
+def test_offsets_keep_their_distance(bench_drawing):
+    # each ring lies a level's distance from its outline, within the
+    # tolerance of the arcs it picked up on the way, and pockets go
+    # down level by level without gaps
+    cnc = loaded(bench_drawing)
+    for path in cnc.getgroup(CC.CC_TOOLPATHS):
+        rad = path['tool']['diameter'] / 2
+        step = path['stepover'] if path['ofset_dir'] == CC.OFF_POCKET else 0.0
+        for group, obj, lines in cnc.toolpath_offsets(path)[::20]:
+            outline = CC.flatten_shape(group, obj)[0]
+            slack = 0.011 if group == CC.CC_CIRCLES else 1e-6
+            levels = set()
+            for ring in lines:
+                gaps = [line_gap(pt, outline) for pt in ring[::5]]
+                level = round((min(gaps) - rad) / step) if step else 0
+                levels.add(level)
+                want = rad + level * step
+                assert want - slack <= min(gaps)
+                assert max(gaps) <= want + slack + 0.02 * (level + 1)
+            assert levels == set(range(len(levels)))
+
+# --------------------------------------------------------------------
+# Curve simplification
+
+def within(old, new, tolerance):
+    # points along each segment of old are near new's flattened outline
+    line, = CC.flatten_shape(CC.CC_CURVES, new, 0.001)
+    ox, oy = old['position']
+    for seg in CC.curve_segments(old):
+        for tt in (0.0, 0.25, 0.5, 0.75):
+            pt = (ox + CC.bezier_point(*[pt[0] for pt in seg], tt),
+                  oy + CC.bezier_point(*[pt[1] for pt in seg], tt))
+            if line_gap(pt, line) > tolerance: return False  #
+    return True
+
+def middle(aa, bb):
+    return [(aa[0] + bb[0]) / 2, (aa[1] + bb[1]) / 2]
+
+def halved(obj):
+    # obj with every segment split at its middle, by de Casteljau
+    pts, cp1, cp2 = [obj['points'][0]], [obj['control_point_1'][0]], []
+    ptype = list(obj['point_type'][:1])
+    for pnt, (p0, p1, p2, p3) in enumerate(CC.curve_segments(obj)):
+        l1, mm, r2 = middle(p0, p1), middle(p1, p2), middle(p2, p3)
+        l2, r1 = middle(l1, mm), middle(mm, r2)
+        if p1 == p0 and p2 == p3: l1, l2, r1, r2 = p0, mm, mm, p3  # stays straight
+        pts += [middle(l2, r1), p3]
+        cp1 += [l2, r2]
+        cp2 += [l1, r1]
+        ptype += [CC.PT_CURVE, obj['point_type'][pnt + 1]]
+    cp2.append(obj['control_point_2'][-1])
+    return dict(obj, points=pts, control_point_1=cp1, control_point_2=cp2, point_type=ptype)
+
+def test_simplify_keeps_polygon_corners():
+    poly = CC.Curve([5, 5], ispoly=True)
+    for pt in [(x, 0) for x in range(5)] + [(4, y * 0.5) for y in range(8)] + [(0, 4), (0, 0)]:
+        poly.addpoint(*pt)
+    old = dict(poly)
+    assert poly.simplify(0.01) == len(old['points']) - 5
+    assert poly.points == [[0, 0], [4, 0], [4, 3.5], [0, 4], [0, 0]]
+    assert poly.pt[-1] == CC.PT_CLOSER and within(old, poly, 0.01)
+
+def test_simplify_merges_a_split_bezier():
+    curve = CC.Curve([0, 0])
+    curve.addpoint(0, 0, 0, 0, 0, 5)
+    curve.addpoint(10, 7.5, 5, 7.5, 15, 7.5)
+    curve.addpoint(20, 0, 20, 5, 20, 0)
+    old = dict(curve)
+    assert curve.simplify(0.01) == 1
+    assert curve.cp2[0] == pytest.approx([0, 10]) and curve.cp1[1] == pytest.approx([20, 10])
+    assert within(old, curve, 0.01)
+    
+    curve.addpoint(30, 10, 25, 5, 30, 10)      # a corner stays
+    assert curve.simplify(0.01) == 0
+
+def test_split_drawing_simplifies_back():
+    cnc = CC.CNC(DRAWING)
+    old = cnc.getgroup(CC.CC_CURVES)
+    split = cnc.clone()
+    split.content[CC.CC_CURVES] = [halved(obj) for obj in old]
+    stats = split.simplify_curves(0.01)
+    new = split.getgroup(CC.CC_CURVES)
+    assert stats == {'curves': len(old), 'changed': len(old),
+                     'points': sum(2 * len(obj['points']) - 1 for obj in old),
+                     'kept': sum(len(obj['points']) for obj in new)}
+    # every split merges back but one, whose handles are both empty
+    assert stats['kept'] == sum(len(obj['points']) for obj in old) + 1
+    assert written(cnc) == source_text()
+    for one, two in zip(old, new):
+        assert within(one, two, 0.01) and within(two, one, 0.01)
+        assert two['point_type'][-1] == CC.PT_CLOSER
+
+# --------------------------------------------------------------------
+# G-code
+
+def circle_job(direction, diameter=2.0):
+    # a circle of radius 10 at (50, 50) cut by one toolpath, in two
+    # passes of 1.5 down to 3
+    cnc = CC.CNC()
+    circle = CC.Circle([50, 50], 10.0)
+    cnc.add_object(circle)
+    cnc.add_object(CC.Toolpath(name='Cut', end_depth=3.0, stepdown=1.5))
+    path = cnc.gettoolpath('Cut')
+    path['ofset_dir'] = direction
+    path['tool']['diameter'] = diameter
+    cnc.link_shapes(path['uuid'], [circle.ccid])
+    return cnc
+
+def moves(lines, cmd):
+    # the {axis: value} of each cmd line
+    return [{word[0]: float(word[1:]) for word in line.split()[1:]}
+            for line in lines if line.split()[0] == cmd]
+
+def test_gcode_cuts_on_the_offset():
+    import CarbideGcode
+    lines = list(CarbideGcode.gcode_lines(circle_job(CC.OFF_OUTSIDE)))
+    assert lines[1:3] == ['G90 G17 G21', 'G0 Z12'] and lines[-2:] == ['M5', 'M30']
+    cuts = moves(lines, 'G1')
+    assert set(move['Z'] for move in cuts if 'Z' in move) == {-1.5, -3.0}
+    for move in cuts:
+        if 'X' in move:
+            assert math.hypot(move['X'] - 50, move['Y'] - 50) == pytest.approx(11, abs=2e-4)
+    assert len([move for move in moves(lines, 'G0') if 'X' in move]) == 1  # stays down
+
+def test_gcode_streams_without_keeping_offsets():
+    import CarbideGcode
+    cnc = CC.CNC(DRAWING)
+    fout = io.StringIO()
+    count = CarbideGcode.write_gcode(cnc, fout, block=100)
+    assert len(cnc._offsets) == 0
+    assert count == len(fout.getvalue().splitlines())
+    kept = io.StringIO()
+    CarbideGcode.write_gcode(cnc, kept, cache=True)
+    assert len(cnc._offsets) > 0 and kept.getvalue() == fout.getvalue()
+
+def test_gcode_picks_toolpaths():
+    import CarbideGcode
+    lines = list(CarbideGcode.gcode_lines(CC.CNC(DRAWING), toolpaths=['JAW']))
+    assert [line for line in lines if line.startswith('(') and line != lines[0]] == ['(Jaw)']
+
+# --------------------------------------------------------------------
+# Machining estimates
+
+@pytest.mark.parametrize('direction, radius', [(CC.OFF_OUTSIDE, 11), (CC.OFF_INSIDE, 9),
+                                               (CC.OFF_NONE, 10)])
+def test_machining_time_of_a_circle(direction, radius):
+    cnc = circle_job(direction)
+    speeds = cnc.gettoolpath('Cut')['speeds']
+    est = cnc.machining_time()
+    path, = est['toolpaths']
+    assert path['passes'] == 2 and path['shapes'] == 1
+    assert path['length'] == pytest.approx(2 * math.pi * radius)
+    assert path['cut_length'] == pytest.approx(4 * math.pi * radius) == est['length']
+    assert path['cut'] == pytest.approx(path['cut_length'] / speeds['feedrate'])
+    assert path['plunge'] == pytest.approx(3.0 / speeds['plungerate'])
+    assert path['rapid'] == pytest.approx(2 * 12 / CC.RAPID_RATE)
+    assert est['minutes'] == pytest.approx(path['cut'] + path['plunge'] + path['rapid'])
+
+def test_machining_time_clears_pockets_and_skips_disabled():
+    cnc = circle_job(CC.OFF_POCKET)
+    path = cnc.gettoolpath('Cut')
+    est = cnc.machining_time()['toolpaths'][0]
+    assert est['length'] == pytest.approx(2 * math.pi * 9 + math.pi * 100 / path['stepover'])
+    path['enabled'] = False
+    est = cnc.machining_time()
+    assert est['toolpaths'][0]['minutes'] > 0 and est['minutes'] == est['length'] == 0
+
+# --------------------------------------------------------------------
+# Beta 285 conversion
+
+def beta285(names):
+    # circles 1, 2, ... each cut by a toolpath of the matching name
+    cnc = CC.CNC(beta='285')
+    path = dict(CC.CNC(DRAWING).getgroup(CC.CC_TOOLPATHS)[0])
+    del path['uuid']
+    cnc.content[CC.CC_CIRCLES] = []
+    cnc.content[CC.CC_TOOLPATHS] = []
+    for pnt, name in enumerate(names):
+        cnc.content[CC.CC_CIRCLES].append({'id': pnt + 1, 'position': [pnt * 10, 0],
+                                           'radius': 2})
+        cnc.content[CC.CC_TOOLPATHS].append(dict(path, name=name, contours=[pnt + 1]))
+    return cnc
+
+def test_seeded_conversion_with_repeated_names():
+    src = beta285(['Pocket', 'pocket', 'Profile'])
+    one = CC.convert_285to286(src, uuids=1)
+    two = CC.convert_285to286(src, uuids=1)
+    assert written(one) == written(two)
+    paths = [path['uuid'] for path in one.getgroup(CC.CC_TOOLPATHS)]
+    assert len(set(paths)) == 3
+    circles = [obj['id'] for obj in one.getgroup(CC.CC_CIRCLES)]
+    for uupath, uushape in zip(paths, circles):
+        assert list(one.path_shapes(uupath)) == [uushape]
+
+# --------------------------------------------------------------------
+# Nesting
+
+def test_packed_boxes_stay_apart_and_on_the_sheet():
+    import CarbideNest
+    rnd = random.Random(5)
+    sizes = [(rnd.uniform(5, 60), rnd.uniform(5, 40)) for pnt in range(300)]
+    for turns in (False, True):
+        places = CarbideNest.pack_rects(sizes, 200, 150, turns)
+        boxes = {}
+        for (wid, hgt), (sheet, xx, yy, turned) in zip(sizes, places):
+            assert turns or not turned
+            if turned: wid, hgt = hgt, wid  #
+            assert xx >= 0 and yy >= 0 and xx + wid <= 200 + 1e-9 and yy + hgt <= 150 + 1e-9
+            boxes.setdefault(sheet, []).append((xx, yy, xx + wid, yy + hgt))
+        assert sorted(boxes) == list(range(len(boxes)))
+        for sheet in boxes.values():
+            for pnt, one in enumerate(sheet):
+                for two in sheet[:pnt]:
+                    assert (one[2] <= two[0] + 1e-9 or two[2] <= one[0] + 1e-9 or
+                            one[3] <= two[1] + 1e-9 or two[3] <= one[1] + 1e-9)
+
+def test_pack_refuses_a_box_bigger_than_the_sheet():
+    import CarbideNest
+    with pytest.raises(ValueError):
+        CarbideNest.pack_rects([(10, 10), (30, 10)], 20, 20, turns=True)
+    assert CarbideNest.pack_rects([(10, 30)], 40, 20, turns=True) == [[0, 0, 0, True]]
+
+def test_nested_circles_keep_spacing_and_margin():
+    import CarbideNest
+    sheets = CarbideNest.nest_drawings([circle_job(CC.OFF_OUTSIDE)] * 300, 340, 280,
+                                       spacing=2, margin=5)
+    assert sum(len(cnc.getgroup(CC.CC_CIRCLES)) for cnc in sheets) == 300
+    for cnc in sheets:
+        boxes = [CC.object_extents(CC.CC_CIRCLES, obj) for obj in cnc.getgroup(CC.CC_CIRCLES)]
+        for pnt, box in enumerate(boxes):
+            assert box[0] >= 5 - 1e-9 and box[1] >= 5 - 1e-9
+            assert box[2] <= 335 + 1e-9 and box[3] <= 275 + 1e-9
+            for other in boxes[:pnt]:
+                assert max(other[0] - box[2], box[0] - other[2],
+                           other[1] - box[3], box[1] - other[3]) >= 2 - 1e-9
+        path, = cnc.getgroup(CC.CC_TOOLPATHS)
+        assert sorted(cnc.path_shapes(path['uuid'])) == sorted(obj['id'] for obj in cnc.getgroup(CC.CC_CIRCLES))
+
+def test_nested_drawings_keep_their_toolpaths():
+    import CarbideNest
+    src = CC.CNC(DRAWING)
+    sheets = CarbideNest.nest_drawings([src] * 12, 600, 400, spacing=3, margin=10,
+                                       turns=True, hulls=True)
+    shapes = len(src.object_boxes())
+    assert sum(len(cnc.object_boxes()) for cnc in sheets) == 12 * shapes
+    cuts = {path['name']: len(src.path_shapes(path['uuid'])) for path in src.getgroup(CC.CC_TOOLPATHS)}
+    for cnc in sheets:
+        copies = len(cnc.object_boxes()) // shapes
+        lft, btm, rit, top = cnc.extents()
+        assert lft >= 10 - 1e-6 and btm >= 10 - 1e-6 and rit <= 590 + 1e-6 and top <= 390 + 1e-6
+        for path in cnc.getgroup(CC.CC_TOOLPATHS):
+            assert len(cnc.path_shapes(path['uuid'])) == copies * cuts[path['name']]
+
+# --------------------------------------------------------------------
+# Profiling
+
+def test_profile_splits_self_time():
+    import CarbideProfile
+    with CarbideProfile.profiled() as prof:
+        CC.CNC(DRAWING)
+    stats = prof.as_dict()
+    assert stats['CNC.__init__']['calls'] == 1 and stats['CNC.loads']['calls'] == 1
+    for entry in stats.values():
+        assert 0 <= entry['self'] <= entry['total'] + 1e-9
+        assert entry['mean'] == pytest.approx(entry['total'] / entry['calls'])
+        assert entry['max'] <= entry['total'] + 1e-9
+    # one outermost call: the self times add up to its total
+    assert sum(entry['self'] for entry in stats.values()) == \
+           pytest.approx(stats['CNC.__init__']['total'])
+
+def test_profile_trace_nests_calls(tmp_path):
+    import CarbideProfile
+    with CarbideProfile.profiled() as prof:
+        CC.CNC(DRAWING)
+    events = prof.chrome_trace()['traceEvents']
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+    stats = prof.as_dict()
+    for name in stats:
+        assert len([event for event in events if event['name'] == name]) == stats[name]['calls']
+    outer, = [event for event in events if event['name'] == 'CNC.__init__']
+    for event in events:
+        assert outer['ts'] <= event['ts'] and event['ts'] + event['dur'] <= outer['ts'] + outer['dur'] + 1e-3
+    prof.save_trace(str(tmp_path / 'trace.json'))
+    with open(str(tmp_path / 'trace.json')) as fin:
+        assert json.load(fin) == json.loads(json.dumps(prof.chrome_trace()))
+
+def test_profiling_puts_the_originals_back():
+    import CarbideProfile
+    loads, extents = CC.CNC.__dict__['loads'], CC.bulk_extents
+    one = CarbideProfile.enable_profiling()
+    two = CarbideProfile.enable_profiling()
+    try:
+        assert CC.CNC.__dict__['loads'] is not loads and CC.bulk_extents is not extents
+        CarbideProfile.disable_profiling(one)
+        assert CC.bulk_extents is not extents
+        CC.CNC(DRAWING)
+        assert 'CNC.loads' in two.as_dict() and one.as_dict() == {}
+    finally:
+        CarbideProfile.disable_profiling()
+    assert CC.CNC.__dict__['loads'] is loads and CC.bulk_extents is extents
+
+# --------------------------------------------------------------------
+# CarbideBatch
+
+def test_batch_output_outside_source(tmp_path):
+    import CarbideBatch
+    for dst in (tmp_path, tmp_path / 'out', tmp_path / 'out' / '..' / 'deeper'):
+        with pytest.raises(ValueError):
+            CarbideBatch.convert_tree(str(tmp_path), str(dst))
+    assert CarbideBatch.convert_tree(str(tmp_path / 'in'), str(tmp_path / 'in2')) == []